@@ -85,7 +85,7 @@ class ManufacturerProfileSerializer(serializers.ModelSerializer):
 
             # Example structure for pricing_factors within capabilities:
             # {
-            #   "cnc": true, "materials_supported": ["Al-6061"],
+            #   "cnc": true, "cnc_axes": 3, "materials_supported": ["Al-6061"],
             #   "pricing_factors": {
             #     "material_properties": { "Al-6061": {"density_g_cm3": 2.7, "cost_usd_kg": 5.0} },
             #     "machining": { "base_time_hours": 0.5, "time_multiplier_complexity": 2.0 },
@@ -160,6 +160,12 @@ class ManufacturerProfileSerializer(serializers.ModelSerializer):
             if not all(isinstance(dim, (int, float)) and dim >= 0 for dim in max_size_mm):
                 raise serializers.ValidationError("All dimensions in `max_size_mm` must be non-negative numbers.")
 
+        # Validate 'cnc_axes' (number of simultaneous machine axes, matched against designs needing 5-axis)
+        cnc_axes = value.get("cnc_axes")
+        if cnc_axes is not None: # Optional part of capabilities
+            if not isinstance(cnc_axes, int) or cnc_axes not in (3, 4, 5):
+                raise serializers.ValidationError("`cnc_axes` must be 3, 4 or 5.")
+
         # Note: The example structure for pricing_factors is already documented in comments above.
         # Actual enforcement of pricing_factors structure can be added here if strictness is desired now,
         # or deferred until manufacturers actively use it. For now, the example comment serves as guidance.
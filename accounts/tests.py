@@ -536,3 +536,18 @@ class ManufacturerAPITests(APITestCase):
         response = self.client.put(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("`max_size_mm` must be a list of three numbers", response.data['capabilities'][0])
+
+    def test_update_profile_invalid_cnc_axes(self):
+        self._login_user(self.manufacturer_user_data['email'], self.manufacturer_user_data['password'])
+        url = reverse('manufacturer_profile_update')
+        capabilities_invalid_axes = {
+            "materials_supported": ["PLA"], "max_size_mm": [100, 100, 100], "cnc": True, "cnc_axes": 2,
+             "pricing_factors": { # Valid pricing to isolate cnc_axes error
+                "material_properties": {"PLA": {"density_g_cm3": 1.25, "cost_usd_kg": 20.0}},
+                "machining": {"base_time_cost_unit": 10.0, "time_multiplier_complexity_cost_unit": 50.0}
+            }
+        }
+        data = {"capabilities": capabilities_invalid_axes}
+        response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("`cnc_axes` must be 3, 4 or 5.", response.data['capabilities'][0])
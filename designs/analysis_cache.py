@@ -0,0 +1,136 @@
+"""
+Content-addressed cache for CAD analysis results.
+
+Entries are keyed by a content digest of the uploaded file and by the analysis engine
+version, so a re-upload of the same part under a new S3 key reuses the stored
+geometric_data without downloading or parsing it again. Bumping the engine version
+(designs.tasks.ANALYSIS_ENGINE_VERSION) invalidates every entry at once.
+
+Hit/miss counters live in Django's cache framework (shared across workers when a
+shared backend such as Redis is configured). Retention is bounded by age and by a
+maximum entry count, evicting the least recently used entries first.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AnalysisCacheEntry
+
+logger = logging.getLogger(__name__)
+
+HITS_COUNTER_KEY = "designs:analysis_cache:hits"
+MISSES_COUNTER_KEY = "designs:analysis_cache:misses"
+
+HASH_READ_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def digest_from_s3_head(head_response):
+    """
+    Derives a content digest from an S3 head_object response, or returns None.
+    Prefers the SHA-256 checksum (when the object was uploaded with one) over the ETag.
+    A single-part upload's ETag is the MD5 of the content; multipart ETags ('<md5>-<parts>')
+    are still deterministic for the same bytes and part size.
+    """
+    if not isinstance(head_response, dict):
+        return None
+    checksum = head_response.get('ChecksumSHA256')
+    if isinstance(checksum, str) and checksum:
+        return f"sha256-b64:{checksum}"
+    etag = head_response.get('ETag')
+    if isinstance(etag, str):
+        etag = etag.strip('"')
+        if etag:
+            return f"s3-etag:{etag}"
+    return None
+
+
+def sha256_file_digest(file_path):
+    """Computes 'sha256:<hex>' of a local file, reading it in bounded chunks."""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_READ_CHUNK_BYTES), b''):
+            sha.update(block)
+    return f"sha256:{sha.hexdigest()}"
+
+
+def _increment_counter(key):
+    # cache.add is a no-op if the key exists, so concurrent workers don't reset the counter.
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError: # Evicted between add and incr
+        cache.set(key, 1, timeout=None)
+
+
+def get_cache_stats():
+    """Returns {'hits': int, 'misses': int} for the analysis cache."""
+    return {
+        "hits": cache.get(HITS_COUNTER_KEY, 0),
+        "misses": cache.get(MISSES_COUNTER_KEY, 0),
+    }
+
+
+def get_cached_analysis(content_digest, engine_version):
+    """
+    Returns cached geometric_data for (content_digest, engine_version), or None.
+    Records a hit or miss and refreshes the entry's LRU timestamp on a hit.
+    """
+    if not content_digest:
+        return None
+    entry = AnalysisCacheEntry.objects.filter(
+        content_digest=content_digest, engine_version=engine_version
+    ).first()
+    if entry is None:
+        _increment_counter(MISSES_COUNTER_KEY)
+        return None
+
+    AnalysisCacheEntry.objects.filter(pk=entry.pk).update(
+        hit_count=F('hit_count') + 1, last_used_at=timezone.now()
+    )
+    _increment_counter(HITS_COUNTER_KEY)
+    logger.info(f"Analysis cache hit for {content_digest} (engine v{engine_version}).")
+    return entry.geometric_data
+
+
+def store_analysis(content_digest, engine_version, geometric_data):
+    """Stores a successful analysis result and applies the retention policy."""
+    if not content_digest:
+        return
+    try:
+        AnalysisCacheEntry.objects.update_or_create(
+            content_digest=content_digest, engine_version=engine_version,
+            defaults={"geometric_data": geometric_data, "last_used_at": timezone.now()},
+        )
+    except IntegrityError: # Another worker stored the same key concurrently
+        logger.info(f"Analysis cache entry for {content_digest} was stored concurrently.")
+    prune_analysis_cache()
+
+
+def prune_analysis_cache():
+    """
+    Enforces the retention policy: drops entries unused for CAD_ANALYSIS_CACHE_MAX_AGE_DAYS,
+    then evicts the least recently used entries above CAD_ANALYSIS_CACHE_MAX_ENTRIES.
+    Returns the number of entries deleted.
+    """
+    max_age_days = getattr(settings, 'CAD_ANALYSIS_CACHE_MAX_AGE_DAYS', 90)
+    max_entries = getattr(settings, 'CAD_ANALYSIS_CACHE_MAX_ENTRIES', 10000)
+
+    deleted, _ = AnalysisCacheEntry.objects.filter(
+        last_used_at__lt=timezone.now() - timedelta(days=max_age_days)
+    ).delete()
+
+    overflow_ids = list(
+        AnalysisCacheEntry.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_entries:]
+    )
+    if overflow_ids:
+        evicted, _ = AnalysisCacheEntry.objects.filter(pk__in=overflow_ids).delete()
+        deleted += evicted
+    if deleted:
+        logger.info(f"Analysis cache: pruned {deleted} entries.")
+    return deleted
@@ -0,0 +1,137 @@
+"""
+Isolated execution of CAD parsing/analysis jobs.
+
+Each job runs in its own short-lived child process with a wall-clock timeout and an
+address-space ceiling (RLIMIT_AS), so a pathological mesh cannot hang or bloat the
+Celery worker itself. The number of concurrently running job processes per worker is
+bounded by a semaphore (the "pool" size). A timed-out job's process is killed, and
+its memory goes away with it; the parent never blocks beyond the timeout.
+
+Job processes are started through billiard (Celery's fork of multiprocessing): the prefork
+pool runs tasks in daemonic processes, and multiprocessing refuses to start children from
+those, while billiard does not.
+"""
+import logging
+import os
+import signal
+import threading
+import time
+
+import billiard
+from django.conf import settings
+
+try:
+    import resource # POSIX only
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisJobError(RuntimeError):
+    """Base class for jobs that were killed or died rather than failing normally."""
+
+
+class AnalysisJobTimeout(AnalysisJobError):
+    pass
+
+
+class AnalysisJobMemoryExceeded(AnalysisJobError):
+    pass
+
+
+class AnalysisJobCrashed(AnalysisJobError):
+    pass
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _get_slots():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(getattr(settings, 'CAD_ANALYSIS_POOL_SIZE', 2))
+        return _slots
+
+
+def _apply_memory_limit(limit_bytes):
+    if limit_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+
+def _job_entry(conn, limit_bytes, func, args, kwargs):
+    """Runs in the child process: applies limits, runs the job and sends back (kind, payload)."""
+    try:
+        _apply_memory_limit(limit_bytes)
+        outcome = ('ok', func(*args, **kwargs))
+    except MemoryError:
+        outcome = ('memory', None)
+    except Exception as e:
+        outcome = ('error', e)
+    try:
+        conn.send(outcome)
+    except Exception as send_exc: # Unpicklable result or exception
+        conn.send(('error', RuntimeError(f"{type(outcome[1]).__name__}: {outcome[1]} ({send_exc})")))
+    finally:
+        conn.close()
+
+
+def _kill(process):
+    # billiard's Process has no kill(), and terminate() sends SIGTERM, which the job inherits
+    # the worker's handler for.
+    if hasattr(signal, 'SIGKILL'):
+        os.kill(process.pid, signal.SIGKILL)
+    else:
+        process.terminate()
+
+
+def run_analysis_job(func, *args, timeout=None, memory_limit_mb=None, **kwargs):
+    """
+    Runs func(*args, **kwargs) in a child process and returns its result.
+    Exceptions raised by func (e.g. ValueError for a corrupt file) are re-raised in the caller.
+    Raises AnalysisJobTimeout, AnalysisJobMemoryExceeded or AnalysisJobCrashed (all RuntimeError)
+    if the job is killed or dies. Defaults come from CAD_ANALYSIS_JOB_TIMEOUT_SECONDS and
+    CAD_ANALYSIS_JOB_MEMORY_LIMIT_MB; a falsy value disables that limit.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'CAD_ANALYSIS_JOB_TIMEOUT_SECONDS', 600)
+    if memory_limit_mb is None:
+        memory_limit_mb = getattr(settings, 'CAD_ANALYSIS_JOB_MEMORY_LIMIT_MB', 4096)
+    limit_bytes = int(memory_limit_mb) * 1024 * 1024 if memory_limit_mb else None
+    job_name = getattr(func, '__name__', repr(func))
+
+    with _get_slots():
+        ctx = billiard.get_context()
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(
+            target=_job_entry, args=(child_conn, limit_bytes, func, args, kwargs),
+            name=f"cad-analysis-{job_name}", daemon=True
+        )
+        started_at = time.monotonic()
+        process.start()
+        child_conn.close() # Only the child writes; lets recv() see EOF if it dies
+
+        try:
+            if not parent_conn.poll(timeout or None):
+                _kill(process)
+                logger.error(f"Analysis job {job_name} killed after exceeding {timeout}s.")
+                raise AnalysisJobTimeout(f"Analysis exceeded the {timeout}s time limit and was terminated.")
+            try:
+                kind, payload = parent_conn.recv()
+            except EOFError:
+                raise AnalysisJobCrashed(
+                    f"Analysis process exited unexpectedly (exit code {process.exitcode}); "
+                    f"it may have exceeded the {memory_limit_mb} MB memory limit."
+                ) from None
+        finally:
+            parent_conn.close()
+            process.join()
+
+    logger.info(f"Analysis job {job_name} finished in {time.monotonic() - started_at:.2f}s ({kind}).")
+    if kind == 'memory':
+        raise AnalysisJobMemoryExceeded(f"Analysis exceeded the {memory_limit_mb} MB memory limit and was terminated.")
+    if kind == 'error':
+        raise payload
+    return payload
@@ -0,0 +1,240 @@
+"""
+3D convex hull (quickhull) in NumPy, for hull volume and stock/material-removal metrics.
+
+Meshes repeat each vertex in several facets, so points are deduplicated before any hull
+work. For streaming use, each chunk's vertices that lie inside the hull of the mesh's
+oriented_bbox support points (a polytope known to be inside the full hull) are discarded
+with one vectorized test; only the survivors are carried between chunks (and shards), and
+the hull itself is computed once at the end, on deduplicated points. For prismatic parts
+that leaves a handful of points; for finely tessellated round parts it can be most vertices,
+so candidate sets above HULL_MAX_POINTS are decimated (see decimate_hull_points).
+"""
+import math
+from collections import deque
+
+import numpy
+
+from .oriented_bbox import PROJECTION_BLOCK_ROWS
+
+# Relative to the point set's extent; points closer than this to a face are treated as on it.
+RELATIVE_TOLERANCE = 1e-10
+# Quickhull runs in Python per hull vertex, so larger candidate sets (e.g. finely tessellated
+# round parts, where nearly every vertex is on the hull) are decimated first.
+HULL_MAX_POINTS = 8192
+# Decimation keeps one point per cell of a cube map around the points' centre (6 * 36 * 36 cells).
+HULL_CELLS_PER_EDGE = int((HULL_MAX_POINTS / 6) ** 0.5)
+
+
+class ConvexHull:
+    """
+    Convex hull of a point set: vertices (m, 3) and outward-facing triangles (k, 3) of indices
+    into vertices. Degenerate (coplanar, collinear or tiny) inputs give a hull with no faces
+    and zero volume.
+    """
+
+    def __init__(self, vertices, faces):
+        self.vertices = vertices
+        self.faces = faces
+
+    @property
+    def volume(self):
+        if not len(self.faces):
+            return 0.0
+        origin = self.vertices.mean(axis=0)
+        a, b, c = (self.vertices[self.faces[:, i]] - origin for i in range(3))
+        return float(numpy.einsum('ij,ij->i', a, numpy.cross(b, c)).sum() / 6.0)
+
+    def plane_equations(self):
+        """Returns (unit normals (k, 3), offsets (k,)) with normal . x <= offset inside the hull."""
+        a, b, c = (self.vertices[self.faces[:, i]] for i in range(3))
+        normals = numpy.cross(b - a, c - a)
+        normals /= numpy.linalg.norm(normals, axis=1)[:, None]
+        return normals, numpy.einsum('ij,ij->i', normals, a)
+
+    def outside_mask(self, points, tolerance=0.0):
+        """True for each point not strictly inside the hull (all True when the hull has no faces)."""
+        if not len(self.faces):
+            return numpy.ones(len(points), dtype=bool)
+        normals, offsets = self.plane_equations()
+        return ((points @ normals.T) >= offsets - tolerance).any(axis=1)
+
+
+def _initial_simplex(points, tolerance):
+    """Indices of four affinely independent, well spread points, or None if the set is flat."""
+    first = int(numpy.argmin(points[:, 0]))
+    distances = numpy.linalg.norm(points - points[first], axis=1)
+    second = int(numpy.argmax(distances))
+    if distances[second] <= tolerance:
+        return None
+    direction = (points[second] - points[first]) / distances[second]
+    offsets = points - points[first]
+    line_distances = numpy.linalg.norm(offsets - numpy.outer(offsets @ direction, direction), axis=1)
+    third = int(numpy.argmax(line_distances))
+    if line_distances[third] <= tolerance:
+        return None
+    normal = numpy.cross(points[second] - points[first], points[third] - points[first])
+    normal /= numpy.linalg.norm(normal)
+    plane_distances = offsets @ normal
+    fourth = int(numpy.argmax(numpy.abs(plane_distances)))
+    if abs(plane_distances[fourth]) <= tolerance:
+        return None
+    return first, second, third, fourth
+
+
+def convex_hull(points):
+    """Computes the ConvexHull of an (n, 3) array; duplicate points are removed first."""
+    points = numpy.unique(numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3), axis=0)
+    if len(points) < 4:
+        return ConvexHull(points, numpy.empty((0, 3), dtype=numpy.int64))
+    extent = float((points.max(axis=0) - points.min(axis=0)).max())
+    tolerance = max(extent, 1.0) * RELATIVE_TOLERANCE
+    simplex = _initial_simplex(points, tolerance)
+    if simplex is None:
+        return ConvexHull(points, numpy.empty((0, 3), dtype=numpy.int64))
+
+    faces = {} # face id -> [vertex indices (a, b, c), unit normal, offset, outside point indices, farthest index]
+    edge_face = {} # directed edge (a, b) -> id of the face that has it, counter-clockwise from outside
+    next_face_id = 0
+
+    coordinates = points.tolist() # Per-face geometry is scalar work; plain floats beat tiny NumPy calls
+
+    def add_faces(triangles):
+        nonlocal next_face_id
+        face_ids = []
+        for a, b, c in triangles:
+            (ax, ay, az), (bx, by, bz), (cx, cy, cz) = coordinates[a], coordinates[b], coordinates[c]
+            ux, uy, uz, vx, vy, vz = bx - ax, by - ay, bz - az, cx - ax, cy - ay, cz - az
+            nx, ny, nz = uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+            length = math.sqrt(nx * nx + ny * ny + nz * nz) or 1.0
+            normal = (nx / length, ny / length, nz / length)
+            faces[next_face_id] = [(a, b, c), normal, normal[0] * ax + normal[1] * ay + normal[2] * az, None, -1]
+            for edge in ((a, b), (b, c), (c, a)):
+                edge_face[edge] = next_face_id
+            face_ids.append(next_face_id)
+            next_face_id += 1
+        return face_ids
+
+    def assign_outside(face_ids, candidates):
+        # Each candidate point goes to the face it is farthest above (if any).
+        if not len(candidates) or not face_ids:
+            for face_id in face_ids:
+                faces[face_id][3], faces[face_id][4] = candidates[:0], -1
+            return
+        normals = numpy.array([faces[face_id][1] for face_id in face_ids])
+        offsets = numpy.array([faces[face_id][2] for face_id in face_ids])
+        heights = points[candidates] @ normals.T - offsets
+        best = heights.argmax(axis=1)
+        best_heights = heights[numpy.arange(len(candidates)), best]
+        above = best_heights > tolerance
+        # Group the points above some face by that face with one sort instead of a mask per face.
+        order = numpy.flatnonzero(above)
+        order = order[numpy.argsort(best[order], kind='stable')]
+        bounds = numpy.searchsorted(best[order], numpy.arange(len(face_ids) + 1))
+        for column, face_id in enumerate(face_ids):
+            mine = order[bounds[column]:bounds[column + 1]]
+            faces[face_id][3] = candidates[mine]
+            faces[face_id][4] = int(candidates[mine[best_heights[mine].argmax()]]) if len(mine) else -1
+
+    # Orient the initial tetrahedron's faces outward.
+    i0, i1, i2, i3 = simplex
+    centroid = points[list(simplex)].mean(axis=0)
+    triangles = []
+    for a, b, c in ((i0, i1, i2), (i0, i3, i1), (i1, i3, i2), (i0, i2, i3)):
+        if numpy.cross(points[b] - points[a], points[c] - points[a]) @ (points[a] - centroid) < 0:
+            b, c = c, b
+        triangles.append((a, b, c))
+    initial = add_faces(triangles)
+    assign_outside(initial, numpy.setdiff1d(numpy.arange(len(points)), simplex))
+
+    pending = deque(face_id for face_id in initial if faces[face_id][4] >= 0)
+    while pending:
+        start = pending.popleft()
+        if start not in faces or faces[start][4] < 0:
+            continue
+        eye = faces[start][4]
+        ex, ey, ez = coordinates[eye]
+
+        # Faces visible from the eye point form a connected patch around the start face.
+        visible, horizon, stack = {start}, [], [start]
+        while stack:
+            face_id = stack.pop()
+            a, b, c = faces[face_id][0]
+            for edge in ((a, b), (b, c), (c, a)):
+                neighbour = edge_face[(edge[1], edge[0])]
+                if neighbour in visible:
+                    continue
+                (nx, ny, nz), offset = faces[neighbour][1], faces[neighbour][2]
+                if nx * ex + ny * ey + nz * ez - offset > tolerance:
+                    visible.add(neighbour)
+                    stack.append(neighbour)
+                else:
+                    horizon.append(edge)
+
+        orphans = [faces[face_id][3] for face_id in visible]
+        for face_id in visible:
+            a, b, c = faces.pop(face_id)[0]
+            for edge in ((a, b), (b, c), (c, a)):
+                if edge_face.get(edge) == face_id:
+                    del edge_face[edge]
+        new_faces = add_faces([(a, b, eye) for a, b in horizon])
+        candidates = numpy.concatenate(orphans) if orphans else numpy.empty(0, dtype=numpy.int64)
+        assign_outside(new_faces, candidates[candidates != eye])
+        pending.extend(face_id for face_id in new_faces if faces[face_id][4] >= 0)
+
+    # Renumber to the hull's own vertices.
+    triangles = numpy.array([face[0] for face in faces.values()], dtype=numpy.int64)
+    used, remapped = numpy.unique(triangles, return_inverse=True)
+    return ConvexHull(points[used], remapped.reshape(-1, 3))
+
+
+def points_outside_hull(points, inner_points):
+    """
+    Returns the rows of points that lie above some face of hull(inner_points). inner_points
+    must be known to lie inside the full hull (e.g. support points of the same mesh), so
+    everything discarded here is strictly inside it and cannot be a hull vertex. If
+    inner_points are still flat (e.g. the first chunk is one planar face), nothing is discarded.
+    """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+    inner = convex_hull(inner_points)
+    if not len(inner.faces) or not len(points):
+        return points
+    normals, offsets = inner.plane_equations()
+    extent = float((inner.vertices.max(axis=0) - inner.vertices.min(axis=0)).max())
+    limits = (offsets + max(extent, 1.0) * RELATIVE_TOLERANCE).astype(numpy.float32)
+    normals = normals.astype(numpy.float32)
+    keep = numpy.zeros(len(points), dtype=bool)
+    points_float32 = points.astype(numpy.float32)
+    for start in range(0, len(points), PROJECTION_BLOCK_ROWS):
+        block = points_float32[start:start + PROJECTION_BLOCK_ROWS]
+        keep[start:start + PROJECTION_BLOCK_ROWS] = (block @ normals.T > limits).any(axis=1)
+    return points[keep]
+
+
+def decimate_hull_points(points):
+    """
+    Caps a hull point set at about HULL_MAX_POINTS: each point is assigned to a cell of a cube
+    map around the set's centre by its direction, and only the farthest point per cell is kept
+    (which also drops duplicates). The hull of the result is inside the true hull and, for
+    convex-ish parts, within about 0.1% of its volume. Smaller sets are returned unchanged, so
+    their hull stays exact.
+    """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+    if len(points) <= HULL_MAX_POINTS:
+        return points
+    offsets = points - (points.min(axis=0) + points.max(axis=0)) / 2.0
+    major_axis = numpy.abs(offsets).argmax(axis=1)
+    rows = numpy.arange(len(points))
+    major = offsets[rows, major_axis]
+    scale = numpy.where(major != 0.0, numpy.abs(major), 1.0)
+    # The two remaining coordinates, divided by the major one, give the position on the cube face.
+    u = offsets[rows, (major_axis + 1) % 3] / scale
+    v = offsets[rows, (major_axis + 2) % 3] / scale
+    k = HULL_CELLS_PER_EDGE
+    u_cell = numpy.clip(((u + 1.0) * 0.5 * k).astype(numpy.int64), 0, k - 1)
+    v_cell = numpy.clip(((v + 1.0) * 0.5 * k).astype(numpy.int64), 0, k - 1)
+    cells = ((major_axis * 2 + (major > 0)) * k + u_cell) * k + v_cell
+    order = numpy.lexsort((-numpy.einsum('ij,ij->i', offsets, offsets), cells)) # Farthest first within a cell
+    sorted_cells = cells[order]
+    first_in_cell = numpy.ones(len(order), dtype=bool)
+    first_in_cell[1:] = sorted_cells[1:] != sorted_cells[:-1]
+    return points[order[first_in_cell]]
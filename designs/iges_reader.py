@@ -0,0 +1,284 @@
+"""
+Streaming reader for IGES (Initial Graphics Exchange Specification) files.
+
+An IGES file is a sequence of fixed 80-column records; column 73 holds the section
+letter (S start, G global, D directory entry, P parameter data, T terminate) and
+columns 74-80 a sequence number. The file is read once, line by line:
+
+- G: delimiters, length units and model scale;
+- D: two records per entity (type, parameter pointer, transformation matrix
+  pointer, status); kept as a compact table since P records refer back to it;
+- P: each entity's parameters (columns 1-64) are decoded only for geometry types
+  that carry coordinates (points, lines, arcs, B-spline curves and surfaces).
+
+Coordinates are reduced to a bounding box per transformation matrix as they are
+read; the matrices (entity 124) are applied to those boxes at the end, so memory
+does not grow with the amount of geometry.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+IGES_ENGINE_NAME = "gmqp-iges"
+IGES_ENGINE_VERSION = "1"
+
+IGES_LINE_LENGTH = 80
+
+# Global section parameter 14 (units flag) -> millimetres per unit; flag 3 defers to parameter 15 (units name).
+UNITS_FLAG_SCALE_MM = {
+    1: 25.4, 2: 1.0, 4: 304.8, 5: 1609344.0, 6: 1000.0, 7: 1e6, 8: 0.0254, 9: 0.001, 10: 10.0, 11: 2.54e-5,
+}
+UNITS_NAME_SCALE_MM = {
+    "IN": 25.4, "INCH": 25.4, "MM": 1.0, "FT": 304.8, "MI": 1609344.0, "M": 1000.0, "KM": 1e6,
+    "MIL": 0.0254, "UM": 0.001, "CM": 10.0, "UIN": 2.54e-5,
+}
+
+POINT, LINE, CIRCULAR_ARC, BSPLINE_CURVE, BSPLINE_SURFACE, TRANSFORMATION_MATRIX = 116, 110, 100, 126, 128, 124
+GEOMETRY_TYPES = {POINT, LINE, CIRCULAR_ARC, BSPLINE_CURVE, BSPLINE_SURFACE, TRANSFORMATION_MATRIX}
+# Underlying surface entities; each B-rep face normally has one, so their count drives the complexity score.
+SURFACE_TYPES = {114, 118, 120, 122, 128, 140}
+
+PARAMETRIC_USE_FLAG = "05" # DE status "entity use": 2D parameter-space geometry, not model coordinates
+MAX_TRANSFORM_CHAIN = 32
+
+_HOLLERITH_RE = re.compile(r"\s*(\d+)H", re.I)
+
+
+def parse_global_parameters(text):
+    """
+    Splits the concatenated Global section into its parameters. Handles Hollerith
+    strings (nHxxxx) and the delimiters declared in the first two parameters.
+    """
+    param_delim, record_delim = ',', ';'
+    match = _HOLLERITH_RE.match(text) # Parameter 1 may redefine the parameter delimiter, e.g. '1H,'
+    if match and match.group(1) == '1':
+        param_delim = text[match.end()]
+    params, pos = [], 0
+    while pos < len(text):
+        match = _HOLLERITH_RE.match(text, pos)
+        if match:
+            start = match.end()
+            value = text[start:start + int(match.group(1))]
+            pos = start + int(match.group(1))
+        else:
+            end = pos
+            while end < len(text) and text[end] not in (param_delim, record_delim):
+                end += 1
+            value = text[pos:end].strip()
+            pos = end
+        params.append(value)
+        if len(params) == 2 and len(value) == 1: # Parameter 2 may redefine the record delimiter
+            record_delim = value
+        if pos >= len(text) or text[pos] == record_delim:
+            break
+        pos += 1 # Skip the parameter delimiter
+    return params
+
+
+def _int_field(field):
+    """Parses a fixed-width Directory Entry integer field; blank means 0."""
+    return int(field) if field.strip() else 0
+
+
+def _to_float(value, default=None):
+    try:
+        return float(value.strip().upper().replace('D', 'E'))
+    except (AttributeError, ValueError):
+        return default
+
+
+def _parse_parameter_values(text, param_delim, record_delim):
+    """Converts an entity's parameter text (numeric entities only) to a float64 array; empty fields become 0."""
+    text = text.split(record_delim, 1)[0].upper().replace('D', 'E')
+    if param_delim != ',':
+        text = text.replace(param_delim, ',')
+    values = numpy.fromstring(text, dtype=numpy.float64, sep=',')
+    fields = text.count(',') + 1
+    if values.size != fields: # Defaulted (empty) fields; fall back to per-field conversion
+        values = numpy.array([_to_float(field, 0.0) for field in text.split(',')], dtype=numpy.float64)
+    return values
+
+
+def _entity_points(entity_type, values):
+    """Returns an (n, 3) array of model-space points bounding an entity, from its parameters (type first)."""
+    p = values[1:]
+    if entity_type == POINT:
+        return p[0:3].reshape(1, 3)
+    if entity_type == LINE:
+        return p[0:6].reshape(2, 3)
+    if entity_type == CIRCULAR_ARC:
+        z, cx, cy, sx, sy = p[0:5]
+        radius = numpy.hypot(sx - cx, sy - cy)
+        # The full circle's box: conservative for arcs shorter than 360 degrees.
+        return numpy.array([[cx - radius, cy - radius, z], [cx + radius, cy + radius, z]])
+    if entity_type == BSPLINE_CURVE:
+        k, m = int(p[0]), int(p[1])
+        start = 6 + (k + m + 2) + (k + 1) # After K, M, PROP1-4, knots and weights
+        return p[start:start + 3 * (k + 1)].reshape(-1, 3)
+    if entity_type == BSPLINE_SURFACE:
+        k1, k2, m1, m2 = (int(x) for x in p[0:4])
+        count = (k1 + 1) * (k2 + 1)
+        start = 9 + (k1 + m1 + 2) + (k2 + m2 + 2) + count # After K1, K2, M1, M2, PROP1-5, knots and weights
+        return p[start:start + 3 * count].reshape(-1, 3)
+    return None
+
+
+class IgesGeometrySummary:
+    """Accumulates per-transform bounding boxes, entity counts and units while an IGES file is read."""
+
+    def __init__(self):
+        self.param_delim, self.record_delim = ',', ';'
+        self.unit_scale_mm, self.unit_name, self.model_scale = 1.0, "assumed_mm", 1.0
+        self.entity_counts = Counter()
+        self.directory = {} # DE sequence number -> (entity type, transform pointer, use flag)
+        self.transforms = {} # DE sequence number of a 124 entity -> (3x4 matrix, its own transform pointer)
+        self.boxes = {} # transform pointer -> [min xyz, max xyz] of untransformed points
+        self.num_points = 0
+
+    def set_global(self, params):
+        if len(params) > 1 and len(params[0]) == 1:
+            self.param_delim = params[0]
+        if len(params) > 1 and len(params[1]) == 1:
+            self.record_delim = params[1]
+        self.model_scale = _to_float(params[12] if len(params) > 12 else None, 1.0) or 1.0
+        units_flag = int(_to_float(params[13] if len(params) > 13 else None, 2))
+        units_name = (params[14] if len(params) > 14 else "").strip().upper()
+        if units_flag in UNITS_FLAG_SCALE_MM:
+            self.unit_scale_mm, self.unit_name = UNITS_FLAG_SCALE_MM[units_flag], units_name.lower() or str(units_flag)
+        elif units_name in UNITS_NAME_SCALE_MM:
+            self.unit_scale_mm, self.unit_name = UNITS_NAME_SCALE_MM[units_name], units_name.lower()
+        else:
+            logger.warning(f"IGES units flag {units_flag} / name '{units_name}' not recognised; assuming mm.")
+
+    def add_directory_entry(self, sequence, line1, line2):
+        try:
+            entity_type = _int_field(line1[0:8])
+            transform_pointer = _int_field(line1[48:56])
+        except ValueError:
+            raise ValueError(f"Malformed IGES Directory Entry at D{sequence}.") from None
+        use_flag = line1[68:70].strip().zfill(2)
+        self.entity_counts[entity_type] += 1
+        self.directory[sequence] = (entity_type, transform_pointer, use_flag)
+
+    def add_parameters(self, de_pointer, text):
+        entry = self.directory.get(de_pointer)
+        if entry is None or entry[0] not in GEOMETRY_TYPES:
+            return
+        entity_type, transform_pointer, use_flag = entry
+        values = _parse_parameter_values(text, self.param_delim, self.record_delim)
+        if entity_type == TRANSFORMATION_MATRIX:
+            self.transforms[de_pointer] = (values[1:13].reshape(3, 4), transform_pointer)
+            return
+        if use_flag == PARAMETRIC_USE_FLAG:
+            return
+        try:
+            points = _entity_points(entity_type, values)
+        except (IndexError, ValueError) as e:
+            raise ValueError(f"IGES entity {entity_type} (DE {de_pointer}) has malformed parameters: {e}") from e
+        if points is None or not len(points):
+            return
+        box = self.boxes.setdefault(transform_pointer, [numpy.full(3, numpy.inf), numpy.full(3, -numpy.inf)])
+        numpy.minimum(box[0], points.min(axis=0), out=box[0])
+        numpy.maximum(box[1], points.max(axis=0), out=box[1])
+        self.num_points += len(points)
+
+    def _matrix(self, transform_pointer):
+        """Composes the chain of 124 matrices starting at transform_pointer into one 3x4 matrix."""
+        matrix = numpy.hstack([numpy.eye(3), numpy.zeros((3, 1))])
+        for _ in range(MAX_TRANSFORM_CHAIN):
+            if not transform_pointer or transform_pointer not in self.transforms:
+                return matrix
+            step, transform_pointer = self.transforms[transform_pointer]
+            matrix = numpy.hstack([step[:, :3] @ matrix[:, :3], (step[:, :3] @ matrix[:, 3:]) + step[:, 3:]])
+        raise ValueError("IGES transformation matrices form a cycle.")
+
+    def result(self, source_name):
+        min_coords, max_coords = numpy.full(3, numpy.inf), numpy.full(3, -numpy.inf)
+        for transform_pointer, (box_min, box_max) in self.boxes.items():
+            corners = numpy.array([[x, y, z] for x in (box_min[0], box_max[0])
+                                   for y in (box_min[1], box_max[1]) for z in (box_min[2], box_max[2])])
+            matrix = self._matrix(transform_pointer)
+            corners = corners @ matrix[:, :3].T + matrix[:, 3]
+            numpy.minimum(min_coords, corners.min(axis=0), out=min_coords)
+            numpy.maximum(max_coords, corners.max(axis=0), out=max_coords)
+        if self.num_points == 0 or not numpy.any(max_coords > min_coords):
+            raise ValueError(f"IGES file contains no 3D geometry: {source_name}")
+        scale = self.unit_scale_mm / self.model_scale
+        return {
+            "min_mm": (min_coords * scale).tolist(),
+            "max_mm": (max_coords * scale).tolist(),
+            "length_unit": self.unit_name,
+            "num_entities": sum(self.entity_counts.values()),
+            "num_surfaces": sum(count for entity_type, count in self.entity_counts.items() if entity_type in SURFACE_TYPES),
+            "num_points": self.num_points,
+            "entity_counts": {str(entity_type): count for entity_type, count in self.entity_counts.items()},
+        }
+
+
+def summarize_iges_file(file_path):
+    """
+    Streams an IGES file once and returns (summary_metrics, throughput). Raises ValueError
+    for files that are not fixed-format IGES or contain no 3D geometry.
+    """
+    summary = IgesGeometrySummary()
+    started_at = time.monotonic()
+    global_text, pending_de = [], None
+    p_pointer, p_text = None, []
+    sections = set()
+
+    with open(file_path, 'r', encoding='latin-1', newline=None) as f:
+        for line_number, raw_line in enumerate(f, start=1):
+            if not raw_line.strip():
+                continue
+            line = raw_line.rstrip('\r\n').ljust(IGES_LINE_LENGTH)
+            section = line[72]
+            if len(raw_line.rstrip('\r\n')) > IGES_LINE_LENGTH or section not in 'SGDPTC':
+                raise ValueError(f"Line {line_number} is not an 80-column IGES record.")
+            if section == 'C':
+                raise ValueError("Compressed-format IGES files are not supported.")
+            if section == 'G':
+                global_text.append(line[:72])
+            elif section == 'D':
+                if 'G' not in sections:
+                    raise ValueError("IGES Directory Entry section precedes the Global section.")
+                if 'D' not in sections:
+                    summary.set_global(parse_global_parameters(''.join(global_text)))
+                if pending_de is None:
+                    pending_de = (_int_field(line[73:80]), line)
+                else:
+                    summary.add_directory_entry(pending_de[0], pending_de[1], line)
+                    pending_de = None
+            elif section == 'P':
+                try:
+                    de_pointer = _int_field(line[64:72])
+                except ValueError:
+                    raise ValueError(f"Line {line_number} has a malformed Parameter Data back-pointer.") from None
+                if de_pointer != p_pointer:
+                    if p_pointer is not None:
+                        summary.add_parameters(p_pointer, ''.join(p_text))
+                    p_pointer, p_text = de_pointer, []
+                if summary.directory.get(de_pointer, (None,))[0] in GEOMETRY_TYPES:
+                    p_text.append(line[:64])
+            sections.add(section)
+    size = os.path.getsize(file_path)
+    if p_pointer is not None:
+        summary.add_parameters(p_pointer, ''.join(p_text))
+    if not {'G', 'D', 'P'} <= sections:
+        raise ValueError("IGES file is missing its Global, Directory Entry or Parameter Data section.")
+
+    elapsed = max(time.monotonic() - started_at, 1e-9)
+    metrics = summary.result(os.path.basename(file_path))
+    throughput = {
+        "bytes": size,
+        "entities": metrics["num_entities"],
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(size / elapsed / 1e6, 2),
+        "entities_per_second": round(metrics["num_entities"] / elapsed),
+    }
+    return metrics, throughput
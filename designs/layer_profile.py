@@ -0,0 +1,118 @@
+"""
+Layer-slice profile of closed meshes: cross-sectional area and perimeter at every layer height
+along a build direction, for print-time and material estimates of additive processes.
+
+Nothing is sliced. For a closed surface, the cross-section at height h has the area of the
+surface below h projected onto the layer plane (with sign: downward-facing facets count, upward
+ones cancel them), so each facet contributes w * phi(h), where w is its signed projected area
+and phi the fraction of the facet below h, a closed-form function of the facet's three vertex
+heights. Each facet is an interval [z_low, z_high) of heights:
+
+- layers above the interval get the whole w, added with one difference array and a cumulative
+  sum over layers;
+- layers inside it (usually one or two, since facets are small) are expanded into (facet, layer)
+  pairs and evaluated in closed form, together with the length of the facet's cut segment, and
+  summed per layer with bincount.
+
+The work is O(facets + cut segments) rather than O(facets * layers), and each pair is evaluated
+in its own facet's local coordinates, so there is no cancellation between large polynomial terms.
+
+The profile is stored run-length encoded: a new run starts wherever area or perimeter moves to
+another step of PROFILE_RELATIVE_PRECISION of its maximum, and each run keeps the mean values of
+its layers, so prismatic parts take a few runs and smooth ones a few hundred. expand_layer_profile
+turns it back into per-layer arrays.
+"""
+import numpy
+
+# Above this many layers the layer height is doubled until the part fits (keeps huge parts cheap).
+MAX_LAYERS = 10000
+# Run-length encoding tolerance, relative to the largest area / perimeter of the part.
+PROFILE_RELATIVE_PRECISION = 0.01
+# Facets expanded into (facet, layer) pairs per block.
+BLOCK_FACETS = 65536
+
+
+def layer_areas_and_perimeters(triangles, outward_sign, up, layer_height):
+    """
+    Returns (areas, perimeters, layer_height), arrays with one value per layer of the closed mesh
+    (see wall_thickness.outward_normals for outward_sign) stacked along unit vector up from its
+    lowest point. Each layer is measured at its mid-height. The layer height may be raised to
+    keep the count within MAX_LAYERS.
+    """
+    triangles = numpy.asarray(triangles, dtype=numpy.float64)
+    up = numpy.asarray(up, dtype=numpy.float64)
+    heights = triangles @ up
+    plate = heights.min()
+    heights -= plate
+    build_height = float(heights.max())
+    while build_height / layer_height > MAX_LAYERS:
+        layer_height *= 2.0
+    num_layers = max(int(numpy.ceil(build_height / layer_height)), 1)
+
+    # Vertices in order of height per facet: v0 lowest, v2 highest.
+    order = numpy.argsort(heights, axis=1)
+    heights = numpy.take_along_axis(heights, order, axis=1)
+    vertices = numpy.take_along_axis(triangles, order[:, :, None], axis=1)
+    cross = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    weights = -0.5 * (cross @ up) * numpy.asarray(outward_sign, dtype=numpy.float64)
+
+    # Layer j is measured at (j + 0.5) * layer_height; a facet is cut by layers in [first, last).
+    first = numpy.clip(numpy.ceil(heights[:, 0] / layer_height - 0.5), 0, num_layers).astype(numpy.int64)
+    last = numpy.clip(numpy.ceil(heights[:, 2] / layer_height - 0.5), 0, num_layers).astype(numpy.int64)
+    below = numpy.bincount(last, weights=weights, minlength=num_layers + 1)
+    areas = numpy.cumsum(below)[:num_layers]
+    perimeters = numpy.zeros(num_layers)
+
+    for start in range(0, len(triangles), BLOCK_FACETS):
+        block = slice(start, start + BLOCK_FACETS)
+        counts = last[block] - first[block]
+        facets = numpy.repeat(numpy.arange(start, start + len(counts)), counts)
+        if not len(facets):
+            continue
+        # Layer index of each pair: first[facet] + position within the facet's run.
+        run_starts = numpy.cumsum(counts) - counts
+        layers = first[facets] + numpy.arange(len(facets)) - numpy.repeat(run_starts, counts)
+        h = (layers + 0.5) * layer_height
+        z0, z1, z2 = heights[facets, 0], heights[facets, 1], heights[facets, 2]
+        v0, v1, v2 = vertices[facets, 0], vertices[facets, 1], vertices[facets, 2]
+        lower = h < z1 # Below the middle vertex the cut runs v0-v1 to v0-v2, above it v1-v2 to v0-v2
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            below_fraction = numpy.where(
+                lower,
+                (h - z0) ** 2 / ((z1 - z0) * (z2 - z0)),
+                1.0 - (z2 - h) ** 2 / ((z2 - z1) * (z2 - z0)),
+            )
+            on_long_edge = v0 + ((h - z0) / (z2 - z0))[:, None] * (v2 - v0)
+            on_short_edge = numpy.where(
+                lower[:, None],
+                v0 + ((h - z0) / (z1 - z0))[:, None] * (v1 - v0),
+                v1 + ((h - z1) / (z2 - z1))[:, None] * (v2 - v1),
+            )
+        cut = on_long_edge - on_short_edge
+        areas += numpy.bincount(layers, weights=weights[facets] * below_fraction, minlength=num_layers)
+        perimeters += numpy.bincount(layers, weights=numpy.sqrt(numpy.einsum('ij,ij->i', cut, cut)), minlength=num_layers)
+    return numpy.maximum(areas, 0.0), perimeters, layer_height
+
+
+def compress_profile(areas, perimeters):
+    """Run-length encodes per-layer values: a list of [first layer, mean area, mean perimeter] runs."""
+    changes = numpy.zeros(len(areas), dtype=bool)
+    changes[0] = True
+    for values in (areas, perimeters):
+        step = max(float(values.max(initial=0.0)) * PROFILE_RELATIVE_PRECISION, 1e-9)
+        levels = numpy.round(values / step)
+        changes[1:] |= levels[1:] != levels[:-1]
+    starts = numpy.flatnonzero(changes)
+    counts = numpy.diff(numpy.append(starts, len(areas)))
+    means = [numpy.round(numpy.add.reduceat(values, starts) / counts, 2) for values in (areas, perimeters)]
+    return [[int(layer), float(area), float(perimeter)] for layer, area, perimeter in zip(starts, *means)]
+
+
+def expand_layer_profile(profile):
+    """
+    Inverse of the run-length encoding stored in geometric_data["layer_profile"]: returns
+    (areas_mm2, perimeters_mm) with one value per layer, e.g. for print-time pricing.
+    """
+    runs = numpy.asarray(profile["runs"], dtype=numpy.float64).reshape(-1, 3)
+    counts = numpy.diff(numpy.append(runs[:, 0], profile["num_layers"])).astype(numpy.int64)
+    return numpy.repeat(runs[:, 1], counts), numpy.repeat(runs[:, 2], counts)
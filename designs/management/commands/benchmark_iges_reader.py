@@ -0,0 +1,109 @@
+"""
+Benchmarks designs.iges_reader on a synthetic IGES file of bicubic B-spline surface patches
+(entity 128) laid out on a grid, each placed by a transformation matrix (entity 124):
+
+    python manage.py benchmark_iges_reader --surfaces 200000
+"""
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _record(data, letter, sequence):
+    return f"{data:<72.72}{letter}{sequence:7d}\n"
+
+
+def _parameter_lines(entity_type, params, de_sequence):
+    """Splits 'type,p1,...;' into 64-column chunks, breaking only after a delimiter."""
+    fields = [str(entity_type)] + [repr(float(p)) if isinstance(p, float) else str(p) for p in params]
+    lines, current = [], ""
+    for index, field in enumerate(fields):
+        token = field + (";" if index == len(fields) - 1 else ",")
+        if len(current) + len(token) > 64:
+            lines.append(current)
+            current = ""
+        current += token
+    lines.append(current)
+    return [f"{line:<64} {de_sequence:7d}" for line in lines]
+
+
+def write_iges(file_obj, entities, units_flag=2, units_name="MM"):
+    """
+    Writes a fixed-format IGES file. entities is a list of (entity_type, params, transform_index, use_flag),
+    where transform_index is the 1-based position of a 124 entity in the list (0 for none).
+    """
+    start = ["Synthetic IGES file written by designs benchmark_iges_reader."]
+    global_params = (
+        f"1H,,1H;,9Hsynthetic,13Hsynthetic.igs,4Hgmqp,1H1,32,38,6,308,15,9Hsynthetic,1.0,{units_flag},"
+        f"{len(units_name)}H{units_name},1,0.1,15H20240101.000000,1.0E-6,1000.0,4Hgmqp,4Hgmqp,11,0;"
+    )
+    global_lines = [global_params[i:i + 72] for i in range(0, len(global_params), 72)]
+
+    directory, parameters = [], []
+    for index, (entity_type, params, transform_index, use_flag) in enumerate(entities):
+        de_sequence = 2 * index + 1
+        lines = _parameter_lines(entity_type, params, de_sequence)
+        transform_pointer = 2 * transform_index - 1 if transform_index else 0
+        status = f"0000{use_flag}00"
+        directory.append(
+            f"{entity_type:8d}{len(parameters) + 1:8d}{0:8d}{1:8d}{0:8d}{0:8d}{transform_pointer:8d}{0:8d}{status:>8}"
+        )
+        directory.append(f"{entity_type:8d}{0:8d}{0:8d}{len(lines):8d}{0:8d}{'':8}{'':8}{'':8}{0:8d}")
+        parameters.extend(lines)
+
+    for letter, lines in (("S", start), ("G", global_lines), ("D", directory), ("P", parameters)):
+        for sequence, line in enumerate(lines, start=1):
+            file_obj.write(_record(line, letter, sequence))
+    file_obj.write(_record(f"S{len(start):7d}G{len(global_lines):7d}D{len(directory):7d}P{len(parameters):7d}", "T", 1))
+
+
+def bicubic_patch_params(size=10.0):
+    """Parameters of a 4x4 control-point bicubic B-spline (128) patch spanning [0, size]^2 with a bump."""
+    knots = [0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 1.0]
+    weights = [1.0] * 16
+    points = []
+    for j in range(4):
+        for i in range(4):
+            points += [size * i / 3, size * j / 3, size * 0.1 if 0 < i < 3 and 0 < j < 3 else 0.0]
+    return [3, 3, 3, 3, 0, 0, 1, 0, 0] + knots + knots + weights + points + [0.0, 1.0, 0.0, 1.0]
+
+
+def translation_params(x, y, z):
+    return [1.0, 0.0, 0.0, float(x), 0.0, 1.0, 0.0, float(y), 0.0, 0.0, 1.0, float(z)]
+
+
+class Command(BaseCommand):
+    help = "Times designs.iges_reader on a generated IGES file of B-spline surface patches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--surfaces', type=int, default=100_000, help="Number of B-spline surface patches to generate.")
+
+    def handle(self, *args, **options):
+        try:
+            from designs.iges_reader import summarize_iges_file
+        except ImportError as e:
+            raise CommandError(f"numpy is required for this benchmark: {e}")
+
+        surfaces = max(1, options['surfaces'])
+        side = int(surfaces ** 0.5) + 1
+        patch = bicubic_patch_params()
+        entities = []
+        for n in range(surfaces):
+            entities.append((124, translation_params(12.0 * (n % side), 12.0 * (n // side), 0.0), 0, "00"))
+            entities.append((128, patch, len(entities), "00"))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "synthetic.igs")
+            with open(path, 'w', encoding='latin-1') as f:
+                write_iges(f, entities)
+            self.stdout.write(f"{surfaces} surfaces, {len(entities)} entities; {os.path.getsize(path) / 1e6:.1f} MB")
+
+            started_at = time.perf_counter()
+            metrics, throughput = summarize_iges_file(path)
+            elapsed = time.perf_counter() - started_at
+            self.stdout.write(
+                f"gmqp-iges: {elapsed:.2f}s  {throughput['mb_per_second']} MB/s  "
+                f"{throughput['entities_per_second']} entities/s  bbox {metrics['min_mm']} - {metrics['max_mm']}"
+            )
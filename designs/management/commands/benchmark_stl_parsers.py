@@ -0,0 +1,78 @@
+"""
+Benchmarks the STL readers in designs.stl_reader against numpy-stl's Mesh.from_file.
+
+The input is the designs/test_data/cube_10mm.stl cube tiled on a grid until it has the
+requested number of facets, written once as ASCII and once as binary STL:
+
+    python manage.py benchmark_stl_parsers --facets 2000000
+
+The binary file is then streamed once more with every registered metric kernel (see
+designs.mesh_kernels) to report the time spent per intermediate and per kernel.
+"""
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+SAMPLE_STL_FILE_PATH = Path(__file__).resolve().parents[2] / "test_data" / "cube_10mm.stl"
+
+
+class Command(BaseCommand):
+    help = "Times the vectorized ASCII and streaming binary STL readers against numpy-stl on a scaled cube mesh."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--facets', type=int, default=1_000_000, help="Approximate number of facets to generate.")
+        parser.add_argument('--repeat', type=int, default=1, help="Runs per reader; the best time is reported.")
+
+    def handle(self, *args, **options):
+        try:
+            import numpy
+            from stl import mesh as stl_mesh, Mode
+            from designs import mesh_kernels, stl_reader
+        except ImportError as e:
+            raise CommandError(f"numpy and numpy-stl are required for this benchmark: {e}")
+
+        cube = stl_mesh.Mesh.from_file(str(SAMPLE_STL_FILE_PATH))
+        copies = max(1, options['facets'] // len(cube.vectors))
+        side = int(numpy.ceil(copies ** (1 / 3)))
+        grid = numpy.stack(numpy.unravel_index(numpy.arange(copies), (side, side, side)), axis=1) * 20.0
+        vectors = (cube.vectors[None, :, :, :] + grid[:, None, None, :]).reshape(-1, 3, 3).astype(numpy.float32)
+
+        tiled = stl_mesh.Mesh(numpy.zeros(len(vectors), dtype=stl_mesh.Mesh.dtype))
+        tiled.vectors[:] = vectors
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ascii_path = os.path.join(tmp_dir, "tiled_ascii.stl")
+            binary_path = os.path.join(tmp_dir, "tiled_binary.stl")
+            tiled.save(ascii_path, mode=Mode.ASCII)
+            tiled.save(binary_path, mode=Mode.BINARY)
+            self.stdout.write(
+                f"{len(vectors)} facets; ASCII {os.path.getsize(ascii_path) / 1e6:.1f} MB, "
+                f"binary {os.path.getsize(binary_path) / 1e6:.1f} MB"
+            )
+
+            cases = [
+                ("numpy-stl (ASCII)", lambda: stl_mesh.Mesh.from_file(ascii_path, mode=Mode.ASCII).get_mass_properties()),
+                ("gmqp-stl-ascii", lambda: stl_reader.stream_ascii_stl_metrics(ascii_path)),
+                ("numpy-stl (binary)", lambda: stl_mesh.Mesh.from_file(binary_path, mode=Mode.BINARY).get_mass_properties()),
+                ("gmqp-stl-stream (binary)", lambda: stl_reader.stream_binary_stl_metrics(binary_path)),
+            ]
+            for name, run in cases:
+                best = min(self._time(run) for _ in range(max(1, options['repeat'])))
+                self.stdout.write(f"{name:28s} {best:8.2f}s  {len(vectors) / best / 1e6:6.2f} M facets/s")
+
+            scheduler = mesh_kernels.KernelScheduler()
+            elapsed = self._time(lambda: stl_reader.stream_binary_stl_metrics(binary_path, kernels=scheduler))
+            self.stdout.write(f"{'gmqp-stl-stream + kernels':28s} {elapsed:8.2f}s  {len(vectors) / elapsed / 1e6:6.2f} M facets/s")
+            # Intermediates that come with the chunk (vertices, and the reader's cross products and areas) cost nothing here.
+            for group, timings in scheduler.timings_ms().items():
+                for name, milliseconds in timings.items():
+                    rate = f"  {len(vectors) / milliseconds / 1e3:6.2f} M facets/s" if milliseconds else ""
+                    self.stdout.write(f"  {group[:-1] + ' ' + name:26s} {milliseconds:8.1f}ms{rate}")
+
+    @staticmethod
+    def _time(run):
+        started_at = time.perf_counter()
+        run()
+        return time.perf_counter() - started_at
@@ -0,0 +1,263 @@
+"""
+Edge-adjacency features of triangle meshes and the feature-based complexity score.
+
+STL facets do not share vertex indices, so an edge is identified by hashing its two
+vertices' coordinates into one unordered 64-bit key. Each chunk's edge keys are sorted
+once; keys that occur twice are interior edges whose dihedral angle (the angle between
+the two facet normals) is recorded, keys seen once stay open and are matched against
+later chunks (or shards) where their partner may appear, and keys seen more than twice
+are non-manifold. Open edges beyond a fixed budget are spilled to disk by key prefix
+(see EdgeAdjacencyAccumulator), so memory does not grow with the mesh. Everything recorded is weighted by edge length, so the features do not
+change when a part is tessellated more finely:
+
+- a dihedral histogram (edge length per angle bin; ~0 degrees is flat tessellation);
+- sharp edge length (dihedral angle >= SHARP_EDGE_DEGREES): machined feature edges;
+- smooth turning, the sum of angle * length over the remaining edges: the discrete
+  integral of mean curvature, i.e. how much curved surface has to be followed.
+
+COMPLEXITY_VERSION tags the score. Pricing must compare scores only within one version.
+"""
+import base64
+import math
+import os
+import tempfile
+
+import numpy
+
+COMPLEXITY_VERSION = "features-v1"
+
+SHARP_EDGE_DEGREES = 30.0
+# Bin edges in degrees for the length-weighted dihedral histogram.
+DIHEDRAL_BIN_DEGREES = (0.0, 1.0, 10.0, 30.0, 60.0, 90.0, 135.0, 180.0)
+
+# Saturation scales of the complexity terms (see complexity_from_features).
+SHARP_EDGE_SCALE = 50.0 # Sharp edge length in bounding-box diagonals
+SMOOTH_TURNING_SCALE = 20.0 # Radian-diagonals of turning (a cylinder as tall as the diagonal is 2 pi)
+SURFACE_RATIO_SCALE = 10.0 # Surface / volume^(2/3) above a sphere's
+SPHERE_SURFACE_RATIO = (36.0 * math.pi) ** (1.0 / 3.0) # ~4.84, the minimum for any solid
+COMPLEXITY_WEIGHTS = {"sharp_edges": 0.5, "smooth_turning": 0.3, "surface_ratio": 0.2}
+
+# Unmatched edges held in memory before they are spilled to a temporary file (~40 bytes each),
+# and the number of key-prefix bits that group the spilled edges into buckets.
+OPEN_EDGE_SPILL_EDGES = 1 << 18
+OPEN_EDGE_BUCKET_BITS = 8
+OPEN_EDGE_DTYPE = numpy.dtype([("key", "<u8"), ("normal", "<f8", (3,)), ("length", "<f8")])
+
+_MIX_MULTIPLIERS = (numpy.uint64(0xBF58476D1CE4E5B9), numpy.uint64(0x94D049BB133111EB))
+
+
+def _mix(values):
+    """splitmix64 finalizer: a bijection on uint64 that spreads every input bit over the output."""
+    values = values ^ (values >> numpy.uint64(30))
+    values *= _MIX_MULTIPLIERS[0]
+    values ^= values >> numpy.uint64(27)
+    values *= _MIX_MULTIPLIERS[1]
+    return values ^ (values >> numpy.uint64(31))
+
+
+def _vertex_hashes(vectors):
+    """
+    64-bit hashes of each vertex of an (n, 3, 3) array, shape (n, 3). Coordinates are hashed
+    as float32 (the precision STL stores), so ASCII values that round to the same float32 match.
+    """
+    bits = numpy.ascontiguousarray(vectors.astype(numpy.float32) + numpy.float32(0.0)).view(numpy.uint32) # Folds -0.0 into 0.0
+    xy = bits[..., 0].astype(numpy.uint64) << numpy.uint64(32) | bits[..., 1]
+    return _mix(_mix(xy) ^ bits[..., 2])
+
+
+class EdgeAdjacencyAccumulator:
+    """
+    Running edge matching and length-weighted dihedral statistics over facet chunks.
+    Edges still unmatched (pending) are held in memory up to spill_edges records; past that
+    they are paired among themselves and the rest are appended to a temporary file, grouped
+    by the top OPEN_EDGE_BUCKET_BITS of their key. Partners always share a bucket, so the
+    file is matched one bucket at a time at the end and memory stays flat however large the mesh.
+    """
+
+    def __init__(self, spill_edges=None):
+        self.histogram_mm = numpy.zeros(len(DIHEDRAL_BIN_DEGREES) - 1)
+        self.sharp_edge_length = 0.0
+        self.smooth_turning = 0.0 # Sum of dihedral angle (radians) * length over non-sharp edges
+        self.interior_edges = 0
+        self.non_manifold_edges = 0
+        self.settled_open_edges = 0 # Edges left open once everything was matched (see _settle)
+        self.spill_edges = OPEN_EDGE_SPILL_EDGES if spill_edges is None else spill_edges
+        # Edges seen once so far, as OPEN_EDGE_DTYPE record arrays, plus the spilled ones:
+        # (file offset, record count) runs per key bucket.
+        self.pending = []
+        self.pending_edges = 0
+        self.spill_file = None
+        self.spill_runs = [[] for _ in range(1 << OPEN_EDGE_BUCKET_BITS)]
+
+    def add(self, vectors, cross):
+        """Adds an (n, 3, 3) chunk of facets with their (n, 3) edge cross products (from the metric kernel)."""
+        if not len(vectors):
+            return
+        norms = numpy.sqrt(numpy.einsum('ij,ij->i', cross, cross))
+        # Degenerate facets get a NaN normal, so their edges give no angle.
+        unit_normals = numpy.divide(cross, norms[:, None], out=numpy.full_like(cross, numpy.nan), where=norms[:, None] > 0)
+        hashes = _vertex_hashes(vectors)
+        starts, ends = hashes, numpy.roll(hashes, -1, axis=1) # Edges v0-v1, v1-v2, v2-v0
+        sides = numpy.roll(vectors, -1, axis=1) - vectors
+        records = numpy.empty(3 * len(vectors), dtype=OPEN_EDGE_DTYPE)
+        records["key"] = (_mix(numpy.minimum(starts, ends)) ^ numpy.maximum(starts, ends)).ravel()
+        records["normal"] = numpy.repeat(unit_normals, 3, axis=0)
+        records["length"] = numpy.sqrt(numpy.einsum('ijk,ijk->ij', sides, sides)).ravel()
+        self._hold(self._pair(records))
+
+    def _pair(self, records):
+        # Keys seen twice are interior edges (their dihedral is recorded), keys seen more often
+        # are non-manifold; returns the records whose key was seen once.
+        if not len(records):
+            return records
+        records = records[numpy.argsort(records["key"])] # Order within a run does not matter
+        keys = records["key"]
+        run_starts = numpy.flatnonzero(numpy.concatenate([[True], keys[1:] != keys[:-1]]))
+        run_lengths = numpy.diff(numpy.append(run_starts, len(keys)))
+        pairs = run_starts[run_lengths == 2]
+        self._add_dihedrals(records["normal"][pairs], records["normal"][pairs + 1], records["length"][pairs])
+        self.interior_edges += len(pairs)
+        self.non_manifold_edges += int(numpy.count_nonzero(run_lengths > 2))
+        return records[run_starts[run_lengths == 1]]
+
+    def _hold(self, records):
+        if len(records):
+            self.pending.append(records)
+            self.pending_edges += len(records)
+            if self.pending_edges > self.spill_edges:
+                self._spill()
+
+    def _spill(self):
+        # Pairs the pending edges across chunks, then appends the rest to the file sorted by bucket.
+        records = self._pair(numpy.concatenate(self.pending)) if self.pending else self.pending
+        self.pending, self.pending_edges = [], 0
+        if not len(records):
+            return
+        buckets = (records["key"] >> numpy.uint64(64 - OPEN_EDGE_BUCKET_BITS)).astype(numpy.intp)
+        order = numpy.argsort(buckets, kind="stable")
+        counts = numpy.bincount(buckets, minlength=len(self.spill_runs))
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix="mesh-edges-")
+        offset = self.spill_file.seek(0, os.SEEK_END)
+        self.spill_file.write(records[order].tobytes())
+        starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+        for bucket in numpy.flatnonzero(counts):
+            self.spill_runs[bucket].append((offset + int(starts[bucket]) * OPEN_EDGE_DTYPE.itemsize, int(counts[bucket])))
+
+    def _spilled_buckets(self):
+        for runs in self.spill_runs:
+            if runs:
+                chunks = []
+                for offset, count in runs:
+                    self.spill_file.seek(offset)
+                    chunks.append(numpy.frombuffer(self.spill_file.read(count * OPEN_EDGE_DTYPE.itemsize), dtype=OPEN_EDGE_DTYPE))
+                yield numpy.concatenate(chunks)
+
+    def _settle(self, keep_open):
+        """
+        Matches every pending and spilled edge. The edges left open are kept as the pending
+        records if keep_open (to pass on to a merge), else only added to settled_open_edges.
+        """
+        if self.spill_file is None:
+            groups = [numpy.concatenate(self.pending)] if self.pending else []
+        else:
+            self._spill()
+            groups = self._spilled_buckets()
+        open_records = []
+        for records in groups:
+            records = self._pair(records)
+            if keep_open:
+                open_records.append(records)
+            else: # Only the count is needed, so each bucket is dropped once matched
+                self.settled_open_edges += len(records)
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+            self.spill_runs = [[] for _ in self.spill_runs]
+        self.pending = [records for records in open_records if len(records)]
+        self.pending_edges = sum(len(records) for records in self.pending)
+
+    def _add_dihedrals(self, first_normals, second_normals, lengths):
+        cosines = numpy.einsum('ij,ij->i', first_normals, second_normals)
+        valid = ~numpy.isnan(cosines) # Degenerate facets have NaN normals
+        angles = numpy.degrees(numpy.arccos(numpy.clip(cosines[valid], -1.0, 1.0)))
+        lengths = lengths[valid]
+        self.histogram_mm += numpy.histogram(angles, bins=DIHEDRAL_BIN_DEGREES, weights=lengths)[0]
+        sharp = angles >= SHARP_EDGE_DEGREES
+        self.sharp_edge_length += float(lengths[sharp].sum())
+        self.smooth_turning += float((numpy.radians(angles[~sharp]) * lengths[~sharp]).sum())
+
+    def merge(self, other):
+        """Folds in another accumulator; its open edges are matched against this one's."""
+        self.histogram_mm += other.histogram_mm
+        self.sharp_edge_length += other.sharp_edge_length
+        self.smooth_turning += other.smooth_turning
+        self.interior_edges += other.interior_edges
+        self.non_manifold_edges += other.non_manifold_edges
+        self.settled_open_edges += other.settled_open_edges
+        other._settle(keep_open=True)
+        for records in other.pending:
+            self._hold(records)
+
+    def to_partial(self):
+        """
+        Returns the state as a JSON-serializable dict. The open edges, matched within this
+        accumulator first, travel as one base64 blob of OPEN_EDGE_DTYPE records.
+        """
+        self._settle(keep_open=True)
+        open_edges = numpy.concatenate(self.pending) if self.pending else numpy.empty(0, dtype=OPEN_EDGE_DTYPE)
+        return {
+            "histogram_mm": self.histogram_mm.tolist(),
+            "sharp_edge_length": self.sharp_edge_length,
+            "smooth_turning": self.smooth_turning,
+            "interior_edges": self.interior_edges,
+            "non_manifold_edges": self.non_manifold_edges,
+            "settled_open_edges": self.settled_open_edges,
+            "open_edges": base64.b64encode(open_edges.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_partial(cls, partial):
+        accumulator = cls()
+        accumulator.histogram_mm = numpy.asarray(partial["histogram_mm"], dtype=numpy.float64)
+        accumulator.sharp_edge_length = float(partial["sharp_edge_length"])
+        accumulator.smooth_turning = float(partial["smooth_turning"])
+        accumulator.interior_edges = int(partial["interior_edges"])
+        accumulator.non_manifold_edges = int(partial["non_manifold_edges"])
+        accumulator.settled_open_edges = int(partial["settled_open_edges"])
+        accumulator._hold(numpy.frombuffer(base64.b64decode(partial["open_edges"]), dtype=OPEN_EDGE_DTYPE))
+        return accumulator
+
+    def result(self):
+        """Raw edge features in mm (histogram keyed by 'low-high' degrees). Settles all pending edges."""
+        self._settle(keep_open=False)
+        return {
+            "dihedral_histogram_mm": {
+                f"{low:g}-{high:g}": float(length)
+                for low, high, length in zip(DIHEDRAL_BIN_DEGREES, DIHEDRAL_BIN_DEGREES[1:], self.histogram_mm)
+            },
+            "sharp_edge_length_mm": self.sharp_edge_length,
+            "smooth_turning_mm": self.smooth_turning,
+            "interior_edges": self.interior_edges,
+            "open_edges": self.settled_open_edges,
+            "non_manifold_edges": self.non_manifold_edges,
+        }
+
+
+def complexity_from_features(edge_features, surface_area_mm2, volume_mm3, diagonal_mm):
+    """
+    Combines scale-free feature terms into a score in [0, 1] and returns (score, terms):
+    sharp edge length and smooth turning in bounding-box diagonals, and surface area over
+    volume^(2/3) above a sphere's (thin walls, pockets and fins raise it). Each term saturates
+    as 1 - exp(-x / scale); an open mesh (no volume) gets the maximum surface term.
+    """
+    diagonal_mm = max(diagonal_mm, 1e-9)
+    volume_mm3 = abs(volume_mm3)
+    surface_ratio = surface_area_mm2 / volume_mm3 ** (2.0 / 3.0) if volume_mm3 > 0 else math.inf
+    terms = {
+        "sharp_edges": 1.0 - math.exp(-edge_features["sharp_edge_length_mm"] / diagonal_mm / SHARP_EDGE_SCALE),
+        "smooth_turning": 1.0 - math.exp(-edge_features["smooth_turning_mm"] / diagonal_mm / SMOOTH_TURNING_SCALE),
+        "surface_ratio": 1.0 - math.exp(-max(surface_ratio - SPHERE_SURFACE_RATIO, 0.0) / SURFACE_RATIO_SCALE),
+    }
+    score = sum(COMPLEXITY_WEIGHTS[name] * value for name, value in terms.items())
+    return min(max(score, 0.0), 1.0), terms
@@ -0,0 +1,300 @@
+"""
+Registry of process-specific metric kernels fed from one pass over a mesh's triangle chunks.
+
+A kernel is a small accumulator class (see MeshKernel) registered with register_kernel, which
+records the per-chunk intermediates it reads (INTERMEDIATES: vertices, edges, cross products,
+areas, normals, edge lengths) and the manufacturing processes it serves. A KernelScheduler is
+fed each chunk by the MeshMetricsAccumulator, along with the cross products and areas it has
+already computed for its own metrics; the scheduler derives the other inputs its kernels declared
+on demand, each intermediate once per chunk (normals reuse the cross products and areas), and
+passes them to every kernel. Time spent per intermediate and per kernel is accumulated across
+chunks, so a slow kernel shows up in the logs by name.
+
+Kernel state is a dict of NumPy sums, so kernels merge across shards the same way as
+MeshMetricsAccumulator (merge / to_partial / from_partial). Normals follow the file's winding;
+kernels that need outward normals should treat them as unsigned.
+
+Which kernels run for a design is chosen by process: kernels_for_processes picks the ones that
+serve any of the given processes (processes_for_material maps a design's material to those).
+"""
+import abc
+import time
+
+import numpy
+
+from .mesh_metrics import quantize_value
+
+# Per-chunk intermediates: name -> (names it is derived from, function of those). Defined in
+# dependency order, so computing them in this order never needs a missing input.
+INTERMEDIATES = {
+    "vertices": ((), None), # The (n, 3, 3) float64 chunk itself
+    "edges": (("vertices",), lambda vertices: numpy.roll(vertices, -1, axis=1) - vertices), # v1-v0, v2-v1, v0-v2
+    "cross": (("edges",), lambda edges: numpy.cross(edges[:, 0], -edges[:, 2])), # (v1-v0) x (v2-v0)
+    "areas": (("cross",), lambda cross: 0.5 * numpy.sqrt(numpy.einsum('ij,ij->i', cross, cross))),
+    "normals": (
+        ("cross", "areas"),
+        lambda cross, areas: numpy.divide(cross, 2.0 * areas[:, None], out=numpy.zeros_like(cross), where=areas[:, None] > 0),
+    ),
+    "edge_lengths": (("edges",), lambda edges: numpy.sqrt(numpy.einsum('ijk,ijk->ij', edges, edges))),
+}
+PROCESSES = ("cnc", "fdm", "sla", "sheet_metal")
+# Default material -> processes map (matched case-insensitively); materials not listed run every kernel.
+MATERIAL_PROCESSES = {
+    "pla": ("fdm",),
+    "abs": ("fdm", "cnc"),
+    "petg": ("fdm",),
+    "nylon": ("fdm", "cnc"),
+    "resin": ("sla",),
+    "al-6061": ("cnc", "sheet_metal"),
+    "al-5052": ("sheet_metal", "cnc"),
+    "steel": ("cnc", "sheet_metal"),
+    "stainless steel": ("cnc", "sheet_metal"),
+    "brass": ("cnc",),
+    "pom": ("cnc",),
+}
+
+# name -> kernel class, filled by register_kernel
+KERNELS = {}
+
+
+def register_kernel(name, inputs, processes=PROCESSES):
+    """
+    Class decorator adding a MeshKernel subclass to KERNELS under name. inputs are the
+    INTERMEDIATES its add() takes as keyword arguments; processes those it is selected for.
+    Raises ValueError for a duplicate name, an unknown intermediate or an unknown process.
+    """
+    unknown_inputs = [item for item in inputs if item not in INTERMEDIATES]
+    if unknown_inputs:
+        raise ValueError(f"Kernel '{name}' declares unknown inputs: {', '.join(unknown_inputs)}.")
+    unknown_processes = [process for process in processes if process not in PROCESSES]
+    if unknown_processes:
+        raise ValueError(f"Kernel '{name}' declares unknown processes: {', '.join(unknown_processes)}.")
+
+    def register(kernel_class):
+        if name in KERNELS:
+            raise ValueError(f"A kernel named '{name}' is already registered.")
+        kernel_class.name, kernel_class.inputs, kernel_class.processes = name, tuple(inputs), tuple(processes)
+        KERNELS[name] = kernel_class
+        return kernel_class
+    return register
+
+
+def processes_for_material(material, material_processes=MATERIAL_PROCESSES):
+    """Processes a material is made with, or None (every process) for materials not in the map."""
+    return material_processes.get((material or "").strip().lower())
+
+
+def kernels_for_processes(processes=None):
+    """Sorted names of the registered kernels serving any of processes (all of them for None)."""
+    if processes is None:
+        return sorted(KERNELS)
+    return sorted(name for name, kernel_class in KERNELS.items() if set(kernel_class.processes) & set(processes))
+
+
+class MeshKernel(abc.ABC):
+    """
+    Base class of registered kernels. State lives in self.totals (name -> float or NumPy array
+    of running sums), which merge / to_partial / from_partial handle generically; subclasses
+    set the initial totals in __init__, accumulate them in add(**inputs) and format result().
+    """
+    name, inputs, processes = None, (), () # Set by register_kernel
+
+    def __init__(self):
+        self.totals = {}
+
+    @abc.abstractmethod
+    def add(self, **inputs):
+        """Accumulates one chunk, given the kernel's declared inputs as keyword arguments."""
+
+    def merge(self, other):
+        """Folds another instance of the same kernel (e.g. from another shard) into this one."""
+        for key, value in other.totals.items():
+            self.totals[key] = self.totals[key] + value
+
+    def to_partial(self):
+        return {key: numpy.asarray(value).tolist() for key, value in self.totals.items()}
+
+    @classmethod
+    def from_partial(cls, partial):
+        kernel = cls()
+        for key, value in partial.items():
+            kernel.totals[key] = numpy.asarray(value, dtype=numpy.float64) if isinstance(value, list) else float(value)
+        return kernel
+
+    @abc.abstractmethod
+    def result(self):
+        """The kernel's JSON-serializable result for geometric_data["kernels"]."""
+
+
+class KernelScheduler:
+    """
+    Runs the kernels named in kernel_names (every registered kernel for None) over the chunks
+    passed to add (MeshMetricsAccumulator(kernels=...) does that). intermediate_seconds and kernel_seconds map
+    each intermediate / kernel name to the time spent in it so far. Raises ValueError for
+    unregistered names.
+    """
+
+    def __init__(self, kernel_names=None):
+        kernel_names = sorted(KERNELS) if kernel_names is None else list(kernel_names)
+        unknown = [name for name in kernel_names if name not in KERNELS]
+        if unknown:
+            raise ValueError(f"Unknown analysis kernels: {', '.join(unknown)}.")
+        self.kernels = {name: KERNELS[name]() for name in kernel_names}
+        # Every intermediate some kernel reads, with its own inputs, in INTERMEDIATES order.
+        needed = set()
+        for kernel in self.kernels.values():
+            needed.update(kernel.inputs)
+        for name in reversed(list(INTERMEDIATES)):
+            if name in needed:
+                needed.update(INTERMEDIATES[name][0])
+        self.intermediates = [name for name in INTERMEDIATES if name in needed]
+        self.intermediate_seconds = dict.fromkeys(self.intermediates, 0.0)
+        self.kernel_seconds = dict.fromkeys(self.kernels, 0.0)
+
+    def add(self, vectors, **precomputed):
+        """
+        Feeds one chunk to every kernel. precomputed holds intermediates the caller already has
+        for this chunk, by INTERMEDIATES name (the accumulator passes cross and areas); the
+        others are computed once each, and only when a kernel needs them.
+        """
+        if not len(vectors) or not self.kernels:
+            return
+        chunk = {"vertices": numpy.asarray(vectors, dtype=numpy.float64), **precomputed}
+        for name, kernel in self.kernels.items():
+            inputs = {item: self._intermediate(item, chunk) for item in kernel.inputs}
+            started_at = time.perf_counter()
+            kernel.add(**inputs)
+            self.kernel_seconds[name] += time.perf_counter() - started_at
+
+    def _intermediate(self, name, chunk):
+        if name not in chunk:
+            dependencies, function = INTERMEDIATES[name]
+            values = [self._intermediate(dependency, chunk) for dependency in dependencies]
+            started_at = time.perf_counter()
+            chunk[name] = function(*values)
+            self.intermediate_seconds[name] += time.perf_counter() - started_at
+        return chunk[name]
+
+    def merge(self, other):
+        for name, kernel in self.kernels.items():
+            kernel.merge(other.kernels[name])
+        for timings, other_timings in ((self.intermediate_seconds, other.intermediate_seconds), (self.kernel_seconds, other.kernel_seconds)):
+            for name, seconds in other_timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+
+    def to_partial(self):
+        """JSON-serializable kernel states and timings (for passing between Celery tasks)."""
+        return {
+            "kernels": {name: kernel.to_partial() for name, kernel in self.kernels.items()},
+            "intermediate_seconds": self.intermediate_seconds,
+            "kernel_seconds": self.kernel_seconds,
+        }
+
+    @classmethod
+    def from_partial(cls, partial):
+        scheduler = cls(list(partial["kernels"]))
+        scheduler.kernels = {name: KERNELS[name].from_partial(state) for name, state in partial["kernels"].items()}
+        scheduler.intermediate_seconds.update(partial["intermediate_seconds"])
+        scheduler.kernel_seconds.update(partial["kernel_seconds"])
+        return scheduler
+
+    def results(self):
+        """Each kernel's result, by name."""
+        return {name: kernel.result() for name, kernel in self.kernels.items()}
+
+    def timings_ms(self):
+        """Time spent so far per intermediate and per kernel, in milliseconds: {"intermediates": {...}, "kernels": {...}}."""
+        return {
+            "intermediates": {name: round(seconds * 1000.0, 1) for name, seconds in self.intermediate_seconds.items()},
+            "kernels": {name: round(seconds * 1000.0, 1) for name, seconds in self.kernel_seconds.items()},
+        }
+
+
+# --- Kernels ---
+
+# Facets whose unit normal is within this angle of a principal axis count as axis-aligned.
+AXIS_ALIGNED_DEGREES = 1.0
+# Band width of the FDM/SLA slope histogram.
+SLOPE_BAND_DEGREES = 15.0
+
+
+@register_kernel("axis_aligned_area", inputs=("normals", "areas"), processes=("cnc", "sheet_metal"))
+class AxisAlignedAreaKernel(MeshKernel):
+    """
+    Surface area facing along each principal axis (+-x, +-y, +-z, within AXIS_ALIGNED_DEGREES):
+    faces a flat end mill or a press brake makes without tilting the part. The rest is sloped
+    or curved surface (3D contouring, or bends for sheet metal).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.totals = {"axis_area": numpy.zeros(3), "area": 0.0}
+
+    def add(self, normals, areas):
+        aligned = numpy.abs(normals) >= numpy.cos(numpy.radians(AXIS_ALIGNED_DEGREES)) # (n, 3)
+        self.totals["axis_area"] = self.totals["axis_area"] + (aligned * areas[:, None]).sum(axis=0)
+        self.totals["area"] += float(areas.sum())
+
+    def result(self):
+        area = self.totals["area"]
+        return {
+            "axis_area_cm2": [quantize_value(value / 100.0, "0.01") for value in self.totals["axis_area"]], # x, y, z
+            "aligned_fraction": quantize_value(self.totals["axis_area"].sum() / area, "0.0001") if area else 0.0,
+        }
+
+
+@register_kernel("slope_histogram", inputs=("normals", "areas"), processes=("fdm", "sla"))
+class SlopeHistogramKernel(MeshKernel):
+    """
+    Surface area per SLOPE_BAND_DEGREES band of the angle between facet normal and the z axis
+    (0 = facing straight up or down, 90 = vertical wall), folded since the file's winding may
+    be reversed. Shallow slopes are where layer stair-stepping shows on printed parts.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.totals = {"band_area": numpy.zeros(int(round(90.0 / SLOPE_BAND_DEGREES)))}
+
+    def add(self, normals, areas):
+        angles = numpy.degrees(numpy.arccos(numpy.clip(numpy.abs(normals[:, 2]), 0.0, 1.0)))
+        bands = numpy.minimum((angles // SLOPE_BAND_DEGREES).astype(numpy.int64), len(self.totals["band_area"]) - 1)
+        self.totals["band_area"] = self.totals["band_area"] + numpy.bincount(
+            bands, weights=areas, minlength=len(self.totals["band_area"])
+        )
+
+    def result(self):
+        return {
+            "band_degrees": SLOPE_BAND_DEGREES,
+            "band_area_cm2": [quantize_value(value / 100.0, "0.01") for value in self.totals["band_area"]],
+        }
+
+
+@register_kernel("tessellation", inputs=("edge_lengths",))
+class TessellationKernel(MeshKernel):
+    """Shortest, mean and longest facet edge: how finely the file is tessellated."""
+
+    def __init__(self):
+        super().__init__()
+        self.totals = {"min": numpy.inf, "max": 0.0, "sum": 0.0, "count": 0.0}
+
+    def add(self, edge_lengths):
+        self.totals["min"] = min(self.totals["min"], float(edge_lengths.min()))
+        self.totals["max"] = max(self.totals["max"], float(edge_lengths.max()))
+        self.totals["sum"] += float(edge_lengths.sum())
+        self.totals["count"] += float(edge_lengths.size)
+
+    def merge(self, other):
+        # min/max are not sums
+        self.totals["min"] = min(self.totals["min"], other.totals["min"])
+        self.totals["max"] = max(self.totals["max"], other.totals["max"])
+        self.totals["sum"] += other.totals["sum"]
+        self.totals["count"] += other.totals["count"]
+
+    def result(self):
+        if not self.totals["count"]:
+            return {"min_mm": 0.0, "mean_mm": 0.0, "max_mm": 0.0}
+        return {
+            "min_mm": quantize_value(self.totals["min"], "0.0001"),
+            "mean_mm": quantize_value(self.totals["sum"] / self.totals["count"], "0.0001"),
+            "max_mm": quantize_value(self.totals["max"], "0.0001"),
+        }
@@ -0,0 +1,199 @@
+"""
+Fused metric kernel for triangle meshes, independent of the file format.
+
+Readers (binary/ASCII STL today) feed (n, 3, 3) float64 vertex chunks into a
+MeshMetricsAccumulator. Each chunk's edge cross products are computed once and
+every metric (signed volume, surface area, bounding box, normal statistics) is
+derived from them, all in float64. The chunk's vertices are also reduced to support
+points for the oriented bounding box (see oriented_bbox) and to convex hull candidates
+(see convex_hull), and the cross products double as facet normals for edge matching and
+the feature-based complexity score (see mesh_features). Conversion to Decimal and rounding happens only
+in format_geometric_data, at the boundary where results are stored on a Design.
+"""
+import logging
+from decimal import Decimal
+
+import numpy
+
+from .convex_hull import HULL_MAX_POINTS, convex_hull, decimate_hull_points, points_outside_hull
+from .mesh_features import COMPLEXITY_VERSION, EdgeAdjacencyAccumulator, complexity_from_features
+from .oriented_bbox import fit_oriented_bbox, reduce_to_support_points
+
+logger = logging.getLogger(__name__)
+
+# Facets whose doubled area (|cross product|) is at or below this are counted as degenerate.
+DEGENERATE_AREA_EPSILON = 1e-12
+
+
+class MeshMetricsAccumulator:
+    """
+    Running reduction of mesh metrics over vertex chunks (one cross product per facet).
+    kernels, an optional mesh_kernels.KernelScheduler, is fed every chunk along with its cross
+    products and areas, so the process-specific kernels do not compute them again.
+    """
+
+    def __init__(self, kernels=None):
+        self.kernels = kernels
+        self.volume_6x = 0.0
+        self.area_2x = 0.0
+        self.num_triangles = 0
+        self.degenerate_triangles = 0
+        self.normal_sum = numpy.zeros(3) # Sum of area-weighted (unnormalized) facet normals
+        self.min_coords = numpy.full(3, numpy.inf)
+        self.max_coords = numpy.full(3, -numpy.inf)
+        self.support_points = numpy.empty((0, 3)) # Extreme vertices along oriented_bbox.SUPPORT_DIRECTIONS
+        self.hull_candidates = numpy.empty((0, 3)) # Vertices outside the support points' hull when seen
+        self.edges = EdgeAdjacencyAccumulator() # Dihedral angles of matched edges, plus still-open edges
+
+    def _add_support_points(self, points):
+        self.support_points = reduce_to_support_points(numpy.concatenate([self.support_points, points]))
+
+    def _add_hull_candidates(self, points):
+        if len(points):
+            self.hull_candidates = numpy.concatenate([self.hull_candidates, points])
+            if len(self.hull_candidates) > 4 * HULL_MAX_POINTS: # Decimation is associative, so it can run early
+                self.hull_candidates = decimate_hull_points(self.hull_candidates)
+
+    def add(self, vectors):
+        """Adds an (n, 3, 3) array of triangle vertices."""
+        if not len(vectors):
+            return
+        v0, v1, v2 = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+        cross = numpy.cross(v1 - v0, v2 - v0)
+        doubled_areas = numpy.sqrt(numpy.einsum('ij,ij->i', cross, cross))
+
+        # Divergence theorem: the same signed-volume form as numpy-stl's get_mass_properties.
+        self.volume_6x += float(numpy.dot(cross[:, 0], v0[:, 0] + v1[:, 0] + v2[:, 0]))
+        self.area_2x += float(doubled_areas.sum())
+        self.degenerate_triangles += int(numpy.count_nonzero(doubled_areas <= DEGENERATE_AREA_EPSILON))
+        self.normal_sum += cross.sum(axis=0)
+        flat = vectors.reshape(-1, 3)
+        numpy.minimum(self.min_coords, flat.min(axis=0), out=self.min_coords)
+        numpy.maximum(self.max_coords, flat.max(axis=0), out=self.max_coords)
+        self._add_support_points(reduce_to_support_points(flat))
+        self._add_hull_candidates(points_outside_hull(flat, self.support_points))
+        self.edges.add(vectors, cross)
+        self.num_triangles += vectors.shape[0]
+        if self.kernels is not None:
+            self.kernels.add(vectors, cross=cross, areas=0.5 * doubled_areas)
+
+    def merge(self, other):
+        """Folds another accumulator (e.g. one shard of the same mesh) into this one."""
+        self.volume_6x += other.volume_6x
+        self.area_2x += other.area_2x
+        self.num_triangles += other.num_triangles
+        self.degenerate_triangles += other.degenerate_triangles
+        self.normal_sum += other.normal_sum
+        numpy.minimum(self.min_coords, other.min_coords, out=self.min_coords)
+        numpy.maximum(self.max_coords, other.max_coords, out=self.max_coords)
+        self._add_support_points(other.support_points)
+        self._add_hull_candidates(other.hull_candidates)
+        self.edges.merge(other.edges)
+
+    def to_partial(self):
+        """Returns the running state as a JSON-serializable dict (for passing between Celery tasks)."""
+        return {
+            "volume_6x": self.volume_6x,
+            "area_2x": self.area_2x,
+            "num_triangles": self.num_triangles,
+            "degenerate_triangles": self.degenerate_triangles,
+            "normal_sum": self.normal_sum.tolist(),
+            "min_coords": self.min_coords.tolist(),
+            "max_coords": self.max_coords.tolist(),
+            "support_points": self.support_points.tolist(),
+            "hull_candidates": decimate_hull_points(self.hull_candidates).tolist(), # Bounds the message size
+            "edges": self.edges.to_partial(),
+        }
+
+    @classmethod
+    def from_partial(cls, partial):
+        accumulator = cls()
+        accumulator.volume_6x = float(partial["volume_6x"])
+        accumulator.area_2x = float(partial["area_2x"])
+        accumulator.num_triangles = int(partial["num_triangles"])
+        accumulator.degenerate_triangles = int(partial["degenerate_triangles"])
+        accumulator.normal_sum = numpy.asarray(partial["normal_sum"], dtype=numpy.float64)
+        accumulator.min_coords = numpy.asarray(partial["min_coords"], dtype=numpy.float64)
+        accumulator.max_coords = numpy.asarray(partial["max_coords"], dtype=numpy.float64)
+        accumulator.support_points = numpy.asarray(partial["support_points"], dtype=numpy.float64).reshape(-1, 3)
+        accumulator.hull_candidates = numpy.asarray(partial["hull_candidates"], dtype=numpy.float64).reshape(-1, 3)
+        accumulator.edges = EdgeAdjacencyAccumulator.from_partial(partial["edges"])
+        return accumulator
+
+    def result(self, source_name):
+        """
+        Returns the raw float metrics (mm units) as a dict. Raises ValueError for an empty mesh.
+        normal_closure_error is |sum of area-weighted normals| / total area: 0 for a closed
+        surface, growing towards 1 as the surface has holes or inconsistently wound facets.
+        obb_extents_mm are the edge lengths of the oriented bounding box, largest first, and
+        stock_volume_mm3 is that box's volume (the smallest rectangular stock the part fits in).
+        edge_features are the dihedral-angle statistics from mesh_features.
+        """
+        if self.num_triangles == 0:
+            raise ValueError(f"Mesh contains no triangles: {source_name}")
+        logger.debug(f"Reduced {self.num_triangles} triangles from {source_name}.")
+        hull = convex_hull(decimate_hull_points(numpy.concatenate([self.support_points, self.hull_candidates])))
+        obb_extents = fit_oriented_bbox(self.support_points, extent_points=hull.vertices)["extents"]
+        aabb_extents = sorted((self.max_coords - self.min_coords).tolist(), reverse=True)
+        if numpy.prod(aabb_extents) <= numpy.prod(obb_extents): # Already tight in the file's own axes
+            obb_extents = aabb_extents
+        return {
+            "volume_mm3": self.volume_6x / 6.0,
+            "surface_area_mm2": self.area_2x / 2.0,
+            "min_mm": self.min_coords.tolist(),
+            "max_mm": self.max_coords.tolist(),
+            "obb_extents_mm": obb_extents,
+            "convex_hull_volume_mm3": hull.volume,
+            "stock_volume_mm3": float(numpy.prod(obb_extents)),
+            "num_triangles": self.num_triangles,
+            "degenerate_triangles": self.degenerate_triangles,
+            "normal_closure_error": float(numpy.linalg.norm(self.normal_sum) / self.area_2x) if self.area_2x else 0.0,
+            "edge_features": self.edges.result(),
+        }
+
+
+def quantize_value(value, places):
+    """Rounds a float to the given Decimal exponent (e.g. "0.01") and returns it as a float."""
+    return float(Decimal(repr(float(value))).quantize(Decimal(places)))
+
+
+def format_geometric_data(metrics, analysis_engine):
+    """
+    Converts raw metrics (mm units, from MeshMetricsAccumulator.result) into the geometric_data
+    dict stored on a Design. This is the only place values pass through Decimal for rounding.
+    """
+    extents = numpy.asarray(metrics["max_mm"], dtype=numpy.float64) - numpy.asarray(metrics["min_mm"], dtype=numpy.float64)
+    num_triangles = metrics["num_triangles"]
+    # Part volume is taken unsigned here: inward-wound meshes give a negative signed volume.
+    part_volume_mm3 = abs(metrics["volume_mm3"])
+    # Complexity from sharp edges, curvature and surface/volume, all independent of tessellation
+    complexity_score, complexity_terms = complexity_from_features(
+        metrics["edge_features"], metrics["surface_area_mm2"], part_volume_mm3, float(numpy.linalg.norm(extents))
+    )
+    edge_features = metrics["edge_features"]
+
+    return {
+        "volume_cm3": quantize_value(part_volume_mm3 / 1000.0, "0.01"), # 1 cm^3 = 1000 mm^3
+        "bbox_mm": [quantize_value(extent, "0.1") for extent in extents],
+        # Minimum-volume oriented box, largest edge first; size matching prefers it to bbox_mm
+        "obb_mm": [quantize_value(extent, "0.1") for extent in metrics["obb_extents_mm"]],
+        "surface_area_cm2": quantize_value(metrics["surface_area_mm2"] / 100.0, "0.01"), # 1 cm^2 = 100 mm^2
+        # Machining volumes: convex hull, rectangular stock (the oriented bbox) and stock minus part
+        "convex_hull_volume_cm3": quantize_value(metrics["convex_hull_volume_mm3"] / 1000.0, "0.01"),
+        "stock_volume_cm3": quantize_value(metrics["stock_volume_mm3"] / 1000.0, "0.01"),
+        "removed_volume_cm3": quantize_value(max(metrics["stock_volume_mm3"] - part_volume_mm3, 0.0) / 1000.0, "0.01"),
+        "complexity_score": quantize_value(complexity_score, "0.01"),
+        "complexity_version": COMPLEXITY_VERSION, # Scores are only comparable within one version
+        "complexity_features": {
+            "sharp_edge_length_mm": quantize_value(edge_features["sharp_edge_length_mm"], "0.1"),
+            "smooth_turning_mm": quantize_value(edge_features["smooth_turning_mm"], "0.1"),
+            "dihedral_histogram_mm": {
+                bin_name: quantize_value(length, "0.1") for bin_name, length in edge_features["dihedral_histogram_mm"].items()
+            },
+            "terms": {name: quantize_value(value, "0.001") for name, value in complexity_terms.items()},
+        },
+        "num_triangles": num_triangles,
+        "degenerate_triangles": metrics["degenerate_triangles"],
+        "normal_closure_error": quantize_value(metrics["normal_closure_error"], "0.0001"),
+        "analysis_engine": analysis_engine
+    }
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("designs", "0002_alter_design_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="design",
+            name="analysis_lease_token",
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="design",
+            name="analysis_leased_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name="design",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending_analysis", "Pending Analysis"),
+                    ("analyzing", "Analyzing"),
+                    ("analysis_complete", "Analysis Complete"),
+                    ("analysis_failed", "Analysis Failed"),
+                    ("quoted", "Quoted"),
+                    ("ordered", "Ordered"),
+                ],
+                default="pending_analysis",
+                max_length=20,
+            ),
+        ),
+    ]
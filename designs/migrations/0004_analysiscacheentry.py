@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("designs", "0003_design_analysis_lease"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalysisCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("content_digest", models.CharField(max_length=255)),
+                ("engine_version", models.CharField(max_length=50)),
+                ("geometric_data", models.JSONField()),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("last_used_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "verbose_name": "Analysis Cache Entry",
+                "verbose_name_plural": "Analysis Cache Entries",
+                "db_table": "AnalysisCacheEntries",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("content_digest", "engine_version"),
+                        name="unique_analysis_cache_key",
+                    )
+                ],
+            },
+        ),
+    ]
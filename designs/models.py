@@ -6,6 +6,7 @@ from django.utils.translation import gettext_lazy as _
 # From spec: CREATE TYPE design_status AS ENUM ('pending_analysis', 'analysis_complete', 'quoted', 'ordered');
 class DesignStatus(models.TextChoices):
     PENDING_ANALYSIS = 'pending_analysis', _('Pending Analysis')
+    ANALYZING = 'analyzing', _('Analyzing') # Claimed by an analysis worker (see analysis_leased_at)
     ANALYSIS_COMPLETE = 'analysis_complete', _('Analysis Complete')
     ANALYSIS_FAILED = 'analysis_failed', _('Analysis Failed') # New status
     QUOTED = 'quoted', _('Quoted')
@@ -34,6 +35,11 @@ class Design(models.Model):
         default=DesignStatus.PENDING_ANALYSIS,
     )
     geometric_data = models.JSONField(blank=True, null=True) # To store analysis results
+    # Analysis lease: set when a worker claims the design (status ANALYZING) so the
+    # download/parse can run without holding a row lock. The token is compared on the
+    # final write; a lease older than CAD_ANALYSIS_LEASE_SECONDS can be reclaimed.
+    analysis_lease_token = models.UUIDField(blank=True, null=True, editable=False)
+    analysis_leased_at = models.DateTimeField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True) # Good practice, though not in spec explicitly for this table
 
@@ -47,3 +53,28 @@ class Design(models.Model):
         ordering = ['-created_at']
         # Django automatically creates an index on ForeignKey fields (like customer_id),
         # so CREATE INDEX idx_designs_customer_id ON Designs(customer_id); is covered.
+
+
+class AnalysisCacheEntry(models.Model):
+    """
+    Content-addressed cache of CAD analysis results, so re-uploads of the same file
+    (under a new S3 key) skip the download and parse. Keyed by content digest and
+    analysis engine version; see designs.analysis_cache for lookup and retention.
+    """
+    content_digest = models.CharField(max_length=255) # e.g. 'sha256:<hex>' or 's3-etag:<etag>'
+    engine_version = models.CharField(max_length=50)
+    geometric_data = models.JSONField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True) # Drives LRU eviction
+
+    def __str__(self):
+        return f"{self.content_digest} (engine v{self.engine_version})"
+
+    class Meta:
+        db_table = 'AnalysisCacheEntries'
+        verbose_name = 'Analysis Cache Entry'
+        verbose_name_plural = 'Analysis Cache Entries'
+        constraints = [
+            models.UniqueConstraint(fields=['content_digest', 'engine_version'], name='unique_analysis_cache_key'),
+        ]
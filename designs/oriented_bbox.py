@@ -0,0 +1,170 @@
+"""
+Minimum-volume oriented bounding box (OBB) for meshes and point clouds.
+
+A box's extent along any direction is decided by the extreme vertices in that
+direction, so the mesh is first reduced to its support points: the vertices with the
+largest and smallest projection on each of a fixed set of SUPPORT_DIRECTIONS. This
+reduction is a blocked matrix product per chunk and is mergeable, so it runs inside
+the streaming metric pass (and across shards). The search below then only ever sees
+at most 2 * len(SUPPORT_DIRECTIONS) points, so its cost does not grow with the mesh.
+
+The search tries each principal axis of the support points (PCA) and each support
+direction as the box's "up" axis, and for each one finds the minimum-area rectangle of
+the points projected onto the perpendicular plane with rotating calipers (one
+candidate rotation per 2D convex hull edge, evaluated together in NumPy).
+The coordinate axes are among the support directions, so the chosen frame is never worse
+than the axis-aligned one. Vertices that are extreme only between support directions
+(e.g. on a round face) are missed by the support points, so callers that have the convex
+hull pass its vertices as extent_points and the box's extents are measured on those.
+"""
+import numpy
+
+# Vertices projected per block; small blocks keep the (directions, rows) product in cache.
+PROJECTION_BLOCK_ROWS = 2048
+FIBONACCI_DIRECTIONS = 51
+
+
+def _build_support_directions():
+    # Axes, face diagonals and body diagonals (one of each antipodal pair), then a Fibonacci
+    # spiral over the upper hemisphere for the rest; min and max projections cover both signs.
+    directions = [[1, 0, 0], [0, 1, 0], [0, 0, 1],
+                  [1, 1, 0], [1, -1, 0], [1, 0, 1], [1, 0, -1], [0, 1, 1], [0, 1, -1],
+                  [1, 1, 1], [1, 1, -1], [1, -1, 1], [-1, 1, 1]]
+    golden_angle = numpy.pi * (3.0 - numpy.sqrt(5.0))
+    for i in range(FIBONACCI_DIRECTIONS):
+        z = (i + 0.5) / FIBONACCI_DIRECTIONS
+        r = numpy.sqrt(1.0 - z * z)
+        directions.append([r * numpy.cos(i * golden_angle), r * numpy.sin(i * golden_angle), z])
+    directions = numpy.asarray(directions, dtype=numpy.float64)
+    return directions / numpy.linalg.norm(directions, axis=1)[:, None]
+
+
+SUPPORT_DIRECTIONS = _build_support_directions()
+# Candidate selection runs in float32 (STL coordinates are float32 to begin with); the
+# final pick among candidates is in float64.
+_SUPPORT_DIRECTIONS_FLOAT32 = SUPPORT_DIRECTIONS.astype(numpy.float32)
+
+
+def reduce_to_support_points(points):
+    """
+    Returns the distinct rows of an (n, 3) array that are extreme (max or min) along some
+    support direction; at most 2 * len(SUPPORT_DIRECTIONS) rows, sorted.
+    """
+    directions, directions_float32 = SUPPORT_DIRECTIONS, _SUPPORT_DIRECTIONS_FLOAT32
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+    if len(points) <= 2 * len(directions):
+        candidates = points
+    else:
+        picked = []
+        points_float32 = points.astype(numpy.float32)
+        for start in range(0, len(points), PROJECTION_BLOCK_ROWS):
+            block = points_float32[start:start + PROJECTION_BLOCK_ROWS]
+            projections = directions_float32 @ block.T # (directions, rows): row-wise reductions are contiguous
+            picked.append(start + projections.argmax(axis=1))
+            picked.append(start + projections.argmin(axis=1))
+        candidates = points[numpy.unique(numpy.concatenate(picked))]
+    if not len(candidates):
+        return candidates
+    # Always reduce to the strict extremes (in float64), so merging reductions of parts gives
+    # the reduction of the whole.
+    rows = numpy.arange(len(directions))
+    best_high, best_low = numpy.full(len(directions), -numpy.inf), numpy.full(len(directions), numpy.inf)
+    high_index, low_index = numpy.zeros(len(directions), dtype=numpy.int64), numpy.zeros(len(directions), dtype=numpy.int64)
+    for start in range(0, len(candidates), PROJECTION_BLOCK_ROWS):
+        projections = directions @ candidates[start:start + PROJECTION_BLOCK_ROWS].T
+        block_high, block_low = projections.argmax(axis=1), projections.argmin(axis=1)
+        higher = projections[rows, block_high] > best_high
+        lower = projections[rows, block_low] < best_low
+        best_high[higher], high_index[higher] = projections[rows, block_high][higher], start + block_high[higher]
+        best_low[lower], low_index[lower] = projections[rows, block_low][lower], start + block_low[lower]
+    return numpy.unique(candidates[numpy.concatenate([high_index, low_index])], axis=0)
+
+
+def _convex_hull_2d(points):
+    """Andrew's monotone chain; returns hull vertices of an (n, 2) array in counter-clockwise order."""
+    points = numpy.unique(points, axis=0) # Sorted by x, then y
+    if len(points) < 3:
+        return points
+
+    def half_hull(ordered):
+        hull = []
+        for point in ordered:
+            while len(hull) >= 2 and (
+                (hull[-1][0] - hull[-2][0]) * (point[1] - hull[-2][1])
+                - (hull[-1][1] - hull[-2][1]) * (point[0] - hull[-2][0])
+            ) <= 0:
+                hull.pop()
+            hull.append(point)
+        return hull[:-1]
+
+    return numpy.asarray(half_hull(points) + half_hull(points[::-1]))
+
+
+def _min_area_rectangle(points):
+    """Returns (area, angle, width, depth) of the smallest rectangle around (n, 2) points."""
+    hull = _convex_hull_2d(points)
+    if len(hull) < 3:
+        angles = numpy.zeros(1)
+        if len(hull) == 2: # Collinear points: align with the segment
+            edge = hull[1] - hull[0]
+            angles[0] = numpy.arctan2(edge[1], edge[0])
+    else:
+        edges = numpy.roll(hull, -1, axis=0) - hull
+        # Rectangles repeat every quarter turn, so each edge gives one candidate rotation.
+        angles = numpy.unique(numpy.mod(numpy.arctan2(edges[:, 1], edges[:, 0]), numpy.pi / 2))
+    cos, sin = numpy.cos(angles)[:, None], numpy.sin(angles)[:, None]
+    rotated_x = hull[:, 0] * cos + hull[:, 1] * sin # (angles, hull points)
+    rotated_y = hull[:, 1] * cos - hull[:, 0] * sin
+    widths = rotated_x.max(axis=1) - rotated_x.min(axis=1)
+    depths = rotated_y.max(axis=1) - rotated_y.min(axis=1)
+    best = int(numpy.argmin(widths * depths + 1e-12 * (widths + depths))) # Flat/linear: smallest perimeter wins
+    return widths[best] * depths[best], angles[best], widths[best], depths[best]
+
+
+def _perpendicular_basis(axis):
+    reference = numpy.eye(3)[int(numpy.argmin(numpy.abs(axis)))]
+    first = numpy.cross(axis, reference)
+    first /= numpy.linalg.norm(first)
+    return first, numpy.cross(axis, first)
+
+
+def fit_oriented_bbox(points, extent_points=None):
+    """
+    Fits a minimum-volume oriented box to (n, 3) points (normally support points from
+    reduce_to_support_points). The box's extents are then measured over extent_points if
+    given (e.g. convex hull vertices, which also cover what lies between support directions).
+    Returns {"extents": [3 floats, largest first], "axes": 3x3 list of unit row vectors in
+    the same order, "center": [x, y, z]}.
+    """
+    points = numpy.unique(numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3), axis=0)
+    if len(points) == 0:
+        raise ValueError("Cannot fit an oriented bounding box to an empty point set.")
+    centered = points - points.mean(axis=0)
+    if len(points) > 1:
+        _, principal_axes = numpy.linalg.eigh(centered.T @ centered)
+        up_axes = numpy.vstack([principal_axes.T, SUPPORT_DIRECTIONS])
+    else:
+        up_axes = SUPPORT_DIRECTIONS[:3]
+
+    best_key, best_axes = None, None
+    for up in up_axes:
+        first, second = _perpendicular_basis(up)
+        heights = centered @ up
+        height = heights.max() - heights.min()
+        area, angle, width, depth = _min_area_rectangle(centered @ numpy.column_stack([first, second]))
+        key = (area * height, width + depth + height)
+        if best_key is None or key < best_key:
+            cos, sin = numpy.cos(angle), numpy.sin(angle)
+            best_key = key
+            best_axes = numpy.vstack([cos * first + sin * second, cos * second - sin * first, up])
+
+    if extent_points is not None and len(extent_points):
+        points = numpy.concatenate([points, numpy.asarray(extent_points, dtype=numpy.float64).reshape(-1, 3)])
+    projections = points @ best_axes.T
+    low, high = projections.min(axis=0), projections.max(axis=0)
+    order = numpy.argsort(low - high) # Largest extent first
+    return {
+        "extents": (high - low)[order].tolist(),
+        "axes": best_axes[order].tolist(),
+        "center": (((low + high) / 2.0) @ best_axes).tolist(),
+    }
@@ -0,0 +1,87 @@
+"""
+Overhang and support-volume estimates for additive manufacturing, over candidate build orientations.
+
+For a build direction ("up"), a facet overhangs when it faces down more steeply than
+OVERHANG_DEGREES allows: a surface tilted a degrees from vertical has outward normal . up =
+-sin(a), so facets with normal . up < -sin(OVERHANG_DEGREES) need support, except those lying
+on the build plate. Every facet is tested against all CANDIDATE_DIRECTIONS at once with one
+(facets, directions) product per block.
+
+Support material fills the column under each overhanging point, down to the build plate or to
+the part below, whichever comes first. Support volume is estimated by Monte Carlo: surface
+points are sampled by area, and every (point, direction) pair whose facet overhangs casts one
+ray straight down against the part's BVH (see wall_thickness); all pairs go through the BVH
+as a single batch. Each sample stands for total area / samples of surface, projected onto the
+plate (times -normal . up) and extruded over the column height.
+"""
+import itertools
+
+import numpy
+
+from .wall_thickness import RELATIVE_RAY_OFFSET, TriangleBVH, mesh_diagonal, outward_normals, sample_surface
+
+# Downward-facing surfaces tilted more than this from vertical need support (the usual FDM rule).
+OVERHANG_DEGREES = 45.0
+# Facets within this distance of the build plate (relative to the mesh's size) rest on it.
+RELATIVE_PLATE_TOLERANCE = 1e-6
+# Facets (or vertices) projected onto all candidate directions per block.
+BLOCK_ROWS = 65536
+
+
+def _candidate_directions():
+    # The 26 directions towards the faces, edges and corners of a cube around the part,
+    # axes first (so ties between equally good orientations go to the simplest one).
+    axes = [[0, 0, 1], [0, 0, -1], [1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0]]
+    diagonals = [step for step in itertools.product((-1, 0, 1), repeat=3) if sum(map(abs, step)) >= 2]
+    directions = numpy.asarray(axes + diagonals, dtype=numpy.float64)
+    return directions / numpy.linalg.norm(directions, axis=1)[:, None]
+
+
+CANDIDATE_DIRECTIONS = _candidate_directions()
+
+
+def support_by_orientation(triangles, outward_sign, num_samples, directions=CANDIDATE_DIRECTIONS, bvh=None):
+    """
+    Estimates support for each build direction in directions ((k, 3) unit vectors) for a closed
+    mesh (see wall_thickness.outward_normals for outward_sign). Returns (k,) arrays in mm units:
+    {"overhang_area": area of the overhanging facets, "support_volume": estimated from
+    num_samples surface samples, "build_height": the part's extent along the direction}.
+    """
+    triangles = numpy.asarray(triangles, dtype=numpy.float64)
+    normals, areas = outward_normals(triangles, outward_sign)
+    threshold = -numpy.sin(numpy.radians(OVERHANG_DEGREES))
+
+    # The build plate is at each direction's lowest vertex.
+    corners = triangles.reshape(-1, 3)
+    plate, top = numpy.full(len(directions), numpy.inf), numpy.full(len(directions), -numpy.inf)
+    for start in range(0, len(corners), BLOCK_ROWS):
+        heights = corners[start:start + BLOCK_ROWS] @ directions.T
+        plate, top = numpy.minimum(plate, heights.min(axis=0)), numpy.maximum(top, heights.max(axis=0))
+    diagonal = mesh_diagonal(triangles)
+    tolerance = diagonal * RELATIVE_PLATE_TOLERANCE
+
+    overhang_area = numpy.zeros(len(directions))
+    for start in range(0, len(triangles), BLOCK_ROWS):
+        block = slice(start, start + BLOCK_ROWS)
+        facing = normals[block] @ directions.T < threshold
+        first, second, third = (triangles[block, i] @ directions.T for i in range(3))
+        facet_tops = numpy.maximum(numpy.maximum(first, second), third) # (facets, directions)
+        overhang_area += (areas[block, None] * (facing & (facet_tops > plate + tolerance))).sum(axis=0)
+
+    support_volume = numpy.zeros(len(directions))
+    if num_samples > 0:
+        points, facets = sample_surface(triangles, num_samples)
+        cosines = normals[facets] @ directions.T
+        heights = points @ directions.T - plate
+        samples, orientations = numpy.nonzero((cosines < threshold) & (heights > tolerance))
+        if len(samples):
+            # Rays start on the surface and accept hits just behind it, so a face of another body
+            # touching the overhang (t ~ 0) stops the column; the sample's own facet is ignored.
+            bvh = bvh or TriangleBVH(triangles)
+            t, _ = bvh.first_hits(points[samples], -directions[orientations], -diagonal * RELATIVE_RAY_OFFSET, ignore=facets[samples])
+            columns = numpy.clip(t, 0.0, heights[samples, orientations]) # The part below, or the plate
+            sample_area = areas.sum() / num_samples
+            support_volume = numpy.bincount(
+                orientations, weights=sample_area * -cosines[samples, orientations] * columns, minlength=len(directions)
+            )
+    return {"overhang_area": overhang_area, "support_volume": support_volume, "build_height": top - plate}
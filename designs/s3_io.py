@@ -0,0 +1,217 @@
+"""
+S3 access for design files: a shared, pooled client per process, and helpers for
+reading objects without staging them on local disk.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_client_lock = threading.Lock()
+_client = None
+_client_factory = None
+
+
+def _build_s3_client():
+    return boto3.client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL, # Important for LocalStack/MinIO
+        config=boto3.session.Config(
+            signature_version=settings.AWS_S3_SIGNATURE_VERSION,
+            max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=settings.AWS_S3_TCP_KEEPALIVE,
+        )
+    )
+
+
+def get_s3_client():
+    """
+    Returns the process-wide S3 client, creating it on first use.
+    boto3 clients are thread-safe once built, but building one (session, credential chain,
+    endpoint resolution) is slow and not thread-safe, so it happens once under a lock.
+    A forked child (e.g. an analysis job process) builds its own, since connection pools
+    must not be shared between processes.
+    """
+    global _client
+    client = _client
+    if client is not None:
+        return client
+    with _client_lock:
+        if _client is None:
+            _client = (_client_factory or _build_s3_client)()
+        return _client
+
+
+def set_s3_client_factory(factory):
+    """
+    Swaps the callable used to build the S3 client (e.g. one returning a moto- or
+    MinIO-backed client in tests); pass None to restore the default. Drops any cached client.
+    """
+    global _client_factory
+    with _client_lock:
+        _client_factory = factory
+    reset_s3_client()
+
+
+def reset_s3_client():
+    """Drops the cached client so the next get_s3_client() call builds a new one."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def _reset_after_fork():
+    # The parent's lock may have been held by another thread at fork time.
+    global _client, _client_lock
+    _client_lock = threading.Lock()
+    _client = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+DEFAULT_STREAM_READ_BYTES = 8 * 1024 * 1024
+
+
+class MeteredStream:
+    """
+    Wraps a boto3 StreamingBody (or any file-like object with read()) and records
+    bytes read, time to first byte and, optionally, a SHA-256 of everything read.
+    Reads are capped at max_read_bytes so callers consume the body in bounded chunks.
+    """
+
+    def __init__(self, body, request_started_at=None, compute_sha256=False, max_read_bytes=DEFAULT_STREAM_READ_BYTES):
+        self._body = body
+        self._request_started_at = request_started_at if request_started_at is not None else time.monotonic()
+        self._sha256 = hashlib.sha256() if compute_sha256 else None
+        self._max_read_bytes = max_read_bytes
+        self.bytes_read = 0
+        self.time_to_first_byte = None # seconds
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._max_read_bytes:
+            size = self._max_read_bytes
+        data = self._body.read(size)
+        if data:
+            if self.time_to_first_byte is None:
+                self.time_to_first_byte = time.monotonic() - self._request_started_at
+            self.bytes_read += len(data)
+            if self._sha256 is not None:
+                self._sha256.update(data)
+        return data
+
+    def drain_to(self, file_obj):
+        """Copies the rest of the stream into file_obj in bounded chunks."""
+        for block in iter(lambda: self.read(self._max_read_bytes), b''):
+            file_obj.write(block)
+
+    def close(self):
+        close = getattr(self._body, 'close', None)
+        if close:
+            close()
+
+    @property
+    def sha256_digest(self):
+        """'sha256:<hex>' of the bytes read so far, if hashing was requested."""
+        return f"sha256:{self._sha256.hexdigest()}" if self._sha256 is not None else None
+
+    def transfer_stats(self):
+        return {
+            "bytes_read": self.bytes_read,
+            "time_to_first_byte_ms": round(self.time_to_first_byte * 1000, 1) if self.time_to_first_byte is not None else None,
+            "elapsed_ms": round((time.monotonic() - self._request_started_at) * 1000, 1),
+        }
+
+
+def open_s3_stream(s3_client, bucket, key, compute_sha256=False):
+    """
+    Issues get_object and returns (MeteredStream, content_length).
+    ClientError (including a 404 for a missing object) propagates to the caller.
+    """
+    request_started_at = time.monotonic()
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    stream = MeteredStream(response['Body'], request_started_at=request_started_at, compute_sha256=compute_sha256)
+    return stream, response.get('ContentLength')
+
+
+def open_s3_range_stream(s3_client, bucket, key, start, length):
+    """Issues a ranged get_object for `length` bytes from `start` and returns a MeteredStream over its body."""
+    request_started_at = time.monotonic()
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{start + length - 1}")
+    return MeteredStream(response['Body'], request_started_at=request_started_at)
+
+
+def read_s3_range(s3_client, bucket, key, start, length):
+    """Reads `length` bytes from `start` with a single ranged get_object (fewer if the object is shorter)."""
+    stream = open_s3_range_stream(s3_client, bucket, key, start, length)
+    try:
+        return b''.join(iter(lambda: stream.read(), b''))
+    finally:
+        stream.close()
+
+
+def download_s3_object(s3_client, bucket, key, local_file_path, object_size=None,
+                       part_size=None, concurrency=None, threshold=None):
+    """
+    Downloads an S3 object to local_file_path and returns a dict describing the transfer
+    (strategy, parts, bytes, elapsed_ms).
+    Objects of at least `threshold` bytes (and known size) are fetched as concurrent HTTP
+    range requests written straight into a preallocated, memory-mapped file; smaller ones
+    use a single download_file request. Defaults come from the CAD_ANALYSIS_RANGED_DOWNLOAD_*
+    settings. ClientError (e.g. a 404) propagates to the caller.
+    """
+    mb = 1024 * 1024
+    if part_size is None:
+        part_size = getattr(settings, 'CAD_ANALYSIS_RANGED_DOWNLOAD_PART_MB', 16) * mb
+    if concurrency is None:
+        concurrency = getattr(settings, 'CAD_ANALYSIS_RANGED_DOWNLOAD_CONCURRENCY', 8)
+    if threshold is None:
+        threshold = getattr(settings, 'CAD_ANALYSIS_RANGED_DOWNLOAD_THRESHOLD_MB', 64) * mb
+
+    started_at = time.monotonic()
+    use_ranges = (
+        isinstance(object_size, int) and object_size >= threshold
+        and object_size > part_size and concurrency > 1
+    )
+    if not use_ranges:
+        s3_client.download_file(bucket, key, local_file_path)
+        stats = {"strategy": "single", "parts": 1, "bytes": os.path.getsize(local_file_path)}
+    else:
+        ranges = [(start, min(start + part_size, object_size) - 1) for start in range(0, object_size, part_size)]
+        with open(local_file_path, 'r+b' if os.path.exists(local_file_path) else 'w+b') as f:
+            f.truncate(object_size) # Preallocate so every part can be written in place
+            with mmap.mmap(f.fileno(), object_size) as buffer:
+                def fetch_part(byte_range):
+                    start, end = byte_range
+                    body = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")['Body']
+                    position = start
+                    for block in iter(lambda: body.read(mb), b''):
+                        buffer[position:position + len(block)] = block
+                        position += len(block)
+                    if position != end + 1:
+                        raise IOError(f"Short read for s3://{bucket}/{key} bytes {start}-{end}: got {position - start} bytes.")
+
+                with ThreadPoolExecutor(max_workers=min(concurrency, len(ranges))) as pool:
+                    # list() re-raises the first part failure
+                    list(pool.map(fetch_part, ranges))
+                buffer.flush()
+        stats = {"strategy": "ranged", "parts": len(ranges), "bytes": object_size}
+
+    stats["elapsed_ms"] = round((time.monotonic() - started_at) * 1000, 1)
+    logger.info(
+        f"Downloaded s3://{bucket}/{key}: strategy={stats['strategy']} parts={stats['parts']} "
+        f"bytes={stats['bytes']} elapsed_ms={stats['elapsed_ms']}"
+    )
+    return stats
@@ -0,0 +1,636 @@
+"""
+Streaming reader for STEP (ISO 10303-21, "Part 21") files.
+
+The file is read in blocks and split into statements on top-level ';' (ignoring
+';' inside quoted strings and /* comments */). Each DATA-section entity instance is
+handed to the caller once as (entity_id, parts) and then dropped, so
+memory is bounded by the block size plus whatever the consumer chooses to keep;
+no entity graph is built.
+
+StepGeometrySummary consumes those entities and derives a bounding box from
+3D CARTESIAN_POINTs (scaled by the file's length unit) and entity counts, which
+is what quoting needs from a STEP upload. StepAssemblyStructure can ride along on
+the same pass to recover the PRODUCT / NEXT_ASSEMBLY_USAGE_OCCURRENCE tree, and
+StepPlacementGraph keeps the placement links between representations so that the
+bbox of an assembly with placed parts can be bounded (with up to two more passes
+that pick out only the axis placements, points and directions those links use).
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+STEP_ENGINE_NAME = "gmqp-step-p21"
+STEP_ENGINE_VERSION = "4"
+
+DEFAULT_BLOCK_BYTES = 8 * 1024 * 1024
+POINT_BATCH_SIZE = 65536 # CARTESIAN_POINT coordinate strings converted to floats per numpy call
+
+# One ';'-terminated statement, written as an "unrolled loop" (plain text, then any number of
+# string / comment / lone '/' tokens each followed by plain text) so a failed match on an
+# incomplete statement at the end of a block backtracks in linear time.
+_STATEMENT_RE = re.compile(r"[^;'/]*(?:(?:'[^']*(?:''[^']*)*'|/\*.*?\*/|/(?!\*))[^;'/]*)*;", re.S)
+_COMMENT_RE = re.compile(r"('[^']*(?:''[^']*)*')|/\*.*?\*/", re.S)
+_SIMPLE_INSTANCE_RE = re.compile(r"\s*#(\d+)\s*=\s*([A-Za-z][A-Za-z0-9_]*)\s*\((.*)\)\s*", re.S)
+_COMPLEX_INSTANCE_RE = re.compile(r"\s*#(\d+)\s*=\s*\((.*)\)\s*", re.S)
+_TYPE_NAME_RE = re.compile(r"\s*([A-Za-z][A-Za-z0-9_]*)\s*\(")
+_REFERENCE_RE = re.compile(r"#(\d+)")
+
+# A statement still incomplete after this many bytes is treated as corrupt (e.g. an unterminated string).
+MAX_STATEMENT_BYTES = 256 * 1024 * 1024
+
+# Millimetres per length unit
+SI_PREFIX_SCALE_MM = {
+    None: 1000.0, "EXA": 1e21, "PETA": 1e18, "TERA": 1e15, "GIGA": 1e12, "MEGA": 1e9, "KILO": 1e6,
+    "HECTO": 1e5, "DECA": 1e4, "DECI": 100.0, "CENTI": 10.0, "MILLI": 1.0, "MICRO": 1e-3, "NANO": 1e-6,
+}
+# Entities that place a shape representation inside another with a transformation (assembly
+# instances). Points are read in the local frame of their own representation, so with any of
+# these in a file the bbox of its points is not the bbox of the assembled product; see
+# StepPlacementGraph for how that bbox is bounded.
+PLACEMENT_TYPES = ('ITEM_DEFINED_TRANSFORMATION', 'REPRESENTATION_RELATIONSHIP_WITH_TRANSFORMATION', 'MAPPED_ITEM')
+CONVERSION_UNIT_SCALE_MM = {"INCH": 25.4, "FOOT": 304.8, "MIL": 0.0254, "THOU": 0.0254, "MILLIMETRE": 1.0, "MILLIMETER": 1.0}
+# Placement frames composed per representation before an assembly is reported as unbounded
+# (each frame is one path from the representation up to a root of the placement graph).
+MAX_PLACEMENT_FRAMES = 100000
+
+
+def _strip_comments(text):
+    return _COMMENT_RE.sub(lambda match: match.group(1) or '', text)
+
+
+def iter_p21_statements(file_obj, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Yields each ';'-terminated statement of a Part 21 file as text (without the ';'),
+    with comments removed. file_obj is a binary file-like object; text is decoded as
+    Latin-1 (Part 21 is 8-bit; non-ASCII characters are escaped with \\X\\ sequences).
+    """
+    carry = ''
+    match_statement = _STATEMENT_RE.match
+    while True:
+        block = file_obj.read(block_bytes)
+        buffer = carry + block.decode('latin-1')
+        pos = 0
+        while True:
+            match = match_statement(buffer, pos)
+            if match is None: # Incomplete statement: carried over to the next block
+                break
+            statement = buffer[pos:match.end() - 1]
+            pos = match.end()
+            yield _strip_comments(statement) if '/*' in statement else statement
+        carry = buffer[pos:]
+        if not block:
+            if _strip_comments(carry).strip():
+                raise ValueError("STEP file ends inside an unterminated statement, string or comment.")
+            return
+        if len(carry) > MAX_STATEMENT_BYTES:
+            raise ValueError("STEP file has an unterminated statement, string or comment.")
+
+
+def _split_top_level(text):
+    """Splits text on commas that are not nested in parentheses or strings."""
+    parts, depth, start, in_string = [], 0, 0, False
+    for i, char in enumerate(text):
+        if char == "'":
+            in_string = not in_string # '' escapes toggle twice, which is a no-op
+        elif in_string:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts]
+
+
+def _complex_entity_parts(inner):
+    """Splits the inside of a complex instance body '(A(...)B(...))' into [(type_name, params), ...]."""
+    parts, i = [], 0
+    while i < len(inner):
+        match = _TYPE_NAME_RE.match(inner, i)
+        if not match:
+            break
+        depth, j, in_string = 1, match.end(), False
+        while j < len(inner) and depth:
+            char = inner[j]
+            if char == "'":
+                in_string = not in_string
+            elif not in_string:
+                depth += (char == '(') - (char == ')')
+            j += 1
+        parts.append((match.group(1).upper(), inner[match.end():j - 1]))
+        i = j
+    return parts
+
+
+def iter_p21_entities(file_obj, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Yields (entity_id, [(type_name, params_text), ...]) for each DATA-section instance.
+    Simple instances have one (type_name, params_text) pair; complex ones have one per partial type.
+    params_text is the raw text inside the outer parentheses. Raises ValueError if there is no DATA section.
+    """
+    in_data = False
+    saw_data = False
+    for statement in iter_p21_statements(file_obj, block_bytes=block_bytes):
+        keyword = statement.strip()
+        if not in_data:
+            if keyword.upper() == 'DATA' or keyword.upper().startswith('DATA('):
+                in_data = saw_data = True
+            continue
+        if keyword.upper() == 'ENDSEC':
+            in_data = False
+            continue
+        match = _SIMPLE_INSTANCE_RE.fullmatch(statement)
+        if match:
+            yield int(match.group(1)), [(match.group(2).upper(), match.group(3))]
+            continue
+        match = _COMPLEX_INSTANCE_RE.fullmatch(statement)
+        if not match:
+            raise ValueError(f"Malformed STEP entity instance: {keyword[:80]}")
+        yield int(match.group(1)), _complex_entity_parts(match.group(2))
+    if not saw_data:
+        raise ValueError("STEP file has no DATA section.")
+
+
+class StepGeometrySummary:
+    """
+    Consumes entities from iter_p21_entities and accumulates the bounding box of 3D
+    CARTESIAN_POINTs, per-type entity counts and the file's length unit.
+    The bbox is of all 3D points, including B-spline control points and placement origins,
+    so it can be slightly larger than the tight bbox of the solid. Placements are not applied
+    here, so for a file with PLACEMENT_TYPES entities it only bounds the parts in their own
+    frames; result() reports their number as placements (StepPlacementGraph places that bbox).
+    """
+
+    def __init__(self):
+        self.entity_counts = Counter()
+        self.num_entities = 0
+        self.num_points = 0
+        self.length_units = [] # mm per unit, in order of appearance
+        self.length_unit_names = []
+        self._pending_points = []
+        self.min_coords = numpy.full(3, numpy.inf)
+        self.max_coords = numpy.full(3, -numpy.inf)
+        self.scale = 1.0 # mm per file unit, set by result()
+
+    def add(self, entity_id, parts):
+        self.num_entities += 1
+        if len(parts) == 1:
+            type_name, params = parts[0]
+            self.entity_counts[type_name] += 1
+            if type_name == 'CARTESIAN_POINT':
+                coordinates = params[params.rfind('(') + 1:params.find(')', params.rfind('('))]
+                if coordinates.count(',') == 2: # Skip 2D (parameter-space) points
+                    self._pending_points.append(coordinates)
+                    if len(self._pending_points) >= POINT_BATCH_SIZE:
+                        self._flush_points()
+        else:
+            type_names = {type_name for type_name, _ in parts}
+            for type_name in type_names:
+                self.entity_counts[type_name] += 1
+            if 'LENGTH_UNIT' in type_names:
+                self._add_length_unit(dict(parts))
+
+    def _add_length_unit(self, parts):
+        scale, name = None, None
+        if 'SI_UNIT' in parts:
+            prefix, unit_name = (_split_top_level(parts['SI_UNIT']) + ['$', '$'])[:2]
+            prefix = prefix.strip('.') if prefix not in ('$', '*') else None
+            if unit_name.strip('.') == 'METRE' and prefix in SI_PREFIX_SCALE_MM:
+                scale, name = SI_PREFIX_SCALE_MM[prefix], f"{(prefix or '').lower()}metre"
+        elif 'CONVERSION_BASED_UNIT' in parts:
+            unit_name = _split_top_level(parts['CONVERSION_BASED_UNIT'])[0].strip("'").upper()
+            if unit_name in CONVERSION_UNIT_SCALE_MM:
+                scale, name = CONVERSION_UNIT_SCALE_MM[unit_name], unit_name.lower()
+        if scale is not None:
+            self.length_units.append(scale)
+            self.length_unit_names.append(name)
+
+    def _flush_points(self):
+        if not self._pending_points:
+            return
+        values = numpy.fromstring(','.join(self._pending_points), dtype=numpy.float64, sep=',')
+        if values.size != len(self._pending_points) * 3:
+            raise ValueError("STEP file has malformed CARTESIAN_POINT coordinates.")
+        points = values.reshape(-1, 3)
+        numpy.minimum(self.min_coords, points.min(axis=0), out=self.min_coords)
+        numpy.maximum(self.max_coords, points.max(axis=0), out=self.max_coords)
+        self.num_points += len(points)
+        self._pending_points = []
+
+    def result(self, source_name):
+        """
+        Returns raw metrics: min_mm/max_mm (scaled to mm), length_unit, entity counts and
+        placements (how many PLACEMENT_TYPES entities the file has).
+        Raises ValueError if the file has no 3D points. Without a recognised length unit,
+        millimetres are assumed (and length_unit is reported as 'assumed_mm').
+        """
+        self._flush_points()
+        if self.num_points == 0 or not numpy.any(self.max_coords > self.min_coords):
+            raise ValueError(f"STEP file contains no 3D geometry (CARTESIAN_POINT): {source_name}")
+        if self.length_units:
+            scale, unit_name = self.length_units[0], self.length_unit_names[0]
+            if len(set(self.length_units)) > 1:
+                logger.warning(f"STEP file {source_name} declares several length units {self.length_unit_names}; using {unit_name}.")
+        else:
+            scale, unit_name = 1.0, "assumed_mm"
+        self.scale = scale
+        return {
+            "min_mm": (self.min_coords * scale).tolist(),
+            "max_mm": (self.max_coords * scale).tolist(),
+            "length_unit": unit_name,
+            "num_entities": self.num_entities,
+            "num_points": self.num_points,
+            "entity_counts": dict(self.entity_counts),
+            "placements": sum(self.entity_counts[type_name] for type_name in PLACEMENT_TYPES),
+        }
+
+
+def _references(text):
+    return [int(ref) for ref in _REFERENCE_RE.findall(text)]
+
+
+def _step_string(text):
+    """Decodes a quoted Part 21 string ('it''s' -> it's); '$' and other non-strings become ''."""
+    text = text.strip()
+    return text[1:-1].replace("''", "'") if len(text) >= 2 and text[0] == text[-1] == "'" else ''
+
+
+class StepAssemblyStructure:
+    """
+    Consumes entities from iter_p21_entities and recovers the product structure: PRODUCTs,
+    the NEXT_ASSEMBLY_USAGE_OCCURRENCE links between their definitions, and, per product, the
+    B-rep faces of its own shape representation. Only the handful of entity types that make
+    up that structure are kept (as reference ids or face counts), and references are resolved
+    in result(), since Part 21 allows forward references.
+    """
+    SOLID_TYPES = ('MANIFOLD_SOLID_BREP', 'BREP_WITH_VOIDS', 'FACETED_BREP', 'SHELL_BASED_SURFACE_MODEL')
+    SHELL_TYPES = ('CLOSED_SHELL', 'OPEN_SHELL')
+    DEFINITION_TYPES = ('PRODUCT_DEFINITION', 'PRODUCT_DEFINITION_WITH_ASSOCIATED_DOCUMENTS')
+    FORMATION_TYPES = ('PRODUCT_DEFINITION_FORMATION', 'PRODUCT_DEFINITION_FORMATION_WITH_SPECIFIED_SOURCE')
+    # Everything else (points, curves, faces, ...) is skipped with one set lookup and one suffix test.
+    KEPT_TYPES = frozenset(SOLID_TYPES + SHELL_TYPES + DEFINITION_TYPES + FORMATION_TYPES + (
+        'PRODUCT', 'PRODUCT_DEFINITION_SHAPE', 'SHAPE_DEFINITION_REPRESENTATION',
+        'SHAPE_REPRESENTATION_RELATIONSHIP', 'NEXT_ASSEMBLY_USAGE_OCCURRENCE',
+    ))
+
+    def __init__(self):
+        self.products = {} # PRODUCT id -> (product id string, name)
+        self.formation_product = {} # PRODUCT_DEFINITION_FORMATION id -> PRODUCT id
+        self.definition_formation = {} # PRODUCT_DEFINITION id -> formation id
+        self.shape_definition = {} # PRODUCT_DEFINITION_SHAPE id -> PRODUCT_DEFINITION id
+        self.shape_representations = [] # (PRODUCT_DEFINITION_SHAPE id, representation id)
+        self.representation_items = {} # representation id -> item ids
+        self.representation_links = [] # (representation id, representation id), untransformed only
+        self.solid_shells = {} # solid or surface model id -> shell ids
+        self.shell_faces = {} # shell id -> number of faces
+        self.occurrences = [] # (parent PRODUCT_DEFINITION id, child PRODUCT_DEFINITION id)
+
+    def add(self, entity_id, parts):
+        if len(parts) != 1:
+            return # Complex instances here are unit definitions or placed (transformed) representation links
+        type_name, params = parts[0]
+        if type_name not in self.KEPT_TYPES and not type_name.endswith('SHAPE_REPRESENTATION'):
+            return
+        if type_name in self.SHELL_TYPES:
+            self.shell_faces[entity_id] = params.count('#')
+        elif type_name in self.SOLID_TYPES:
+            self.solid_shells[entity_id] = _references(params)
+        elif type_name.endswith('SHAPE_REPRESENTATION') and type_name != 'CONTEXT_DEPENDENT_SHAPE_REPRESENTATION':
+            fields = _split_top_level(params)
+            self.representation_items[entity_id] = _references(fields[1]) if len(fields) > 1 else []
+        elif type_name == 'PRODUCT':
+            fields = _split_top_level(params) + ['', '']
+            self.products[entity_id] = (_step_string(fields[0]), _step_string(fields[1]))
+        elif type_name in self.FORMATION_TYPES:
+            self._add_link(self.formation_product, entity_id, params, 2)
+        elif type_name in self.DEFINITION_TYPES:
+            self._add_link(self.definition_formation, entity_id, params, 2)
+        elif type_name == 'PRODUCT_DEFINITION_SHAPE':
+            self._add_link(self.shape_definition, entity_id, params, 2)
+        elif type_name == 'SHAPE_DEFINITION_REPRESENTATION':
+            refs = _references(params)
+            if len(refs) >= 2:
+                self.shape_representations.append((refs[0], refs[1]))
+        elif type_name == 'SHAPE_REPRESENTATION_RELATIONSHIP':
+            refs = _references(params)
+            if len(refs) >= 2:
+                self.representation_links.append((refs[-2], refs[-1]))
+        elif type_name == 'NEXT_ASSEMBLY_USAGE_OCCURRENCE':
+            fields = _split_top_level(params)
+            if len(fields) >= 5 and fields[3].startswith('#') and fields[4].startswith('#'):
+                self.occurrences.append((int(fields[3][1:]), int(fields[4][1:])))
+
+    @staticmethod
+    def _add_link(table, entity_id, params, index):
+        fields = _split_top_level(params)
+        if len(fields) > index and fields[index].startswith('#'):
+            table[entity_id] = int(fields[index][1:])
+
+    def _product_of_definition(self, definition_id):
+        return self.formation_product.get(self.definition_formation.get(definition_id))
+
+    def _faces_by_product(self):
+        """Counts each product's B-rep faces once, from the representations attached to its definitions."""
+        linked = {}
+        for first, second in self.representation_links:
+            linked.setdefault(first, set()).add(second)
+            linked.setdefault(second, set()).add(first)
+        shells_by_product = {}
+        for shape_id, representation_id in self.shape_representations:
+            product_id = self._product_of_definition(self.shape_definition.get(shape_id))
+            if product_id is None:
+                continue
+            shells = shells_by_product.setdefault(product_id, set())
+            pending, seen = [representation_id], set()
+            while pending:
+                current = pending.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                pending.extend(linked.get(current, ()))
+                for item_id in self.representation_items.get(current, ()):
+                    shells.update(self.solid_shells.get(item_id, (item_id,)))
+        return {
+            product_id: sum(self.shell_faces.get(shell_id, 0) for shell_id in shells)
+            for product_id, shells in shells_by_product.items()
+        }
+
+    def result(self):
+        """
+        Returns {"num_products", "num_occurrences", "parts": [...]}, one part per PRODUCT with
+        its total instance count in the tree (occurrence counts multiplied down from the roots),
+        its own face count and whether it is an assembly. Raises ValueError for a cyclic structure.
+        """
+        edges = Counter()
+        for parent_definition, child_definition in self.occurrences:
+            parent = self._product_of_definition(parent_definition)
+            child = self._product_of_definition(child_definition)
+            if parent in self.products and child in self.products:
+                edges[(parent, child)] += 1
+
+        children, indegree = {}, Counter()
+        for (parent, child), count in edges.items():
+            children.setdefault(parent, []).append((child, count))
+            indegree[child] += 1
+        instances = {product_id: 0 if indegree[product_id] else 1 for product_id in self.products}
+        ready = [product_id for product_id in self.products if not indegree[product_id]]
+        resolved = 0
+        while ready: # Kahn's algorithm: a product's count is final once all its parents are
+            parent = ready.pop()
+            resolved += 1
+            for child, count in children.get(parent, ()):
+                instances[child] += instances[parent] * count
+                indegree[child] -= 1
+                if not indegree[child]:
+                    ready.append(child)
+        if resolved != len(self.products):
+            raise ValueError("STEP assembly structure is cyclic.")
+
+        faces = self._faces_by_product()
+        parts = [
+            {
+                "product_id": product_id_text,
+                "name": name,
+                "instances": instances[product_id],
+                "num_faces": faces.get(product_id, 0),
+                "is_assembly": product_id in children,
+            }
+            for product_id, (product_id_text, name) in self.products.items()
+        ]
+        return {"num_products": len(self.products), "num_occurrences": sum(edges.values()), "parts": parts}
+
+
+def _collect_entities(file_path, wanted_ids, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Streams a STEP file and returns {entity_id: (type_name, params_text)} for the wanted simple instances."""
+    found = {}
+    if not wanted_ids:
+        return found
+    with open(file_path, 'rb') as f:
+        for entity_id, parts in iter_p21_entities(f, block_bytes=block_bytes):
+            if entity_id in wanted_ids and len(parts) == 1:
+                found[entity_id] = parts[0]
+    return found
+
+
+def _vector(entity, type_name):
+    """Parses the coordinate list of a CARTESIAN_POINT or DIRECTION; None if it is not a 3D one."""
+    if entity is None or entity[0] != type_name:
+        return None
+    params = entity[1]
+    coordinates = params[params.rfind('(') + 1:params.find(')', params.rfind('('))].split(',')
+    if len(coordinates) != 3:
+        return None
+    try:
+        return numpy.array([float(value) for value in coordinates])
+    except ValueError:
+        return None
+
+
+def _unit(vector):
+    norm = numpy.linalg.norm(vector)
+    return vector / norm if norm > 1e-12 else None
+
+
+class StepPlacementGraph:
+    """
+    Consumes entities from iter_p21_entities and keeps the placement links between
+    representations: transformed representation relationships (child representation,
+    parent representation, ITEM_DEFINED_TRANSFORMATION) and MAPPED_ITEMs (the mapped
+    representation is placed in whichever representation lists the item). Like
+    StepAssemblyStructure, only reference ids are kept and they are resolved later.
+
+    bound() turns each link into a rigid transformation from its two AXIS2_PLACEMENT_3Ds,
+    composes them into every frame each representation is placed in, and returns the box
+    that holds the bbox of all points (taken in every representation's local frame) placed
+    in every one of those frames. Points are not attributed to representations (that would
+    need the full entity graph), so the box is conservative: it contains the assembled
+    product but can be larger than it.
+    """
+    TRANSFORMED_RELATIONSHIP = 'REPRESENTATION_RELATIONSHIP_WITH_TRANSFORMATION'
+
+    def __init__(self):
+        self.transformations = {} # ITEM_DEFINED_TRANSFORMATION id -> (item 1 id, item 2 id)
+        self.relationships = [] # (child representation id, parent representation id, transformation id)
+        self.representation_maps = {} # REPRESENTATION_MAP id -> (origin id, mapped representation id)
+        self.mapped_items = {} # MAPPED_ITEM id -> (REPRESENTATION_MAP id, target id)
+        self.representation_items = {} # representation id -> item ids
+
+    def add(self, entity_id, parts):
+        if len(parts) != 1:
+            parts = dict(parts)
+            if self.TRANSFORMED_RELATIONSHIP in parts and 'REPRESENTATION_RELATIONSHIP' in parts:
+                representations = _references(parts['REPRESENTATION_RELATIONSHIP'])
+                transformation = _references(parts[self.TRANSFORMED_RELATIONSHIP])
+                if len(representations) >= 2 and transformation:
+                    self.relationships.append((representations[-2], representations[-1], transformation[0]))
+            return
+        type_name, params = parts[0]
+        if type_name == 'ITEM_DEFINED_TRANSFORMATION':
+            refs = _references(params)
+            if len(refs) >= 2:
+                self.transformations[entity_id] = (refs[-2], refs[-1])
+        elif type_name == self.TRANSFORMED_RELATIONSHIP:
+            refs = _references(params)
+            if len(refs) >= 3:
+                self.relationships.append((refs[-3], refs[-2], refs[-1]))
+        elif type_name == 'REPRESENTATION_MAP':
+            refs = _references(params)
+            if len(refs) >= 2:
+                self.representation_maps[entity_id] = (refs[0], refs[1])
+        elif type_name == 'MAPPED_ITEM':
+            refs = _references(params)
+            if len(refs) >= 2:
+                self.mapped_items[entity_id] = (refs[-2], refs[-1])
+        elif type_name.endswith('REPRESENTATION') and type_name != 'CONTEXT_DEPENDENT_SHAPE_REPRESENTATION':
+            fields = _split_top_level(params)
+            if len(fields) > 1:
+                self.representation_items[entity_id] = _references(fields[1])
+
+    def _links(self):
+        """Returns [(child representation, parent representation, origin axis id, target axis id)], or None if a link cannot be followed."""
+        links = []
+        for child, parent, transformation_id in self.relationships:
+            if transformation_id not in self.transformations:
+                return None # A CARTESIAN_TRANSFORMATION_OPERATOR or a dangling reference
+            origin, target = self.transformations[transformation_id]
+            links.append((child, parent, origin, target))
+        if self.mapped_items:
+            owners = {}
+            for representation_id, items in self.representation_items.items():
+                for item_id in items:
+                    if item_id in self.mapped_items:
+                        owners.setdefault(item_id, []).append(representation_id)
+            for item_id, (map_id, target) in self.mapped_items.items():
+                if map_id not in self.representation_maps or item_id not in owners:
+                    return None # Nested inside another item, or a dangling reference
+                origin, child = self.representation_maps[map_id]
+                links.extend((child, parent, origin, target) for parent in owners[item_id])
+        return links
+
+    @staticmethod
+    def _axis_matrices(file_path, axis_ids, block_bytes):
+        """
+        Returns {axis id: 4x4 matrix from the axis' frame to its representation's frame},
+        reading the AXIS2_PLACEMENT_3Ds and then their points and directions in two passes;
+        None if any of them is missing or is not an AXIS2_PLACEMENT_3D.
+        """
+        axes = {}
+        for axis_id, (type_name, params) in _collect_entities(file_path, axis_ids, block_bytes).items():
+            if type_name != 'AXIS2_PLACEMENT_3D':
+                return None
+            fields = _split_top_level(params) + ['$', '$', '$']
+            axes[axis_id] = [int(field[1:]) if field.startswith('#') else None for field in fields[1:4]]
+        if len(axes) != len(axis_ids) or any(refs[0] is None for refs in axes.values()):
+            return None
+        vectors = _collect_entities(
+            file_path, {ref for refs in axes.values() for ref in refs if ref is not None}, block_bytes
+        )
+        matrices = {}
+        for axis_id, (location_id, axis_ref, direction_ref) in axes.items():
+            location = _vector(vectors.get(location_id), 'CARTESIAN_POINT')
+            z_axis = _unit(_vector(vectors.get(axis_ref), 'DIRECTION')) if axis_ref else numpy.array([0.0, 0.0, 1.0])
+            x_hint = _vector(vectors.get(direction_ref), 'DIRECTION') if direction_ref else None
+            if location is None or z_axis is None or (direction_ref and x_hint is None):
+                return None
+            x_axis = None
+            for candidate in ([x_hint] if x_hint is not None else []) + [numpy.eye(3)[0], numpy.eye(3)[1]]:
+                # ISO 10303-42: the x axis is the reference direction made orthogonal to z
+                x_axis = _unit(candidate - numpy.dot(candidate, z_axis) * z_axis)
+                if x_axis is not None:
+                    break
+            matrix = numpy.eye(4)
+            matrix[:3, 0], matrix[:3, 1], matrix[:3, 2] = x_axis, numpy.cross(z_axis, x_axis), z_axis
+            matrix[:3, 3] = location
+            matrices[axis_id] = matrix
+        return matrices
+
+    def bound(self, file_path, min_coords, max_coords, block_bytes=DEFAULT_BLOCK_BYTES):
+        """
+        Returns (min_coords, max_coords) in file units of the local bbox [min_coords, max_coords]
+        placed in every frame of every placed representation (roots keep the identity), or None
+        if the placements cannot be resolved: a non-rigid or unknown transformation, a dangling
+        reference, a cycle, or more than MAX_PLACEMENT_FRAMES frames for one representation.
+        """
+        links = self._links()
+        if not links:
+            return None
+        matrices = self._axis_matrices(file_path, {axis_id for link in links for axis_id in link[2:]}, block_bytes)
+        if matrices is None:
+            return None
+        parents = {}
+        for child, parent, origin, target in links:
+            # Maps the child's coordinates onto the target axis in the parent: M(target) * M(origin)^-1
+            parents.setdefault(child, []).append((parent, matrices[target] @ numpy.linalg.inv(matrices[origin])))
+
+        frames, visiting = {}, set()
+
+        def frames_of(representation_id):
+            if representation_id in frames:
+                return frames[representation_id]
+            if representation_id in visiting:
+                raise ValueError("cyclic placements")
+            visiting.add(representation_id)
+            placed = [numpy.eye(4)] if representation_id not in parents else []
+            for parent, transformation in parents.get(representation_id, ()):
+                placed.extend(frame @ transformation for frame in frames_of(parent))
+                if len(placed) > MAX_PLACEMENT_FRAMES:
+                    raise ValueError("too many placement frames")
+            visiting.discard(representation_id)
+            frames[representation_id] = placed
+            return placed
+
+        try:
+            all_frames = [frame for representation_id in {link[1] for link in links} | set(parents)
+                          for frame in frames_of(representation_id)]
+        except ValueError as e:
+            logger.warning(f"STEP placements could not be composed: {e}")
+            return None
+        corners = numpy.array([[x, y, z, 1.0] for x in (min_coords[0], max_coords[0])
+                               for y in (min_coords[1], max_coords[1]) for z in (min_coords[2], max_coords[2])])
+        placed_corners = (numpy.stack(all_frames) @ corners.T)[:, :3, :]
+        return placed_corners.min(axis=(0, 2)), placed_corners.max(axis=(0, 2))
+
+
+def summarize_step_file(file_path, block_bytes=DEFAULT_BLOCK_BYTES, consumers=()):
+    """
+    Streams a STEP file once and returns (summary_metrics, throughput). Additional consumers
+    (objects with add(entity_id, parts)) receive every entity from the same pass.
+    throughput holds bytes, entities, seconds, mb_per_second and entities_per_second (of the first pass).
+    For a file with placements, the metrics also hold placed_min_mm/placed_max_mm, the
+    conservative bbox of the assembled product (see StepPlacementGraph), or None for both if
+    the placements could not be resolved; bounding it re-reads the file for the few entities
+    it needs.
+    """
+    summary = StepGeometrySummary()
+    placement_graph = StepPlacementGraph()
+    started_at = time.monotonic()
+    with open(file_path, 'rb') as f:
+        for entity_id, parts in iter_p21_entities(f, block_bytes=block_bytes):
+            summary.add(entity_id, parts)
+            placement_graph.add(entity_id, parts)
+            for consumer in consumers:
+                consumer.add(entity_id, parts)
+        size = f.tell()
+    elapsed = max(time.monotonic() - started_at, 1e-9)
+    metrics = summary.result(os.path.basename(file_path))
+    if metrics["placements"]:
+        bounds = placement_graph.bound(file_path, summary.min_coords, summary.max_coords, block_bytes=block_bytes)
+        metrics["placed_min_mm"] = (bounds[0] * summary.scale).tolist() if bounds else None
+        metrics["placed_max_mm"] = (bounds[1] * summary.scale).tolist() if bounds else None
+    throughput = {
+        "bytes": size,
+        "entities": summary.num_entities,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(size / elapsed / 1e6, 2),
+        "entities_per_second": round(summary.num_entities / elapsed),
+    }
+    return metrics, throughput
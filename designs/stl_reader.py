@@ -0,0 +1,283 @@
+"""
+Streaming readers for STL files.
+
+Binary STL layout: an 80-byte header, a little-endian uint32 triangle count,
+then one 50-byte record per triangle (normal, three vertices as float32 and a
+uint16 attribute byte count). The file is memory-mapped and reduced in
+fixed-size chunks so peak memory stays flat regardless of the file size.
+
+ASCII STL is read in large blocks; the 'vertex x y z' lines of each block are
+extracted with one regex pass and converted to floats in bulk by NumPy, then
+fed to the same reductions as the binary path.
+"""
+import logging
+import mmap
+import os
+import re
+import warnings
+
+import numpy
+
+from .mesh_metrics import MeshMetricsAccumulator
+
+logger = logging.getLogger(__name__)
+
+STL_HEADER_BYTES = 80
+STL_COUNT_BYTES = 4
+STL_DATA_OFFSET = STL_HEADER_BYTES + STL_COUNT_BYTES
+STL_RECORD_DTYPE = numpy.dtype([
+    ('normals', '<f4', (3,)),
+    ('vectors', '<f4', (3, 3)),
+    ('attr', '<u2'),
+])
+STL_RECORD_BYTES = STL_RECORD_DTYPE.itemsize # 50 bytes
+
+DEFAULT_CHUNK_TRIANGLES = 262144 # ~12.5 MB of records per chunk
+
+# Rough size of one ASCII 'facet normal ... endfacet' block, used to estimate the triangle
+# count of an ASCII file from its size alone.
+ASCII_BYTES_PER_TRIANGLE_ESTIMATE = 250
+
+STREAM_ENGINE_NAME = "gmqp-stl-stream"
+STREAM_ENGINE_VERSION = "1"
+ASCII_ENGINE_NAME = "gmqp-stl-ascii"
+ASCII_ENGINE_VERSION = "1"
+
+DEFAULT_ASCII_BLOCK_BYTES = 64 * 1024 * 1024
+# Keywords are matched in any case, like the 'solid' sniff (some exporters write upper case).
+_ASCII_VERTEX_RE = re.compile(rb'vertex[ \t]+([^\r\n]*)', re.IGNORECASE)
+_ASCII_FACET_END = b'endfacet'
+# Bytes at the end of a block searched first for its last 'endfacet' (widened until one is found).
+_ASCII_CUT_WINDOW = 4096
+
+
+def detect_stl_format(file_path):
+    """
+    Returns 'binary' or 'ascii' for an STL file, or None if the file is neither.
+    A binary file is recognised by its declared triangle count matching the file size,
+    since some exporters also start binary headers with the word 'solid'.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        head = f.read(STL_DATA_OFFSET)
+    return sniff_stl_stream_format(head, file_size)
+
+
+def iter_binary_stl_chunks(file_path, chunk_triangles=DEFAULT_CHUNK_TRIANGLES):
+    """
+    Yields (n, 3, 3) float64 arrays of triangle vertices from a binary STL file.
+    Each chunk is copied out of its own memory-mapped window, which is unmapped
+    before the chunk is yielded, so memory use is bounded by the chunk size.
+    """
+    if chunk_triangles <= 0:
+        raise ValueError("chunk_triangles must be a positive integer.")
+
+    file_size = os.path.getsize(file_path)
+    if file_size < STL_DATA_OFFSET:
+        raise ValueError(f"Binary STL file is truncated: {os.path.basename(file_path)}")
+
+    with open(file_path, 'rb') as f:
+        f.seek(STL_HEADER_BYTES)
+        triangle_count = int.from_bytes(f.read(STL_COUNT_BYTES), 'little')
+        if file_size < STL_DATA_OFFSET + triangle_count * STL_RECORD_BYTES:
+            raise ValueError(
+                f"Binary STL file declares {triangle_count} triangles but is only {file_size} bytes: "
+                f"{os.path.basename(file_path)}"
+            )
+        if triangle_count == 0:
+            return
+
+        # Map one chunk-sized window at a time (rather than the whole file) so both resident
+        # memory and address space stay bounded; the latter matters under an RLIMIT_AS
+        # ceiling in the analysis job process (see analysis_executor).
+        for start in range(0, triangle_count, chunk_triangles):
+            count = min(chunk_triangles, triangle_count - start)
+            offset = STL_DATA_OFFSET + start * STL_RECORD_BYTES
+            window_start = offset - (offset % mmap.ALLOCATIONGRANULARITY)
+            window_length = offset + count * STL_RECORD_BYTES - window_start
+            with mmap.mmap(f.fileno(), window_length, access=mmap.ACCESS_READ, offset=window_start) as mapped:
+                records = numpy.frombuffer(mapped, dtype=STL_RECORD_DTYPE, count=count, offset=offset - window_start)
+                vectors = records['vectors'].astype(numpy.float64)
+                del records # Release the buffer export so the window can be unmapped
+            yield vectors
+
+
+def iter_binary_stl_stream_chunks(stream, chunk_triangles=DEFAULT_CHUNK_TRIANGLES, header=None):
+    """
+    Yields (n, 3, 3) float64 vertex arrays from a binary STL read sequentially from a
+    file-like object (e.g. a boto3 StreamingBody), without seeking or a temp file.
+    If the first bytes were already consumed to sniff the format, pass them as header.
+    """
+    if chunk_triangles <= 0:
+        raise ValueError("chunk_triangles must be a positive integer.")
+
+    head = (header or b'')[:STL_DATA_OFFSET]
+    remainder = (header or b'')[STL_DATA_OFFSET:]
+    head += _read_exactly(stream, STL_DATA_OFFSET - len(head))
+    if len(head) < STL_DATA_OFFSET:
+        raise ValueError("Binary STL stream is truncated (incomplete header).")
+    triangle_count = int.from_bytes(head[STL_HEADER_BYTES:STL_DATA_OFFSET], 'little')
+    yield from iter_binary_stl_record_chunks(stream, triangle_count, chunk_triangles, prefix=remainder)
+
+
+def iter_binary_stl_record_chunks(stream, triangle_count, chunk_triangles=DEFAULT_CHUNK_TRIANGLES, prefix=b''):
+    """
+    Yields (n, 3, 3) float64 vertex arrays for triangle_count consecutive 50-byte records read
+    from a file-like object positioned at a record boundary (e.g. the body of a ranged GET for
+    one shard of a file). Bytes already read from the stream can be passed as prefix.
+    """
+    if chunk_triangles <= 0:
+        raise ValueError("chunk_triangles must be a positive integer.")
+
+    remainder = prefix
+    for start in range(0, triangle_count, chunk_triangles):
+        count = min(chunk_triangles, triangle_count - start)
+        wanted = count * STL_RECORD_BYTES
+        data = remainder[:wanted]
+        remainder = remainder[wanted:]
+        data += _read_exactly(stream, wanted - len(data))
+        if len(data) < wanted:
+            raise ValueError(
+                f"Binary STL stream declares {triangle_count} triangles but ended after "
+                f"{start + len(data) // STL_RECORD_BYTES}."
+            )
+        records = numpy.frombuffer(data, dtype=STL_RECORD_DTYPE, count=count)
+        yield records['vectors'].astype(numpy.float64)
+
+
+def iter_ascii_stl_chunks(file_path, block_bytes=DEFAULT_ASCII_BLOCK_BYTES):
+    """
+    Yields (n, 3, 3) float64 arrays of triangle vertices from an ASCII STL file.
+    The file is read in blocks of about block_bytes, each cut after its last 'endfacet'
+    so no facet straddles two blocks. Raises ValueError for malformed vertex data.
+    """
+    if block_bytes <= 0:
+        raise ValueError("block_bytes must be a positive integer.")
+
+    file_name = os.path.basename(file_path)
+    with open(file_path, 'rb') as f:
+        carry = b''
+        while True:
+            block = f.read(block_bytes)
+            data = carry + block
+            if not block: # End of file: whatever is left must be complete facets (or trailer)
+                carry = b''
+            else:
+                cut = _after_last_facet_end(data)
+                if cut < 0: # No complete facet yet; keep reading
+                    carry = data
+                    continue
+                data, carry = data[:cut], data[cut:]
+            vectors = _parse_ascii_vertices(data, file_name)
+            if vectors is not None:
+                yield vectors
+            if not block:
+                return
+
+
+def _after_last_facet_end(data):
+    """
+    Offset just past the last 'endfacet' (in any case) in data, or -1 if there is none. Only a
+    window at the end is lower-cased, not the whole block; the window grows until it has a match.
+    """
+    window = _ASCII_CUT_WINDOW
+    while True:
+        start = max(len(data) - window, 0)
+        cut = data[start:].lower().rfind(_ASCII_FACET_END)
+        if cut >= 0:
+            return start + cut + len(_ASCII_FACET_END)
+        if start == 0:
+            return -1
+        window *= 4
+
+
+def _parse_ascii_vertices(data, file_name):
+    """Converts every 'vertex x y z' line in data to an (n, 3, 3) float64 array (None if there are none)."""
+    vertex_fields = _ASCII_VERTEX_RE.findall(data)
+    if not vertex_fields:
+        return None
+    if len(vertex_fields) % 3:
+        raise ValueError(f"ASCII STL file has a facet without exactly three vertices: {file_name}")
+    with warnings.catch_warnings():
+        # numpy warns (rather than raises) when it stops at unparsable text; the count check below catches it.
+        warnings.simplefilter('ignore', DeprecationWarning)
+        values = numpy.fromstring(b' '.join(vertex_fields), dtype=numpy.float64, sep=' ')
+    if values.size != len(vertex_fields) * 3:
+        raise ValueError(f"ASCII STL file has malformed vertex coordinates: {file_name}")
+    return values.reshape(-1, 3, 3)
+
+
+def _read_exactly(stream, num_bytes):
+    """Reads up to num_bytes, looping over short reads; returns fewer only at end of stream."""
+    parts = []
+    while num_bytes > 0:
+        part = stream.read(num_bytes)
+        if not part:
+            break
+        parts.append(part)
+        num_bytes -= len(part)
+    return b''.join(parts)
+
+
+def stream_binary_stl_metrics(file_path, chunk_triangles=DEFAULT_CHUNK_TRIANGLES, sinks=(), kernels=None):
+    """
+    Reduces a binary STL file to its raw metrics in a single streaming pass.
+    Returns the MeshMetricsAccumulator.result dict (volume_mm3, surface_area_mm2, min_mm, max_mm,
+    num_triangles and normal statistics). Each chunk is also passed to the add() of every
+    object in sinks (e.g. a mesh_topology.TriangleCollector), so later stages need no second read.
+    kernels (a mesh_kernels.KernelScheduler) is fed by the accumulator, with its intermediates.
+    """
+    accumulator = MeshMetricsAccumulator(kernels=kernels)
+    for vectors in iter_binary_stl_chunks(file_path, chunk_triangles=chunk_triangles):
+        accumulator.add(vectors)
+        for sink in sinks:
+            sink.add(vectors)
+    return accumulator.result(os.path.basename(file_path))
+
+
+def stream_ascii_stl_metrics(file_path, block_bytes=DEFAULT_ASCII_BLOCK_BYTES, sinks=(), kernels=None):
+    """Same as stream_binary_stl_metrics, for an ASCII STL file."""
+    accumulator = MeshMetricsAccumulator(kernels=kernels)
+    for vectors in iter_ascii_stl_chunks(file_path, block_bytes=block_bytes):
+        accumulator.add(vectors)
+        for sink in sinks:
+            sink.add(vectors)
+    return accumulator.result(os.path.basename(file_path))
+
+
+def stream_binary_stl_metrics_from_stream(stream, chunk_triangles=DEFAULT_CHUNK_TRIANGLES, header=None, source_name="stream", sinks=(), kernels=None):
+    """Same as stream_binary_stl_metrics, for a sequential (non-seekable) file-like object."""
+    accumulator = MeshMetricsAccumulator(kernels=kernels)
+    for vectors in iter_binary_stl_stream_chunks(stream, chunk_triangles=chunk_triangles, header=header):
+        accumulator.add(vectors)
+        for sink in sinks:
+            sink.add(vectors)
+    return accumulator.result(source_name)
+
+
+def sniff_stl_stream_format(header, content_length):
+    """
+    Format detection for a stream whose total size is known (e.g. S3 ContentLength),
+    using the first STL_DATA_OFFSET bytes. Mirrors detect_stl_format.
+    """
+    if len(header) >= STL_DATA_OFFSET and content_length is not None:
+        declared_count = int.from_bytes(header[STL_HEADER_BYTES:STL_DATA_OFFSET], 'little')
+        if content_length == STL_DATA_OFFSET + declared_count * STL_RECORD_BYTES:
+            return 'binary'
+    if header.lstrip().lower().startswith(b'solid'):
+        return 'ascii'
+    return None
+
+
+def estimate_stl_triangles(header, content_length):
+    """
+    Returns (format, triangle_count) from the first STL_DATA_OFFSET bytes and the total size
+    of an STL file, or (None, None) if it is neither format. For binary files the count is the
+    declared one (already checked against the size); for ASCII it is estimated from the size.
+    """
+    stl_format = sniff_stl_stream_format(header, content_length)
+    if stl_format == 'binary':
+        return stl_format, int.from_bytes(header[STL_HEADER_BYTES:STL_DATA_OFFSET], 'little')
+    if stl_format == 'ascii':
+        return stl_format, (content_length or 0) // ASCII_BYTES_PER_TRIANGLE_ESTIMATE
+    return None, None
@@ -1,39 +1,404 @@
+import hashlib
 import logging
 import os
 import tempfile
-from decimal import Decimal # For precise arithmetic
+import time
+import uuid
+from datetime import datetime, timedelta
 
-import boto3
 from botocore.exceptions import ClientError
-from celery import shared_task
+from celery import chord, shared_task
 from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
 
+from . import analysis_cache, s3_io
+from .analysis_executor import AnalysisJobError, run_analysis_job
 from .models import Design, DesignStatus
 
 # Attempt to import numpy-stl
 try:
     import numpy
     from stl import mesh as stl_mesh
+    from . import stl_reader # Streaming binary/ASCII STL readers (numpy only)
+    from . import mesh_topology
+    from . import mesh_kernels
+    from . import layer_profile
+    from . import overhang
+    from . import tool_access
+    from . import wall_thickness
+    from .mesh_metrics import MeshMetricsAccumulator, format_geometric_data, quantize_value
     NUMPY_STL_AVAILABLE = True
 except ImportError:
     NUMPY_STL_AVAILABLE = False
     stl_mesh = None
+    stl_reader = None
+    mesh_topology = None
+    mesh_kernels = None
+    layer_profile = None
+    overhang = None
+    tool_access = None
+    wall_thickness = None
 
-# Attempt to import steputils
+# Streaming STEP (Part 21) reader (numpy only)
 try:
-    import steputils.p21
-    STEPUTILS_AVAILABLE = True
+    from . import step_reader
+    STEP_READER_AVAILABLE = True
 except ImportError:
-    STEPUTILS_AVAILABLE = False
-    steputils = None
+    STEP_READER_AVAILABLE = False
+    step_reader = None
+
+# Fixed-format IGES reader (numpy only)
+try:
+    from . import iges_reader
+    IGES_READER_AVAILABLE = True
+except ImportError:
+    IGES_READER_AVAILABLE = False
+    iges_reader = None
 
 logger = logging.getLogger(__name__)
 
-def perform_stl_analysis(file_path):
+# Version of the analysis pipeline as a whole. Part of the analysis cache key, so it must be
+# bumped whenever the contents of geometric_data produced for the same file would change.
+ANALYSIS_ENGINE_VERSION = "28"
+# complexity_version tags for the B-rep formats, whose scores count faces/surfaces rather than
+# measuring mesh features (mesh scores are tagged with mesh_features.COMPLEXITY_VERSION).
+STEP_COMPLEXITY_VERSION = "step-faces-v1"
+IGES_COMPLEXITY_VERSION = "iges-surfaces-v1"
+
+# Number of distinct bodies of a multi-body STL analyzed in detail and kept in geometric_data
+MESH_BODIES_KEPT = 50
+# Share of the surface no 3-axis setup may reach before a part is marked as needing 5 axes
+# (it absorbs sampling noise on tiny pockets; see analyze_tool_access).
+CNC_UNDERCUT_TOLERANCE = 0.002
+
+
+def _material_bodies(topology):
+    """
+    Returns (material, owners): the bodies made of material (an even number of bodies around
+    them: outer shells, and islands inside voids) and, for every body, the material body it
+    belongs to (itself, or for the shell of a void the body around it).
+    """
+    depths = topology.body_depths()
+    owners = numpy.where(depths % 2 == 1, topology.body_parents(), numpy.arange(topology.num_bodies))
+    return numpy.flatnonzero(depths % 2 == 0), owners
+
+
+def _format_mesh_bodies(topology):
+    """
+    Splits a multi-body mesh for geometric_data. Each body of material is one shell with the
+    shells of the voids inside it (see mesh_topology.MeshTopology.body_parents); congruent bodies
+    (equal signatures over the shell and its voids, see MeshTopology.body_properties) form one
+    part with an instance count; the full metric kernel (OBB, hull, complexity) runs once per
+    part, on one representative, largest parts first.
+    fit_envelope_mm is the per-axis maximum of one whole box per body, sorted largest first (its
+    obb_mm, i.e. the smaller of its oriented and axis-aligned boxes, for parts analyzed in detail,
+    the axis-aligned box beyond MESH_BODIES_KEPT). Every body's box fits in it, so a machine that
+    holds it can make each body on its own. bbox_envelope_mm is the same over the bodies'
+    axis-aligned boxes: a long body lying diagonally can fit a machine that way instead.
+    """
+    properties = topology.body_properties()
+    material_bodies, owners = _material_bodies(topology)
+    voids = owners != numpy.arange(topology.num_bodies)
+    # A void adds its signature to its owner's, so only bodies with the same voids are congruent.
+    void_signatures = numpy.zeros_like(properties["signature"])
+    numpy.add.at(void_signatures, owners[voids], properties["signature"][voids])
+    signatures = numpy.hstack([properties["signature"], void_signatures])[material_bodies]
+    _, first_body, group_of_body, instances = numpy.unique(
+        signatures, axis=0, return_index=True, return_inverse=True, return_counts=True
+    )
+    first_body = material_bodies[first_body]
+    part_volumes = numpy.abs(properties["volume"])
+    numpy.subtract.at(part_volumes, owners[voids], part_volumes[voids])
+    group_order = numpy.argsort(-part_volumes[first_body], kind='stable')
+    aabb_extents = -numpy.sort(-(properties["max"] - properties["min"])[material_bodies], axis=1) # Largest first
+    envelope = numpy.zeros(3)
+    outward_signs = topology.body_outward_signs()
+    parts = []
+    for group in group_order[:MESH_BODIES_KEPT]:
+        body = int(first_body[group])
+        accumulator = MeshMetricsAccumulator()
+        for shell in numpy.flatnonzero(owners == body):
+            triangles = topology.body_triangles(shell)
+            # Inside-out shells are rewound so the voids' volumes subtract from the part's.
+            accumulator.add(triangles if outward_signs[shell] > 0 else triangles[:, [0, 2, 1]])
+        body_data = format_geometric_data(accumulator.result(f"body {body}"), "")
+        parts.append({
+            "instances": int(instances[group]),
+            "volume_cm3": body_data["volume_cm3"],
+            "surface_area_cm2": body_data["surface_area_cm2"],
+            "bbox_mm": body_data["bbox_mm"],
+            "obb_mm": body_data["obb_mm"],
+            "complexity_score": body_data["complexity_score"],
+        })
+        envelope = numpy.maximum(envelope, body_data["obb_mm"])
+    remaining = numpy.isin(group_of_body.ravel(), group_order[MESH_BODIES_KEPT:])
+    if remaining.any():
+        envelope = numpy.maximum(envelope, aabb_extents[remaining].max(axis=0))
+    return {
+        "num_bodies": len(material_bodies),
+        "num_unique_bodies": len(first_body),
+        "fit_envelope_mm": [quantize_value(extent, "0.1") for extent in envelope],
+        "bbox_envelope_mm": [quantize_value(extent, "0.1") for extent in aabb_extents.max(axis=0)],
+        "parts": parts,
+        "parts_truncated": len(first_body) > MESH_BODIES_KEPT,
+    }
+
+
+def _topology_collector():
+    return mesh_topology.TriangleCollector(getattr(settings, 'CAD_ANALYSIS_TOPOLOGY_MAX_TRIANGLES', 5_000_000))
+
+
+def analyze_mesh_topology(collector, analysis_results, source_name):
+    """
+    Topology stage of STL analysis: welds the triangles gathered by collector during the metric
+    pass and adds the topology report (see mesh_topology.MeshTopology.summary) to analysis_results,
+    with volume_reliable set only for a watertight, consistently oriented mesh (signed volume is
+    meaningless otherwise); for such a mesh volume_cm3 is replaced by the sign-corrected volume
+    of its bodies. A mesh with several bodies is also split into parts (see
+    _format_mesh_bodies). Meshes above CAD_ANALYSIS_TOPOLOGY_MAX_TRIANGLES are left without a
+    report. Returns the MeshTopology, or None when it was skipped.
+    """
+    triangles = collector.triangles()
+    if triangles is None:
+        logger.info(
+            f"Topology: Skipped for {source_name}: {collector.num_triangles} triangles is above the "
+            f"limit of {collector.max_triangles}."
+        )
+        return None
+    started_at = time.perf_counter()
+    topology = mesh_topology.build_topology(triangles)
+    report = topology.summary()
+    analysis_results["topology"] = report
+    analysis_results["volume_reliable"] = report["watertight"] and report["consistently_oriented"]
+    if analysis_results["volume_reliable"]:
+        # Sign-corrected volume: outer shells add and cavities subtract whichever way each is wound
+        # (the metric pass only has the total signed volume, where inverted bodies cancel others out).
+        volume_mm3 = (topology.body_outward_signs() * topology.body_signed_volumes()).sum()
+        analysis_results["volume_cm3"] = quantize_value(volume_mm3 / 1000.0, "0.01")
+    else:
+        logger.warning(
+            f"Topology: {source_name} is not a closed, consistently oriented surface "
+            f"({report['boundary_edges']} boundary, {report['non_manifold_edges']} non-manifold and "
+            f"{report['inconsistent_edges']} inconsistently wound edges); its volume is unreliable."
+        )
+    if len(_material_bodies(topology)[0]) > 1: # Shells of voids belong to the body around them
+        analysis_results["bodies"] = _format_mesh_bodies(topology)
+    logger.info(f"Topology: Indexed {len(triangles)} triangles of {source_name} in {time.perf_counter() - started_at:.2f}s.")
+    return topology
+
+
+def analyze_wall_thickness(triangles, outward_sign, bvh, analysis_results, source_name):
+    """
+    Wall-thickness stage of STL analysis: casts CAD_ANALYSIS_THICKNESS_SAMPLES inward rays from
+    points sampled on the surface (see wall_thickness) and adds the minimum, 5th percentile and
+    median distance to the opposite wall as analysis_results["wall_thickness"].
+    """
+    num_samples = getattr(settings, 'CAD_ANALYSIS_THICKNESS_SAMPLES', 4096)
+    if num_samples <= 0:
+        return
+    started_at = time.perf_counter()
+    thicknesses = wall_thickness.measure_wall_thickness(triangles, outward_sign, num_samples, bvh=bvh)
+    if not len(thicknesses):
+        return
+    analysis_results["wall_thickness"] = {
+        "min_mm": quantize_value(thicknesses.min(), "0.01"),
+        "p5_mm": quantize_value(numpy.percentile(thicknesses, 5), "0.01"),
+        "median_mm": quantize_value(numpy.median(thicknesses), "0.01"),
+        "samples": len(thicknesses),
+    }
+    logger.info(
+        f"Wall thickness: Cast {num_samples} rays into {source_name} in {time.perf_counter() - started_at:.2f}s "
+        f"(min {analysis_results['wall_thickness']['min_mm']} mm)."
+    )
+
+
+def analyze_support(triangles, outward_sign, bvh, analysis_results, source_name):
+    """
+    Support stage of STL analysis, for additive manufacturing: with each of
+    overhang.CANDIDATE_DIRECTIONS as the build direction, measures overhang area and estimates
+    support volume from CAD_ANALYSIS_SUPPORT_SAMPLES surface samples (see overhang). Adds every
+    candidate and the best one (least support, then lowest build height) as analysis_results["support"].
+    """
+    num_samples = getattr(settings, 'CAD_ANALYSIS_SUPPORT_SAMPLES', 4096)
+    if num_samples <= 0:
+        return
+    started_at = time.perf_counter()
+    estimates = overhang.support_by_orientation(triangles, outward_sign, num_samples, bvh=bvh)
+    candidates = [
+        {
+            "up": [quantize_value(component, "0.001") for component in direction],
+            "overhang_area_cm2": quantize_value(area / 100.0, "0.01"), # mm^2 -> cm^2
+            "support_volume_cm3": quantize_value(volume / 1000.0, "0.01"), # mm^3 -> cm^3
+            "build_height_mm": quantize_value(height, "0.01"),
+        }
+        for direction, area, volume, height in zip(
+            overhang.CANDIDATE_DIRECTIONS, estimates["overhang_area"], estimates["support_volume"], estimates["build_height"]
+        )
+    ]
+    # Compared as reported, so ties (e.g. several flat faces to stand on) go to the first candidate.
+    best = min(candidates, key=lambda candidate: (candidate["support_volume_cm3"], candidate["build_height_mm"]))
+    analysis_results["support"] = {
+        "overhang_degrees": overhang.OVERHANG_DEGREES,
+        "best": best,
+        "candidates": candidates,
+    }
+    logger.info(
+        f"Support: Evaluated {len(candidates)} build directions for {source_name} in "
+        f"{time.perf_counter() - started_at:.2f}s (best needs {best['support_volume_cm3']} cm3)."
+    )
+
+
+def analyze_tool_access(triangles, outward_sign, bvh, analysis_results, source_name, enclosed=None):
+    """
+    CNC access stage of STL analysis: samples CAD_ANALYSIS_ACCESS_SAMPLES surface points and
+    checks which of the six principal 3-axis setups reach each with a ball-end tool of radius
+    CAD_ANALYSIS_TOOL_RADIUS_MM (see tool_access). Adds the fewest setups that reach everything
+    reachable, the undercut area no setup reaches and needs_5_axis (undercuts above
+    CNC_UNDERCUT_TOLERANCE of the surface) as analysis_results["cnc_access"], so manufacturer
+    filtering can use it without the mesh. Facets flagged in enclosed (the walls of sealed
+    cavities) are not undercuts; their area is reported as sealed_cavity_area_cm2.
+    """
+    num_samples = getattr(settings, 'CAD_ANALYSIS_ACCESS_SAMPLES', 4096)
+    if num_samples <= 0:
+        return
+    tool_radius = getattr(settings, 'CAD_ANALYSIS_TOOL_RADIUS_MM', 1.5)
+    started_at = time.perf_counter()
+    visible, total_area, facing, sealed = tool_access.setup_visibility(
+        triangles, outward_sign, num_samples, tool_radius, bvh=bvh, enclosed=enclosed
+    )
+    sample_area = total_area / num_samples
+    undercut_fraction = float(numpy.count_nonzero(~visible.any(axis=1) & ~sealed)) / num_samples
+    setups = tool_access.minimum_setups(visible)
+    analysis_results["cnc_access"] = {
+        "setups": len(setups),
+        "setup_directions": [tool_access.SETUP_LABELS[setup] for setup in setups],
+        "tool_radius_mm": tool_radius,
+        "undercut_area_cm2": quantize_value(undercut_fraction * total_area / 100.0, "0.01"), # mm^2 -> cm^2
+        "undercut_fraction": quantize_value(undercut_fraction, "0.0001"),
+        "sealed_cavity_area_cm2": quantize_value(numpy.count_nonzero(sealed) * sample_area / 100.0, "0.01"),
+        "needs_5_axis": undercut_fraction > CNC_UNDERCUT_TOLERANCE,
+        "directions": {
+            label: {
+                "facing_area_cm2": quantize_value(facing_area / 100.0, "0.01"),
+                "visible_area_cm2": quantize_value(count * sample_area / 100.0, "0.01"),
+            }
+            for label, facing_area, count in zip(tool_access.SETUP_LABELS, facing, visible.sum(axis=0))
+        },
+    }
+    logger.info(
+        f"CNC access: Checked {len(tool_access.SETUP_LABELS)} setups of {source_name} in "
+        f"{time.perf_counter() - started_at:.2f}s ({len(setups)} setups, {undercut_fraction:.2%} undercut)."
+    )
+
+
+def analyze_layer_profile(triangles, outward_sign, analysis_results, source_name):
+    """
+    Layer-profile stage of STL analysis: cross-sectional area and perimeter per layer of
+    CAD_ANALYSIS_LAYER_HEIGHT_MM (see layer_profile), stacked along the best build direction
+    of the support stage (+z without one), stored run-length encoded as
+    analysis_results["layer_profile"]; layer_profile.expand_layer_profile decodes it.
+    """
+    layer_height = getattr(settings, 'CAD_ANALYSIS_LAYER_HEIGHT_MM', 0.1)
+    if layer_height <= 0:
+        return
+    started_at = time.perf_counter()
+    up = numpy.asarray((analysis_results.get("support") or {}).get("best", {}).get("up", [0.0, 0.0, 1.0]), dtype=numpy.float64)
+    up /= numpy.linalg.norm(up) # Stored directions are rounded
+    areas, perimeters, layer_height = layer_profile.layer_areas_and_perimeters(triangles, outward_sign, up, layer_height)
+    runs = layer_profile.compress_profile(areas, perimeters)
+    analysis_results["layer_profile"] = {
+        "up": [quantize_value(component, "0.001") for component in up],
+        "layer_height_mm": round(layer_height, 6),
+        "num_layers": len(areas),
+        "runs": runs, # [first layer, area mm^2, perimeter mm]; each run lasts until the next one starts
+    }
+    logger.info(
+        f"Layer profile: Measured {len(areas)} layers of {source_name} ({len(runs)} runs) in "
+        f"{time.perf_counter() - started_at:.2f}s."
+    )
+
+
+def analyze_mesh_stages(collector, analysis_results, source_name):
+    """
+    Runs the stages that need the whole mesh in memory: topology, then wall thickness, support
+    and CNC access (which share one BVH) and the layer profile. Those need to know which way is outward, so they
+    only run on meshes with a reliable volume (closed and consistently oriented).
+    """
+    topology = analyze_mesh_topology(collector, analysis_results, source_name)
+    if topology is None or not analysis_results.get("volume_reliable"):
+        return
+    valid = topology.valid_faces
+    triangles = topology.vertices[topology.faces[valid]]
+    # Inside-out bodies have normals facing into the material; flip them per facet (cavity
+    # shells are nested by ray parity and keep their normals, which face into the void).
+    outward_sign = topology.body_outward_signs()[topology.face_bodies[valid]]
+    # Facets on the shells of sealed cavities (odd nesting depth, see _material_bodies)
+    enclosed = topology.body_depths()[topology.face_bodies[valid]] % 2 == 1
+    ray_budgets = ('CAD_ANALYSIS_THICKNESS_SAMPLES', 'CAD_ANALYSIS_SUPPORT_SAMPLES', 'CAD_ANALYSIS_ACCESS_SAMPLES')
+    if any(getattr(settings, name, 4096) > 0 for name in ray_budgets):
+        started_at = time.perf_counter()
+        bvh = wall_thickness.TriangleBVH(triangles)
+        logger.info(f"Mesh stages: Built a BVH over {len(triangles)} triangles of {source_name} in {time.perf_counter() - started_at:.2f}s.")
+        analyze_wall_thickness(triangles, outward_sign, bvh, analysis_results, source_name)
+        analyze_support(triangles, outward_sign, bvh, analysis_results, source_name)
+        analyze_tool_access(triangles, outward_sign, bvh, analysis_results, source_name, enclosed=enclosed)
+    analyze_layer_profile(triangles, outward_sign, analysis_results, source_name)
+
+
+def kernels_for_material(material):
+    """
+    Names of the process-specific metric kernels (see mesh_kernels) to run for a design of this
+    material: those serving the material's processes in CAD_ANALYSIS_MATERIAL_PROCESSES (keys
+    lower-case), or every registered kernel for materials it does not list.
+    """
+    material_processes = getattr(settings, 'CAD_ANALYSIS_MATERIAL_PROCESSES', None) or mesh_kernels.MATERIAL_PROCESSES
+    return mesh_kernels.kernels_for_processes(mesh_kernels.processes_for_material(material, material_processes))
+
+
+def analysis_cache_version(kernel_names):
+    """
+    Analysis cache engine_version for an STL analyzed with kernel_names (None: all kernels).
+    The same file gets a different geometric_data["kernels"] for another kernel selection,
+    so the selection is part of the key.
+    """
+    if kernel_names is None:
+        kernel_names = mesh_kernels.kernels_for_processes()
+    selection = hashlib.sha1(",".join(sorted(kernel_names)).encode()).hexdigest()[:8]
+    return f"{ANALYSIS_ENGINE_VERSION}-k{selection}"
+
+
+def analyze_kernels(scheduler, analysis_results, source_name):
+    """
+    Adds the results of a mesh_kernels.KernelScheduler fed during the read as
+    analysis_results["kernels"] (by kernel name), and the time spent per intermediate and per
+    kernel as analysis_results["kernel_timings_ms"] (summed over shards for a sharded analysis).
     """
-    Performs CAD analysis on an STL file using numpy-stl.
-    Extracts volume, bounding box, surface area, and a complexity score.
+    if not scheduler.kernels:
+        return
+    analysis_results["kernels"] = scheduler.results()
+    analysis_results["kernel_timings_ms"] = scheduler.timings_ms()
+    timings = ", ".join(
+        f"{name} {milliseconds:.1f}ms"
+        for group in analysis_results["kernel_timings_ms"].values() for name, milliseconds in group.items()
+    )
+    logger.info(f"Kernels: Ran {len(scheduler.kernels)} kernels over {source_name} ({timings}).")
+
+
+def perform_stl_analysis(file_path, kernels=None, mesh_stages=True):
+    """
+    Performs CAD analysis on an STL file.
+    Binary STL files are streamed through a memory map in fixed-size chunks (see stl_reader),
+    so large uploads do not have to fit in worker memory. ASCII files are parsed in large blocks
+    by stl_reader's vectorized ASCII reader.
+    Extracts volume, bounding box, surface area, a feature-based complexity score (see
+    mesh_features), the oriented bounding box and convex hull / stock / removed-material
+    volumes for machining cost, the mesh topology and, for closed meshes, wall thickness,
+    CNC setups / undercuts, and support estimates and the layer profile for additive manufacturing.
+    The process-specific metric kernels named in kernels (all registered ones for None; see
+    mesh_kernels) run on the same chunks during the read. mesh_stages=False leaves out the
+    whole-mesh stages (analyze_mesh_stages) for the fast phase of a two-phase analysis;
+    perform_stl_enrichment runs them later.
     Assumes STL units are in millimeters (mm).
     """
     if not NUMPY_STL_AVAILABLE:
@@ -42,169 +407,741 @@ def perform_stl_analysis(file_path):
 
     logger.info(f"STL Analysis: Starting for file {file_path}...")
 
+    stl_format = stl_reader.detect_stl_format(file_path)
+    if stl_format is None:
+        # Neither a size-consistent binary file nor an ASCII 'solid' file (e.g. truncated upload).
+        logger.error(f"STL Analysis: {file_path} is neither a valid binary nor an ASCII STL file.")
+        raise ValueError(f"Invalid or corrupt STL file: {os.path.basename(file_path)}")
+
+    collector = _topology_collector() if mesh_stages else None
+    scheduler = mesh_kernels.KernelScheduler(kernels)
+    sinks = [collector] if mesh_stages else []
+    if stl_format == 'binary':
+        chunk_triangles = getattr(settings, 'CAD_ANALYSIS_STL_CHUNK_TRIANGLES', stl_reader.DEFAULT_CHUNK_TRIANGLES)
+        try:
+            metrics = stl_reader.stream_binary_stl_metrics(file_path, chunk_triangles=chunk_triangles, sinks=sinks, kernels=scheduler)
+        except ValueError as e:
+            logger.error(f"STL Analysis: Failed to stream binary STL file {file_path}: {e}")
+            raise ValueError(f"Invalid or corrupt STL file: {os.path.basename(file_path)}") from e
+        analysis_engine = f"{stl_reader.STREAM_ENGINE_NAME}-v{stl_reader.STREAM_ENGINE_VERSION}"
+    else:
+        # Vectorized ASCII parser: vertex lines are converted in bulk rather than line by line.
+        try:
+            metrics = stl_reader.stream_ascii_stl_metrics(file_path, sinks=sinks, kernels=scheduler)
+        except ValueError as e:
+            logger.error(f"STL Analysis: Failed to parse ASCII STL file {file_path}: {e}")
+            raise ValueError(f"Invalid or corrupt STL file: {os.path.basename(file_path)}") from e
+        analysis_engine = f"{stl_reader.ASCII_ENGINE_NAME}-v{stl_reader.ASCII_ENGINE_VERSION}"
+
+    analysis_results = format_geometric_data(metrics, analysis_engine)
+    analyze_kernels(scheduler, analysis_results, os.path.basename(file_path))
+    if mesh_stages:
+        analyze_mesh_stages(collector, analysis_results, os.path.basename(file_path))
+    logger.info(f"STL Analysis: Completed for {file_path}. Results: {analysis_results}")
+    return analysis_results
+
+
+# Number of most frequent entity types kept in a STEP design's geometric_data
+STEP_ENTITY_COUNTS_KEPT = 15
+STEP_ASSEMBLY_PARTS_KEPT = 50
+
+
+def _format_step_assembly(assembly):
+    """
+    Compacts StepAssemblyStructure.result() for geometric_data: the leaf parts (the ones that get
+    made), most-used first, with instance counts and faces per part and across all instances.
+    """
+    leaf_parts = [part for part in assembly["parts"] if not part["is_assembly"] and part["instances"]]
+    leaf_parts.sort(key=lambda part: (-part["instances"], part["product_id"], part["name"]))
+    return {
+        "num_unique_parts": len(leaf_parts),
+        "num_part_instances": sum(part["instances"] for part in leaf_parts),
+        "num_subassemblies": sum(1 for part in assembly["parts"] if part["is_assembly"]),
+        "total_faces": sum(part["instances"] * part["num_faces"] for part in leaf_parts),
+        "parts": [
+            {
+                "product_id": part["product_id"],
+                "name": part["name"],
+                "instances": part["instances"],
+                "num_faces": part["num_faces"],
+            }
+            for part in leaf_parts[:STEP_ASSEMBLY_PARTS_KEPT]
+        ],
+        "parts_truncated": len(leaf_parts) > STEP_ASSEMBLY_PARTS_KEPT,
+    }
+
+
+def perform_step_analysis(file_path):
+    """
+    Performs CAD analysis on a STEP (Part 21) file in one streaming pass (see step_reader).
+    Extracts the bounding box of its 3D points in mm (using the file's length unit), entity
+    counts and a complexity score based on the number of B-rep faces. Volume and surface area
+    need a geometry kernel and are not computed. When the file places shapes with
+    transformations, bbox_mm is the conservative bbox of the assembled product composed from
+    those placements (bbox_conservative is True), and bbox_reliable is False only when the
+    placements cannot be resolved and the bbox is of untransformed parts.
+    For assemblies, the product tree from the same pass is stored as a part list: each distinct
+    part is evaluated once and carries its total instance count across the tree.
+    """
+    if not STEP_READER_AVAILABLE:
+        logger.error("numpy is not available. Cannot perform STEP analysis.")
+        raise RuntimeError("STEP analysis library (numpy) not installed.")
+
+    logger.info(f"STEP Analysis: Starting for file {file_path}...")
     try:
-        main_mesh = stl_mesh.Mesh.from_file(file_path)
-    except Exception as e: # Catch broad exceptions from stl library loading
-        logger.error(f"STL Analysis: Failed to load/parse STL file {file_path}: {e}")
-        raise ValueError(f"Invalid or corrupt STL file: {os.path.basename(file_path)}") from e
+        assembly_structure = step_reader.StepAssemblyStructure()
+        metrics, throughput = step_reader.summarize_step_file(file_path, consumers=[assembly_structure])
+        assembly = assembly_structure.result()
+    except ValueError as e:
+        logger.error(f"STEP Analysis: Failed to parse STEP file {file_path}: {e}")
+        raise ValueError(f"Invalid or corrupt STEP file: {os.path.basename(file_path)}: {e}") from e
+    logger.info(
+        f"STEP Analysis: Parsed {throughput['entities']} entities ({throughput['bytes']} bytes) in "
+        f"{throughput['seconds']}s: {throughput['mb_per_second']} MB/s, {throughput['entities_per_second']} entities/s"
+    )
+
+    entity_counts = metrics["entity_counts"]
+    num_faces = entity_counts.get("ADVANCED_FACE", 0) + entity_counts.get("FACE_SURFACE", 0)
+    # Complexity Score (heuristic: B-rep faces / 1000, or entities / 100000 without faces, capped at 1.0)
+    complexity_score = min(num_faces / 1000.0 if num_faces else metrics["num_entities"] / 100000.0, 1.0)
+    top_counts = sorted(entity_counts.items(), key=lambda item: (-item[1], item[0]))[:STEP_ENTITY_COUNTS_KEPT]
+
+    min_corner, max_corner = metrics["min_mm"], metrics["max_mm"]
+    placed = metrics["placements"] and metrics["placed_min_mm"] is not None
+    if placed:
+        min_corner, max_corner = metrics["placed_min_mm"], metrics["placed_max_mm"]
+
+    analysis_results = {
+        "bbox_mm": [
+            quantize_value(max_mm - min_mm, "0.1") for min_mm, max_mm in zip(min_corner, max_corner)
+        ],
+        "length_unit": metrics["length_unit"],
+        "complexity_score": quantize_value(complexity_score, "0.01"),
+        "complexity_version": STEP_COMPLEXITY_VERSION,
+        "num_faces": num_faces,
+        "num_entities": metrics["num_entities"],
+        "entity_counts": dict(top_counts),
+        # Placed parts are measured in their own frames (see step_reader.StepGeometrySummary); the
+        # placed bbox contains the assembled product, and without it the bbox must not be quoted on.
+        "bbox_reliable": not metrics["placements"] or placed,
+        "analysis_engine": f"{step_reader.STEP_ENGINE_NAME}-v{step_reader.STEP_ENGINE_VERSION}"
+    }
+    if placed:
+        analysis_results["bbox_conservative"] = True
+    elif not analysis_results["bbox_reliable"]:
+        logger.warning(
+            f"STEP Analysis: {file_path} places {metrics['placements']} shape(s) with transformations that "
+            f"could not be resolved; its bbox is of untransformed parts and is unreliable."
+        )
+    if assembly["num_occurrences"]:
+        analysis_results["assembly"] = _format_step_assembly(assembly)
+    logger.info(f"STEP Analysis: Completed for {file_path}. Results: {analysis_results}")
+    return analysis_results
 
-    # Volume: numpy-stl returns volume in units^3 of the STL file. Assuming mm^3.
-    # Convert to cm^3 (1 cm^3 = 1000 mm^3)
-    volume_mm3 = main_mesh.volume
-    volume_cm3 = Decimal(str(volume_mm3)) / Decimal("1000.0")
-
-    # Bounding Box (bbox_mm): Get min/max extents and calculate dimensions.
-    # mesh.min_ and mesh.max_ give [xmin, ymin, zmin] and [xmax, ymax, zmax]
-    min_coords = main_mesh.min_
-    max_coords = main_mesh.max_
-    bbox_mm = [
-        float(Decimal(str(max_coords[i])) - Decimal(str(min_coords[i]))) for i in range(3)
-    ]
 
-    # Surface Area: numpy-stl returns area in units^2. Assuming mm^2.
-    # Convert to cm^2 (1 cm^2 = 100 mm^2)
-    surface_area_mm2 = main_mesh.area
-    surface_area_cm2 = Decimal(str(surface_area_mm2)) / Decimal("100.0")
+IGES_ENTITY_COUNTS_KEPT = 15
+
+def perform_iges_analysis(file_path):
+    """
+    Performs CAD analysis on a fixed-format IGES file in one streaming pass (see iges_reader).
+    Extracts the bounding box of its model-space geometry in mm (applying transformation
+    matrices, the global units flag and model scale), entity counts and a complexity score
+    based on the number of surface entities. Volume and surface area are not computed.
+    """
+    if not IGES_READER_AVAILABLE:
+        logger.error("numpy is not available. Cannot perform IGES analysis.")
+        raise RuntimeError("IGES analysis library (numpy) not installed.")
+
+    logger.info(f"IGES Analysis: Starting for file {file_path}...")
+    try:
+        metrics, throughput = iges_reader.summarize_iges_file(file_path)
+    except ValueError as e:
+        logger.error(f"IGES Analysis: Failed to parse IGES file {file_path}: {e}")
+        raise ValueError(f"Invalid or corrupt IGES file: {os.path.basename(file_path)}: {e}") from e
+    logger.info(
+        f"IGES Analysis: Parsed {throughput['entities']} entities ({throughput['bytes']} bytes) in "
+        f"{throughput['seconds']}s: {throughput['mb_per_second']} MB/s, {throughput['entities_per_second']} entities/s"
+    )
 
-    # Complexity Score (heuristic: number of triangles / 10000, capped at 1.0)
-    # This is a very basic heuristic. A more sophisticated score would be better.
-    num_triangles = main_mesh.vectors.shape[0]
-    complexity_score = min(Decimal(str(num_triangles)) / Decimal("10000.0"), Decimal("1.0"))
+    num_surfaces = metrics["num_surfaces"]
+    # Complexity Score (heuristic: surfaces / 1000, or entities / 100000 without surfaces, capped at 1.0)
+    complexity_score = min(num_surfaces / 1000.0 if num_surfaces else metrics["num_entities"] / 100000.0, 1.0)
+    top_counts = sorted(metrics["entity_counts"].items(), key=lambda item: (-item[1], item[0]))[:IGES_ENTITY_COUNTS_KEPT]
 
     analysis_results = {
-        "volume_cm3": float(volume_cm3.quantize(Decimal("0.01"))), # Store as float after rounding
-        "bbox_mm": [float(Decimal(str(d)).quantize(Decimal("0.1"))) for d in bbox_mm],
-        "surface_area_cm2": float(surface_area_cm2.quantize(Decimal("0.01"))),
-        "complexity_score": float(complexity_score.quantize(Decimal("0.01"))),
-        "num_triangles": num_triangles,
-        "analysis_engine": f"numpy-stl-v{stl_mesh.VERSION if hasattr(stl_mesh, 'VERSION') else 'unknown'}"
+        "bbox_mm": [
+            quantize_value(max_mm - min_mm, "0.1") for min_mm, max_mm in zip(metrics["min_mm"], metrics["max_mm"])
+        ],
+        "length_unit": metrics["length_unit"],
+        "complexity_score": quantize_value(complexity_score, "0.01"),
+        "complexity_version": IGES_COMPLEXITY_VERSION,
+        "num_surfaces": num_surfaces,
+        "num_entities": metrics["num_entities"],
+        "entity_counts": dict(top_counts),
+        "analysis_engine": f"{iges_reader.IGES_ENGINE_NAME}-v{iges_reader.IGES_ENGINE_VERSION}"
     }
-    logger.info(f"STL Analysis: Completed for {file_path}. Results: {analysis_results}")
+    logger.info(f"IGES Analysis: Completed for {file_path}. Results: {analysis_results}")
     return analysis_results
 
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def analyze_cad_file(self, design_id):
-    logger.info(f"Celery Task: Starting CAD analysis for Design ID: {design_id}")
+def perform_s3_stl_stream_analysis(bucket, key, compute_sha256=False, kernels=None, mesh_stages=True):
+    """
+    Analyzes an STL object by reading the S3 get_object body straight into the parser,
+    without staging it on local disk. Binary STL is reduced chunk by chunk as it arrives;
+    ASCII STL (read by perform_stl_analysis from a file) is spooled to a temp file.
+    kernels and mesh_stages are as in perform_stl_analysis.
+    Returns (analysis_results, transfer_info) where transfer_info holds bytes_read,
+    time_to_first_byte_ms, elapsed_ms, whether a temp file was used and, if requested,
+    the SHA-256 content_digest of the object.
+    ClientError from get_object propagates to the caller.
+    """
+    if not NUMPY_STL_AVAILABLE:
+        logger.error("numpy-stl library is not available. Cannot perform STL analysis.")
+        raise RuntimeError("STL analysis library (numpy-stl) not installed.")
+
+    s3_client = s3_io.get_s3_client()
+    file_name = os.path.basename(key)
+    logger.info(f"STL Analysis: Streaming s3://{bucket}/{key}...")
+
+    stream, content_length = s3_io.open_s3_stream(s3_client, bucket, key, compute_sha256=compute_sha256)
+    used_temp_file = False
     try:
-        with transaction.atomic(): # Ensure DB operations are atomic for this task instance
-            # Fetch the design object safely, ensuring it's not processed if status changed
-            design = Design.objects.select_for_update().get(id=design_id)
-
-            if design.status != DesignStatus.PENDING_ANALYSIS:
-                logger.warning(f"Design ID {design_id} is not in PENDING_ANALYSIS status (current: {design.status}). Skipping analysis.")
-                return f"Skipped: Design {design_id} not in PENDING_ANALYSIS status."
-
-            s3_client = boto3.client(
-                's3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME,
-                endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-                config=boto3.session.Config(signature_version=settings.AWS_S3_SIGNATURE_VERSION)
+        header = stl_reader._read_exactly(stream, stl_reader.STL_DATA_OFFSET)
+        stl_format = stl_reader.sniff_stl_stream_format(header, content_length)
+        if stl_format is None:
+            logger.error(f"STL Analysis: s3://{bucket}/{key} is neither a valid binary nor an ASCII STL file.")
+            raise ValueError(f"Invalid or corrupt STL file: {file_name}")
+
+        if stl_format == 'binary':
+            chunk_triangles = getattr(settings, 'CAD_ANALYSIS_STL_CHUNK_TRIANGLES', stl_reader.DEFAULT_CHUNK_TRIANGLES)
+            collector = _topology_collector() if mesh_stages else None
+            scheduler = mesh_kernels.KernelScheduler(kernels)
+            try:
+                metrics = stl_reader.stream_binary_stl_metrics_from_stream(
+                    stream, chunk_triangles=chunk_triangles, header=header, source_name=file_name,
+                    sinks=[collector] if mesh_stages else [], kernels=scheduler
+                )
+            except ValueError as e:
+                logger.error(f"STL Analysis: Failed to stream binary STL s3://{bucket}/{key}: {e}")
+                raise ValueError(f"Invalid or corrupt STL file: {file_name}") from e
+            analysis_results = format_geometric_data(
+                metrics, f"{stl_reader.STREAM_ENGINE_NAME}-v{stl_reader.STREAM_ENGINE_VERSION}"
             )
+            analyze_kernels(scheduler, analysis_results, file_name)
+            if mesh_stages:
+                analyze_mesh_stages(collector, analysis_results, file_name)
+        else:
+            # The ASCII parser needs a file; this is the only STL case that touches local disk.
+            used_temp_file = True
+            with tempfile.NamedTemporaryFile(delete=True, suffix='.stl') as tmp_file:
+                tmp_file.write(header)
+                stream.drain_to(tmp_file)
+                tmp_file.flush()
+                analysis_results = perform_stl_analysis(tmp_file.name, kernels=kernels, mesh_stages=mesh_stages)
+    finally:
+        stream.close()
+
+    transfer_info = stream.transfer_stats()
+    transfer_info["used_temp_file"] = used_temp_file
+    transfer_info["content_digest"] = stream.sha256_digest
+    logger.info(f"STL Analysis: Completed streaming s3://{bucket}/{key}. Results: {analysis_results}")
+    return analysis_results, transfer_info
+
+
+def _collect_mesh_stages(chunks, source_name):
+    # Enrichment pass: the chunks only go into the topology collector (the metrics are already stored).
+    collector = _topology_collector()
+    for vectors in chunks:
+        collector.add(vectors)
+    enrichment = {}
+    analyze_mesh_stages(collector, enrichment, source_name)
+    return enrichment
+
+
+def perform_stl_enrichment(file_path):
+    """
+    Enrichment phase of a two-phase STL analysis: reads the file again and runs only the
+    whole-mesh stages left out of the fast phase (topology, wall thickness, support, CNC access,
+    layer profile; see analyze_mesh_stages). Returns the geometric_data keys they produce.
+    """
+    if not NUMPY_STL_AVAILABLE:
+        logger.error("numpy-stl library is not available. Cannot perform STL analysis.")
+        raise RuntimeError("STL analysis library (numpy-stl) not installed.")
+
+    stl_format = stl_reader.detect_stl_format(file_path)
+    if stl_format is None:
+        raise ValueError(f"Invalid or corrupt STL file: {os.path.basename(file_path)}")
+    if stl_format == 'binary':
+        chunk_triangles = getattr(settings, 'CAD_ANALYSIS_STL_CHUNK_TRIANGLES', stl_reader.DEFAULT_CHUNK_TRIANGLES)
+        chunks = stl_reader.iter_binary_stl_chunks(file_path, chunk_triangles=chunk_triangles)
+    else:
+        chunks = stl_reader.iter_ascii_stl_chunks(file_path)
+    try:
+        return _collect_mesh_stages(chunks, os.path.basename(file_path))
+    except ValueError as e:
+        raise ValueError(f"Invalid or corrupt STL file: {os.path.basename(file_path)}") from e
+
+
+def perform_s3_stl_enrichment(bucket, key):
+    """Same as perform_stl_enrichment, for an STL object read from the S3 get_object stream."""
+    if not NUMPY_STL_AVAILABLE:
+        logger.error("numpy-stl library is not available. Cannot perform STL analysis.")
+        raise RuntimeError("STL analysis library (numpy-stl) not installed.")
+
+    file_name = os.path.basename(key)
+    stream, content_length = s3_io.open_s3_stream(s3_io.get_s3_client(), bucket, key)
+    try:
+        header = stl_reader._read_exactly(stream, stl_reader.STL_DATA_OFFSET)
+        stl_format = stl_reader.sniff_stl_stream_format(header, content_length)
+        if stl_format is None:
+            raise ValueError(f"Invalid or corrupt STL file: {file_name}")
+        if stl_format == 'binary':
+            chunk_triangles = getattr(settings, 'CAD_ANALYSIS_STL_CHUNK_TRIANGLES', stl_reader.DEFAULT_CHUNK_TRIANGLES)
+            chunks = stl_reader.iter_binary_stl_stream_chunks(stream, chunk_triangles=chunk_triangles, header=header)
+            try:
+                return _collect_mesh_stages(chunks, file_name)
+            except ValueError as e:
+                raise ValueError(f"Invalid or corrupt STL file: {file_name}") from e
+        with tempfile.NamedTemporaryFile(delete=True, suffix='.stl') as tmp_file:
+            tmp_file.write(header)
+            stream.drain_to(tmp_file)
+            tmp_file.flush()
+            return perform_stl_enrichment(tmp_file.name)
+    finally:
+        stream.close()
+
+
+def triage_stl_object(s3_client, bucket, key, object_size):
+    """
+    Peeks at the first bytes of an STL object with one ranged read and decides how to process it,
+    before anything is downloaded. Returns (route, info) where route is:
+      'inline' - small enough to analyze in this task,
+      'heavy'  - more than CAD_ANALYSIS_STL_INLINE_MAX_TRIANGLES; belongs on the heavy-analysis queue,
+      'reject' - corrupt (declared size doesn't match the object) or above CAD_ANALYSIS_STL_MAX_TRIANGLES.
+    info holds format, triangles (declared, or estimated for ASCII) and, for rejects, an error message.
+    """
+    header = s3_io.read_s3_range(s3_client, bucket, key, 0, stl_reader.STL_DATA_OFFSET)
+    stl_format, triangles = stl_reader.estimate_stl_triangles(header, object_size)
+    info = {"format": stl_format, "triangles": triangles}
+    if stl_format is None:
+        info["error"] = f"Invalid or corrupt STL file: {os.path.basename(key)}"
+        return 'reject', info
+
+    max_triangles = getattr(settings, 'CAD_ANALYSIS_STL_MAX_TRIANGLES', 50_000_000)
+    if triangles > max_triangles:
+        info["error"] = f"STL file has {triangles} triangles; the limit is {max_triangles}."
+        return 'reject', info
+    if triangles > getattr(settings, 'CAD_ANALYSIS_STL_INLINE_MAX_TRIANGLES', 2_000_000):
+        return 'heavy', info
+    return 'inline', info
+
+
+def plan_stl_shards(triangle_count, shard_triangles):
+    """Splits [0, triangle_count) into consecutive (start, count) ranges of at most shard_triangles."""
+    if shard_triangles <= 0:
+        raise ValueError("shard_triangles must be a positive integer.")
+    return [
+        (start, min(shard_triangles, triangle_count - start))
+        for start in range(0, triangle_count, shard_triangles)
+    ]
+
+
+def perform_stl_shard_analysis(bucket, key, start_triangle, triangle_count, kernels=None):
+    """
+    Reduces one range of binary STL records, fetched with a single ranged GET, and returns the
+    partial MeshMetricsAccumulator state, with the partial state of the metric kernels named in
+    kernels under "kernels". Raises ValueError for corrupt records.
+    """
+    chunk_triangles = getattr(settings, 'CAD_ANALYSIS_STL_CHUNK_TRIANGLES', stl_reader.DEFAULT_CHUNK_TRIANGLES)
+    offset = stl_reader.STL_DATA_OFFSET + start_triangle * stl_reader.STL_RECORD_BYTES
+    stream = s3_io.open_s3_range_stream(
+        s3_io.get_s3_client(), bucket, key, offset, triangle_count * stl_reader.STL_RECORD_BYTES
+    )
+    scheduler = mesh_kernels.KernelScheduler(kernels)
+    accumulator = MeshMetricsAccumulator(kernels=scheduler)
+    try:
+        for vectors in stl_reader.iter_binary_stl_record_chunks(stream, triangle_count, chunk_triangles):
+            accumulator.add(vectors)
+    finally:
+        stream.close()
+    logger.info(f"STL shard {start_triangle}+{triangle_count} of s3://{bucket}/{key}: {stream.transfer_stats()}")
+    partial = accumulator.to_partial()
+    partial["kernels"] = scheduler.to_partial()
+    return partial
+
+
+@shared_task
+def analyze_stl_shard(bucket, key, start_triangle, triangle_count, kernels=None):
+    """
+    Map step of sharded STL analysis: runs perform_stl_shard_analysis on one range of records,
+    in an isolated job process like the single-worker analysis (see _run_job_function), and
+    returns its partial state. Content errors and aborted jobs are returned as {"error": ...}
+    (rather than raised) so the chord callback still runs and can fail the design; a shard that
+    dies outright (or an S3 error) leaves the lease to expire and be re-queued.
+    """
+    try:
+        return _run_job_function(perform_stl_shard_analysis, bucket, key, start_triangle, triangle_count, kernels)
+    except AnalysisJobError as e: # Killed (timeout/memory) or its process died
+        logger.error(f"STL shard {start_triangle}+{triangle_count} of s3://{bucket}/{key} aborted: {e}")
+        return {"error": f"Analysis aborted: {e}"}
+    except ValueError as e:
+        logger.error(f"STL shard {start_triangle}+{triangle_count} of s3://{bucket}/{key} failed: {e}")
+        return {"error": f"Invalid or corrupt STL file: {os.path.basename(key)}"}
+
+
+@shared_task
+def merge_stl_shards(partials, design_id, lease_token, content_digest=None, cache_version=ANALYSIS_ENGINE_VERSION):
+    """
+    Reduce step (chord callback) of sharded STL analysis: sums partial volumes/areas, merges
+    bboxes and kernel states and commits the result under the lease taken by analyze_cad_file,
+    caching it under cache_version (see analysis_cache_version). Sharded meshes are above
+    CAD_ANALYSIS_TOPOLOGY_MAX_TRIANGLES by default and get no topology report.
+    """
+    errors = [partial["error"] for partial in partials if "error" in partial]
+    if errors:
+        status, geometric_data = DesignStatus.ANALYSIS_FAILED, {"error": f"Analysis failed: {errors[0]}"}
+    else:
+        merged = MeshMetricsAccumulator()
+        scheduler = None
+        for partial in partials:
+            merged.merge(MeshMetricsAccumulator.from_partial(partial))
+            shard_scheduler = mesh_kernels.KernelScheduler.from_partial(partial["kernels"])
+            if scheduler is None:
+                scheduler = shard_scheduler
+            else:
+                scheduler.merge(shard_scheduler)
+        status = DesignStatus.ANALYSIS_COMPLETE
+        geometric_data = format_geometric_data(
+            merged.result(f"design {design_id}"), f"{stl_reader.STREAM_ENGINE_NAME}-v{stl_reader.STREAM_ENGINE_VERSION}"
+        )
+        analyze_kernels(scheduler, geometric_data, f"design {design_id}")
+
+    if not commit_analysis_result(design_id, lease_token, status, geometric_data):
+        return f"Skipped: Analysis lease for Design {design_id} was lost; result discarded."
+    if status == DesignStatus.ANALYSIS_COMPLETE:
+        analysis_cache.store_analysis(content_digest, cache_version, geometric_data)
+    logger.info(f"Successfully processed Design ID: {design_id} from {len(partials)} shards. Final status: {status}")
+    return f"Successfully processed Design ID: {design_id} from {len(partials)} shards. Final status: {status}"
+
+
+def _lease_is_stale(design, now):
+    lease_seconds = getattr(settings, 'CAD_ANALYSIS_LEASE_SECONDS', 30 * 60)
+    return design.analysis_leased_at is None or design.analysis_leased_at <= now - timedelta(seconds=lease_seconds)
+
+
+def claim_design_for_analysis(design_id):
+    """
+    Moves a design from PENDING_ANALYSIS (or ANALYZING with an expired lease) to ANALYZING
+    inside a short transaction and returns (design, lease_token).
+    lease_token is None if the design is not claimable; the row lock is released on return.
+    Raises Design.DoesNotExist if the design is gone.
+    """
+    with transaction.atomic():
+        design = Design.objects.select_for_update().get(id=design_id)
+        now = timezone.now()
+        if design.status == DesignStatus.ANALYZING and _lease_is_stale(design, now):
+            logger.warning(f"Design ID {design_id}: reclaiming stale analysis lease from {design.analysis_leased_at}.")
+        elif design.status != DesignStatus.PENDING_ANALYSIS:
+            return design, None
+
+        design.status = DesignStatus.ANALYZING
+        design.analysis_lease_token = uuid.uuid4()
+        design.analysis_leased_at = now
+        design.save(update_fields=['status', 'analysis_lease_token', 'analysis_leased_at', 'updated_at'])
+        return design, design.analysis_lease_token
+
+
+def commit_analysis_result(design_id, lease_token, status, geometric_data):
+    """
+    Writes the analysis outcome with a single compare-and-set UPDATE on the lease token.
+    Returns False (and writes nothing) if the lease was reclaimed by another worker meanwhile.
+    """
+    updated = Design.objects.filter(
+        id=design_id, status=DesignStatus.ANALYZING, analysis_lease_token=lease_token
+    ).update(
+        status=status, geometric_data=geometric_data,
+        analysis_lease_token=None, analysis_leased_at=None, updated_at=timezone.now()
+    )
+    if not updated:
+        logger.warning(f"Design ID {design_id}: analysis lease {lease_token} no longer held. Result discarded.")
+    return bool(updated)
+
+
+def merge_analysis_enrichment(design_id, s3_file_key, enrichment_token, enrichment):
+    """
+    Merges the keys of enrichment into a design's geometric_data, under a short row lock so
+    keys written meanwhile by anyone else are kept. Only applies while the design still carries
+    the pending enrichment marker with enrichment_token for the same file (a re-upload or
+    re-analysis replaces it). Returns the merged geometric_data, or None if the result was discarded.
+    """
+    with transaction.atomic():
+        design = Design.objects.select_for_update().filter(id=design_id).first()
+        marker = ((design.geometric_data or {}).get("enrichment") or {}) if design else {}
+        if design is None or design.s3_file_key != s3_file_key or marker.get("token") != enrichment_token:
+            logger.warning(f"Design ID {design_id}: enrichment {enrichment_token} no longer pending. Result discarded.")
+            return None
+        design.geometric_data = {**design.geometric_data, **enrichment}
+        design.save(update_fields=['geometric_data', 'updated_at'])
+        return design.geometric_data
+
+
+def release_design_claim(design_id, lease_token):
+    """Returns a claimed design to PENDING_ANALYSIS (e.g. before a task retry)."""
+    return Design.objects.filter(
+        id=design_id, status=DesignStatus.ANALYZING, analysis_lease_token=lease_token
+    ).update(
+        status=DesignStatus.PENDING_ANALYSIS,
+        analysis_lease_token=None, analysis_leased_at=None, updated_at=timezone.now()
+    )
+
+
+def _run_analysis_function(design, design_id, analysis_function, *args, **kwargs):
+    """
+    Runs an analysis function (isolated in a job process unless CAD_ANALYSIS_ISOLATE_JOBS is off)
+    and returns its result. On failure, marks the in-memory design ANALYSIS_FAILED with an error
+    message and returns None. S3 ClientErrors are re-raised for the caller's 404/retry handling.
+    """
+    try:
+        if getattr(settings, 'CAD_ANALYSIS_ISOLATE_JOBS', True):
+            # Separate process with wall-clock timeout and memory ceiling (see analysis_executor)
+            return run_analysis_job(analysis_function, *args, **kwargs)
+        return analysis_function(*args, **kwargs)
+    except ClientError:
+        raise
+    except AnalysisJobError as job_exc: # Job killed (timeout/memory) or its process died
+        logger.error(f"CAD analysis job aborted for Design ID {design_id}: {job_exc}")
+        design.status = DesignStatus.ANALYSIS_FAILED
+        design.geometric_data = {"error": f"Analysis aborted: {str(job_exc)}"}
+    except ValueError as ve: # Catch parsing/analysis errors from the analysis function
+        logger.error(f"CAD analysis failed for Design ID {design_id}: {ve}")
+        design.status = DesignStatus.ANALYSIS_FAILED
+        design.geometric_data = {"error": f"Analysis failed: {str(ve)}"}
+        # Do not retry for file content/format errors.
+    except RuntimeError as rte: # Catch library availability errors
+        logger.error(f"CAD analysis runtime error for Design ID {design_id}: {rte}")
+        design.status = DesignStatus.ANALYSIS_FAILED
+        design.geometric_data = {"error": f"Analysis runtime error: {str(rte)}"}
+    except Exception as analysis_exc: # Catch any other unexpected analysis errors
+        logger.error(f"Unexpected CAD analysis error for Design ID {design_id}: {analysis_exc}")
+        design.status = DesignStatus.ANALYSIS_FAILED
+        design.geometric_data = {"error": f"Unexpected analysis error: {str(analysis_exc)}"}
+        # Potentially retry for truly unexpected errors, but depends on their nature.
+        # For now, marking as failed. If self.retry is called, it should be conditional.
+    return None
 
-            # Create a temporary file to download the S3 object
-            # tempfile.NamedTemporaryFile ensures the file is deleted when closed.
-            with tempfile.NamedTemporaryFile(delete=True, suffix=os.path.splitext(design.s3_file_key)[1]) as tmp_file:
-                local_file_path = tmp_file.name
-                logger.info(f"Downloading s3://{settings.AWS_STORAGE_BUCKET_NAME}/{design.s3_file_key} to {local_file_path}")
 
-                try:
-                    s3_client.download_file(settings.AWS_STORAGE_BUCKET_NAME, design.s3_file_key, local_file_path)
+def _commit_cached_analysis(design_id, lease_token, cached_geometric_data):
+    if not commit_analysis_result(design_id, lease_token, DesignStatus.ANALYSIS_COMPLETE, cached_geometric_data):
+        return f"Skipped: Analysis lease for Design {design_id} was lost; result discarded."
+    logger.info(f"Design ID {design_id}: geometric data copied from analysis cache. Status set to ANALYSIS_COMPLETE.")
+    return f"Successfully processed Design ID: {design_id} from analysis cache. Final status: {DesignStatus.ANALYSIS_COMPLETE}"
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def analyze_cad_file(self, design_id, heavy=False):
+    """
+    Analyzes a design's uploaded CAD file and stores the result on the Design.
+    heavy=True marks a run already routed to the heavy-analysis queue by the STL header triage.
+    """
+    logger.info(f"Celery Task: Starting CAD analysis for Design ID: {design_id}{' (heavy queue)' if heavy else ''}")
+    lease_token = None
+    try:
+        # Claim the design in a short transaction; no row lock is held during download/analysis.
+        design, lease_token = claim_design_for_analysis(design_id)
+        if lease_token is None:
+            logger.warning(f"Design ID {design_id} is not in PENDING_ANALYSIS status (current: {design.status}). Skipping analysis.")
+            return f"Skipped: Design {design_id} not in PENDING_ANALYSIS status."
+
+        s3_client = s3_io.get_s3_client() # Shared per-process client (connection pool reused across tasks)
+
+        file_extension = os.path.splitext(design.s3_file_key)[1].lower()
+        # STL meshes also run the metric kernels of the design's processes, which are part of the cache key.
+        kernels, cache_version = None, ANALYSIS_ENGINE_VERSION
+        # Two-phase STL analysis: whole-mesh stages are left to enrich_stl_analysis (see below).
+        defer_enrichment = False
+        if file_extension == '.stl' and NUMPY_STL_AVAILABLE:
+            kernels = kernels_for_material(design.material)
+            cache_version = analysis_cache_version(kernels)
+            defer_enrichment = getattr(settings, 'CAD_ANALYSIS_DEFER_ENRICHMENT', True)
+
+        # Content-addressed cache: identical re-uploads reuse a previous result with no download.
+        content_digest = None
+        head_response = None
+        try:
+            head_response = s3_client.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=design.s3_file_key)
+            content_digest = analysis_cache.digest_from_s3_head(head_response)
+        except ClientError as e: # A missing object is reported by the download below
+            logger.warning(f"Could not HEAD {design.s3_file_key} for Design ID {design_id}: {e}. Skipping pre-download cache lookup.")
+        if content_digest:
+            cached_geometric_data = analysis_cache.get_cached_analysis(content_digest, cache_version)
+            if cached_geometric_data is not None:
+                return _commit_cached_analysis(design_id, lease_token, cached_geometric_data)
+
+        stream_from_s3 = (
+            file_extension == '.stl' and NUMPY_STL_AVAILABLE and getattr(settings, 'CAD_ANALYSIS_STREAM_FROM_S3', True)
+        )
+
+        try:
+            object_size = head_response.get('ContentLength') if isinstance(head_response, dict) else None
+            if file_extension == '.stl' and NUMPY_STL_AVAILABLE and isinstance(object_size, int):
+                # Header-peek triage: reject corrupt/oversized files and move large meshes off
+                # the default queue before paying for a full download.
+                route, triage_info = triage_stl_object(
+                    s3_client, settings.AWS_STORAGE_BUCKET_NAME, design.s3_file_key, object_size
+                )
+                logger.info(
+                    f"Design ID {design_id}: STL triage route={route} format={triage_info['format']} "
+                    f"triangles={triage_info['triangles']} bytes={object_size}"
+                )
+                if route == 'reject':
+                    if not commit_analysis_result(
+                        design_id, lease_token, DesignStatus.ANALYSIS_FAILED, {"error": f"Analysis failed: {triage_info['error']}"}
+                    ):
+                        return f"Skipped: Analysis lease for Design {design_id} was lost; result discarded."
+                    return f"Failed: {triage_info['error']}"
+                shard_min_triangles = getattr(settings, 'CAD_ANALYSIS_SHARD_MIN_TRIANGLES', 5_000_000)
+                if triage_info['format'] == 'binary' and shard_min_triangles and triage_info['triangles'] >= shard_min_triangles:
+                    # Map-reduce across workers: each shard range-reads its slice; the chord callback
+                    # merges the partial metrics and commits under this task's lease.
+                    shards = plan_stl_shards(
+                        triage_info['triangles'], getattr(settings, 'CAD_ANALYSIS_SHARD_TRIANGLES', 2_000_000)
+                    )
+                    heavy_queue = getattr(settings, 'CAD_ANALYSIS_HEAVY_QUEUE', 'cad_analysis_heavy')
+                    chord(
+                        analyze_stl_shard.s(
+                            settings.AWS_STORAGE_BUCKET_NAME, design.s3_file_key, start, count, kernels
+                        ).set(queue=heavy_queue)
+                        for start, count in shards
+                    )(merge_stl_shards.s(str(design_id), str(lease_token), content_digest, cache_version))
+                    return f"Dispatched: Design {design_id} ({triage_info['triangles']} triangles) split into {len(shards)} shards."
+                if route == 'heavy' and not heavy:
+                    heavy_queue = getattr(settings, 'CAD_ANALYSIS_HEAVY_QUEUE', 'cad_analysis_heavy')
+                    release_design_claim(design_id, lease_token)
+                    lease_token = None
+                    analyze_cad_file.apply_async(args=[design_id], kwargs={"heavy": True}, queue=heavy_queue)
+                    return f"Routed: Design {design_id} ({triage_info['triangles']} triangles) sent to queue {heavy_queue}."
+
+            if stream_from_s3:
+                # Zero-temp-file path: the get_object body is read straight into the STL parser.
+                streamed = _run_analysis_function(
+                    design, design_id, perform_s3_stl_stream_analysis,
+                    settings.AWS_STORAGE_BUCKET_NAME, design.s3_file_key, compute_sha256=not content_digest,
+                    kernels=kernels, mesh_stages=not defer_enrichment
+                )
+                if streamed is not None:
+                    design.geometric_data, transfer_info = streamed
+                    design.status = DesignStatus.ANALYSIS_COMPLETE
+                    content_digest = content_digest or transfer_info["content_digest"]
+                    logger.info(
+                        f"CAD analysis successful for Design ID: {design_id} (streamed). "
+                        f"bytes_read={transfer_info['bytes_read']} time_to_first_byte_ms={transfer_info['time_to_first_byte_ms']} "
+                        f"elapsed_ms={transfer_info['elapsed_ms']} used_temp_file={transfer_info['used_temp_file']}"
+                    )
+            else:
+                # Parsers that need a local file (random access) get a temporary copy.
+                # tempfile.NamedTemporaryFile ensures the file is deleted when closed.
+                with tempfile.NamedTemporaryFile(delete=True, suffix=file_extension) as tmp_file:
+                    local_file_path = tmp_file.name
+                    logger.info(f"Downloading s3://{settings.AWS_STORAGE_BUCKET_NAME}/{design.s3_file_key} to {local_file_path}")
+                    # Large objects are fetched with concurrent range requests (strategy is logged).
+                    s3_io.download_s3_object(
+                        s3_client, settings.AWS_STORAGE_BUCKET_NAME, design.s3_file_key, local_file_path,
+                        object_size=object_size
+                    )
                     logger.info(f"Successfully downloaded {design.s3_file_key}.")
-                except ClientError as e:
-                    if e.response['Error']['Code'] == '404':
-                        logger.error(f"S3 file not found for Design ID {design_id}: s3://{settings.AWS_STORAGE_BUCKET_NAME}/{design.s3_file_key}")
-                        design.status = DesignStatus.ANALYSIS_FAILED # Or a more specific error status
-                        design.geometric_data = {"error": "S3 file not found."}
-                        design.save()
-                        # Do not retry for 404 as file won't appear magically
-                        return f"Failed: S3 file not found for Design {design_id}."
-                    else:
-                        logger.error(f"S3 ClientError downloading file for Design ID {design_id}: {e}")
-                        # Retry for other S3 client errors (e.g., network issues)
-                        raise self.retry(exc=e) from e
-
-                # --- Perform CAD Analysis ---
-                file_extension = os.path.splitext(design.s3_file_key)[1].lower()
-                analysis_function = None
-
-                if file_extension == '.stl':
-                    if NUMPY_STL_AVAILABLE:
-                        analysis_function = perform_stl_analysis
-                    else:
-                        logger.error("STL file received, but numpy-stl library is not available.")
-                        design.status = DesignStatus.ANALYSIS_FAILED
-                        design.geometric_data = {"error": "STL processing library not available."}
-
-                elif file_extension in ['.step', '.stp']:
-                    if STEPUTILS_AVAILABLE:
-                        try:
-                            # Attempt to parse the STEP file to validate its structure.
-                            # steputils doesn't easily give volume/bbox/area for complex B-Reps.
-                            step_file = steputils.p21.STYLED_STEP_FILE(local_file_path)
-                            if step_file: # Basic check if parsing was successful
-                                logger.info(f"STEP file {design.s3_file_key} validated successfully by steputils.")
-                                design.geometric_data = {
-                                    "validation_engine": f"steputils-v{steputils.version if hasattr(steputils, 'version') else 'unknown'}",
-                                    "status_message": "STEP file validated. Detailed geometric analysis (volume, bbox, area) not available with current tools.",
-                                    "complexity_score": 0.1 # Placeholder for validated but not fully analyzed
-                                }
-                                # Keep status PENDING_ANALYSIS or move to a new "VALIDATED_NO_GEOM" status?
-                                # For now, if it validates but no geom, treat as ANALYSIS_FAILED for pricing.
-                                # Or, ANALYSIS_COMPLETE but with a note that geometric_data is limited.
-                                # Let's assume for now that if we can't get volume/bbox, it's effectively failed for quoting.
-                                design.status = DesignStatus.ANALYSIS_FAILED # Or a new status
-                                design.geometric_data["error"] = "STEP file validated, but detailed geometric properties could not be extracted."
-                            else: # Should not happen if from_file doesn't raise error but returns None
-                                raise ValueError("steputils parsing returned None.")
-                        except Exception as step_exc:
-                            logger.error(f"STEP file analysis/validation failed for Design ID {design_id} using steputils: {step_exc}")
+
+                    if not content_digest:
+                        # No usable checksum/ETag from S3; hash the downloaded bytes instead.
+                        content_digest = analysis_cache.sha256_file_digest(local_file_path)
+                        cached_geometric_data = analysis_cache.get_cached_analysis(content_digest, cache_version)
+                        if cached_geometric_data is not None:
+                            return _commit_cached_analysis(design_id, lease_token, cached_geometric_data)
+
+                    # --- Perform CAD Analysis ---
+                    analysis_function = None
+
+                    if file_extension == '.stl':
+                        if NUMPY_STL_AVAILABLE:
+                            analysis_function = perform_stl_analysis
+                        else:
+                            logger.error("STL file received, but numpy-stl library is not available.")
                             design.status = DesignStatus.ANALYSIS_FAILED
-                            design.geometric_data = {"error": f"STEP file parsing error: {str(step_exc)}"}
-                    else:
-                        logger.error("STEP file received, but steputils library is not available.")
-                        design.status = DesignStatus.ANALYSIS_FAILED
-                        design.geometric_data = {"error": "STEP processing library (steputils) not available."}
-
-                elif file_extension in ['.iges', '.igs']:
-                    logger.warning(f"IGES file type ('{file_extension}') received for Design ID {design_id}, but no IGES library is available.")
-                    design.status = DesignStatus.ANALYSIS_FAILED
-                    design.geometric_data = {"error": "IGES file analysis is not supported (no library)."}
-
-                else: # Other unknown extensions
-                    logger.warning(f"Unsupported file type '{file_extension}' for Design ID {design_id}.")
-                    design.status = DesignStatus.ANALYSIS_FAILED
-                    design.geometric_data = {"error": f"Unsupported file type: {file_extension}."}
-
-                # This block only runs if analysis_function was set (i.e. for STL currently)
-                if analysis_function:
-                    try:
-                        geometric_data = analysis_function(local_file_path) # This is perform_stl_analysis
-                        design.geometric_data = geometric_data
-                        design.status = DesignStatus.ANALYSIS_COMPLETE
-                        logger.info(f"CAD analysis successful for Design ID: {design_id}. Status set to ANALYSIS_COMPLETE.")
-                    except ValueError as ve: # Catch parsing/analysis errors from the analysis function
-                        logger.error(f"CAD analysis failed for Design ID {design_id}: {ve}")
-                        design.status = DesignStatus.ANALYSIS_FAILED
-                        design.geometric_data = {"error": f"Analysis failed: {str(ve)}"}
-                        # Do not retry for file content/format errors.
-                    except RuntimeError as rte: # Catch library availability errors
-                         logger.error(f"CAD analysis runtime error for Design ID {design_id}: {rte}")
-                         design.status = DesignStatus.ANALYSIS_FAILED
-                         design.geometric_data = {"error": f"Analysis runtime error: {str(rte)}"}
-                    except Exception as analysis_exc: # Catch any other unexpected analysis errors
-                        logger.error(f"Unexpected CAD analysis error for Design ID {design_id}: {analysis_exc}")
+                            design.geometric_data = {"error": "STL processing library not available."}
+
+                    elif file_extension in ['.step', '.stp']:
+                        if STEP_READER_AVAILABLE:
+                            analysis_function = perform_step_analysis
+                        else:
+                            logger.error("STEP file received, but numpy is not available.")
+                            design.status = DesignStatus.ANALYSIS_FAILED
+                            design.geometric_data = {"error": "STEP processing library not available."}
+
+                    elif file_extension in ['.iges', '.igs']:
+                        if IGES_READER_AVAILABLE:
+                            analysis_function = perform_iges_analysis
+                        else:
+                            logger.error("IGES file received, but numpy is not available.")
+                            design.status = DesignStatus.ANALYSIS_FAILED
+                            design.geometric_data = {"error": "IGES processing library not available."}
+
+                    else: # Other unknown extensions
+                        logger.warning(f"Unsupported file type '{file_extension}' for Design ID {design_id}.")
                         design.status = DesignStatus.ANALYSIS_FAILED
-                        design.geometric_data = {"error": f"Unexpected analysis error: {str(analysis_exc)}"}
-                        # Potentially retry for truly unexpected errors, but depends on their nature.
-                        # For now, marking as failed. If self.retry is called, it should be conditional.
+                        design.geometric_data = {"error": f"Unsupported file type: {file_extension}."}
+
+                    # This block only runs if analysis_function was set (STL, STEP and IGES currently)
+                    if analysis_function:
+                        # Only the STL analysis takes kernels and mesh stages
+                        extra_args = (
+                            {"kernels": kernels, "mesh_stages": not defer_enrichment}
+                            if analysis_function is perform_stl_analysis else {}
+                        )
+                        geometric_data = _run_analysis_function(design, design_id, analysis_function, local_file_path, **extra_args)
+                        if geometric_data is not None:
+                            design.geometric_data = geometric_data
+                            design.status = DesignStatus.ANALYSIS_COMPLETE
+                            logger.info(f"CAD analysis successful for Design ID: {design_id}. Status set to ANALYSIS_COMPLETE.")
+
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                logger.error(f"S3 file not found for Design ID {design_id}: s3://{settings.AWS_STORAGE_BUCKET_NAME}/{design.s3_file_key}")
+                commit_analysis_result(design_id, lease_token, DesignStatus.ANALYSIS_FAILED, {"error": "S3 file not found."})
+                # Do not retry for 404 as file won't appear magically
+                return f"Failed: S3 file not found for Design {design_id}."
+            else:
+                logger.error(f"S3 ClientError downloading file for Design ID {design_id}: {e}")
+                # Retry for other S3 client errors (e.g., network issues)
+                release_design_claim(design_id, lease_token)
+                lease_token = None
+                raise self.retry(exc=e) from e
 
-                design.save() # Save changes to status and geometric_data
+        # The quotable metrics are published now; the whole-mesh stages (which only run up to
+        # CAD_ANALYSIS_TOPOLOGY_MAX_TRIANGLES) follow in enrich_stl_analysis, matched by this token.
+        enrichment_pending = (
+            defer_enrichment and design.status == DesignStatus.ANALYSIS_COMPLETE
+            and design.geometric_data["num_triangles"] <= getattr(settings, 'CAD_ANALYSIS_TOPOLOGY_MAX_TRIANGLES', 5_000_000)
+        )
+        if enrichment_pending:
+            design.geometric_data["enrichment"] = {
+                "status": "pending", "token": str(lease_token),
+                # For requeue_stale_analyses, which dispatches the enrichment again if it goes stale
+                "dispatched_at": timezone.now().isoformat(), "attempts": 1,
+                "content_digest": content_digest, "cache_version": cache_version,
+            }
 
-            logger.info(f"Successfully processed Design ID: {design_id}. Final status: {design.status}")
-            return f"Successfully processed Design ID: {design_id}. Final status: {design.status}"
+        # Compare-and-set: only written if our lease still holds.
+        if not commit_analysis_result(design_id, lease_token, design.status, design.geometric_data):
+            return f"Skipped: Analysis lease for Design {design_id} was lost; result discarded."
+
+        if enrichment_pending:
+            # Sent once the result is committed; cached by enrich_stl_analysis once complete.
+            marker = design.geometric_data["enrichment"]
+            transaction.on_commit(lambda: _dispatch_enrichment(design_id, design.s3_file_key, marker))
+        elif design.status == DesignStatus.ANALYSIS_COMPLETE:
+            analysis_cache.store_analysis(content_digest, cache_version, design.geometric_data)
+
+        logger.info(f"Successfully processed Design ID: {design_id}. Final status: {design.status}")
+        return f"Successfully processed Design ID: {design_id}. Final status: {design.status}"
 
     except Design.DoesNotExist:
         logger.error(f"Design ID {design_id} not found in database for analysis.")
@@ -214,13 +1151,128 @@ def analyze_cad_file(self, design_id):
         logger.error(f"Unexpected error in analyze_cad_file task for Design ID {design_id}: {e}")
         # Retry for other unexpected errors
         # The 'self' (bound task instance) is used for retry
-        # Ensure that the design status reflects a pending or error state if retrying
-        try:
-            # Attempt to update status to reflect error before retry, if possible
-            design_to_update = Design.objects.get(id=design_id)
-            if design_to_update.status not in [DesignStatus.ANALYSIS_COMPLETE, DesignStatus.ANALYSIS_FAILED]:
-                 # Update to ANALYSIS_FAILED or keep PENDING_ANALYSIS with an error note if desired
-                pass # For now, rely on retry and eventual failure if persistent
-        except Design.DoesNotExist:
-            pass # Design was deleted or never existed
+        # Hand the design back to PENDING_ANALYSIS so the retry can claim it again.
+        if lease_token is not None:
+            release_design_claim(design_id, lease_token)
         raise self.retry(exc=e) from e
+
+
+def _dispatch_enrichment(design_id, s3_file_key, marker):
+    """
+    Sends enrich_stl_analysis for a pending enrichment marker. A failed send is only logged: the
+    marker stays pending with its dispatched_at, so requeue_stale_analyses sends it again later.
+    """
+    try:
+        enrich_stl_analysis.apply_async(
+            args=[str(design_id), s3_file_key, marker["token"], marker.get("content_digest"), marker.get("cache_version", ANALYSIS_ENGINE_VERSION)],
+            queue=getattr(settings, 'CAD_ANALYSIS_ENRICHMENT_QUEUE', 'cad_analysis_heavy'),
+        )
+    except Exception as e:
+        logger.error(f"Design ID {design_id}: could not dispatch analysis enrichment ({e}). It will be re-queued once stale.")
+
+
+def _requeue_stale_enrichment(design_id, cutoff, max_attempts):
+    """
+    Under a short row lock, dispatches a design's enrichment again if it is still pending and was
+    last dispatched before cutoff (markers without dispatched_at count as stale), or marks it
+    failed once max_attempts dispatches were made. Returns the new status, or None if untouched.
+    """
+    with transaction.atomic():
+        design = Design.objects.select_for_update().filter(id=design_id).first()
+        marker = ((design.geometric_data or {}).get("enrichment") or {}) if design else {}
+        dispatched_at = marker.get("dispatched_at")
+        if marker.get("status") != "pending" or (dispatched_at and datetime.fromisoformat(dispatched_at) > cutoff):
+            return None
+        attempts = marker.get("attempts", 1)
+        if attempts >= max_attempts:
+            logger.error(f"Design ID {design_id}: analysis enrichment did not finish after {attempts} attempts. Marking it failed.")
+            marker = {"status": "failed", "error": f"Enrichment did not finish after {attempts} attempts."}
+        else:
+            logger.warning(f"Design ID {design_id}: analysis enrichment pending since {dispatched_at}. Re-queuing it.")
+            marker = {**marker, "dispatched_at": timezone.now().isoformat(), "attempts": attempts + 1}
+            transaction.on_commit(lambda: _dispatch_enrichment(design_id, design.s3_file_key, marker))
+        design.geometric_data = {**design.geometric_data, "enrichment": marker}
+        design.save(update_fields=['geometric_data', 'updated_at'])
+        return marker["status"]
+
+
+def _run_job_function(job_function, *args):
+    # Same isolation as the fast phase (see _run_analysis_function), for the enrichment and shard
+    # tasks; errors are handled by the caller.
+    if getattr(settings, 'CAD_ANALYSIS_ISOLATE_JOBS', True):
+        return run_analysis_job(job_function, *args)
+    return job_function(*args)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def enrich_stl_analysis(self, design_id, s3_file_key, enrichment_token, content_digest=None, cache_version=ANALYSIS_ENGINE_VERSION):
+    """
+    Enrichment phase of two-phase STL analysis, dispatched by analyze_cad_file once the core
+    metrics are published and the design is ANALYSIS_COMPLETE (quotable). Reads the file again,
+    runs the whole-mesh stages (perform_stl_enrichment) and merges their keys into
+    geometric_data with merge_analysis_enrichment, setting geometric_data["enrichment"] to
+    {"status": "complete"}; the merged result is then cached under cache_version. Any error
+    (S3 errors once retries run out) leaves the design quotable with {"status": "failed",
+    "error": ...} instead, so the marker never stays "pending".
+    """
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    logger.info(f"Celery Task: Starting analysis enrichment for Design ID: {design_id}")
+    started_at = time.perf_counter()
+    try:
+        if getattr(settings, 'CAD_ANALYSIS_STREAM_FROM_S3', True):
+            enrichment = _run_job_function(perform_s3_stl_enrichment, bucket, s3_file_key)
+        else:
+            with tempfile.NamedTemporaryFile(delete=True, suffix='.stl') as tmp_file:
+                s3_io.download_s3_object(s3_io.get_s3_client(), bucket, s3_file_key, tmp_file.name)
+                enrichment = _run_job_function(perform_stl_enrichment, tmp_file.name)
+        enrichment["enrichment"] = {"status": "complete"}
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            enrichment = {"enrichment": {"status": "failed", "error": "S3 file not found."}}
+        else:
+            logger.error(f"S3 ClientError reading file for enrichment of Design ID {design_id}: {e}")
+            if self.request.retries < self.max_retries:
+                raise self.retry(exc=e) from e
+            enrichment = {"enrichment": {"status": "failed", "error": f"S3 error: {str(e)}"}}
+    except (AnalysisJobError, ValueError, RuntimeError) as e:
+        logger.error(f"Analysis enrichment failed for Design ID {design_id}: {e}")
+        enrichment = {"enrichment": {"status": "failed", "error": f"Enrichment failed: {str(e)}"}}
+    except Exception as e: # Anything else must not leave the marker 'pending' for good
+        logger.error(f"Unexpected analysis enrichment error for Design ID {design_id}: {e}")
+        enrichment = {"enrichment": {"status": "failed", "error": f"Unexpected enrichment error: {str(e)}"}}
+
+    geometric_data = merge_analysis_enrichment(design_id, s3_file_key, enrichment_token, enrichment)
+    if geometric_data is None:
+        return f"Skipped: Enrichment of Design {design_id} is no longer pending; result discarded."
+    status = enrichment["enrichment"]["status"]
+    if status == "complete":
+        analysis_cache.store_analysis(content_digest, cache_version, geometric_data)
+    logger.info(f"Design ID {design_id}: enrichment {status} in {time.perf_counter() - started_at:.2f}s.")
+    return f"Enriched Design ID: {design_id}. Enrichment status: {status}"
+
+
+@shared_task
+def requeue_stale_analyses():
+    """
+    Re-dispatches designs stuck in ANALYZING whose lease has expired (e.g. the worker was killed).
+    Intended to be run periodically (celery beat); analyze_cad_file reclaims the stale lease itself.
+    Enrichments still pending CAD_ANALYSIS_ENRICHMENT_STALE_SECONDS after their dispatch are sent
+    again, or marked failed after CAD_ANALYSIS_ENRICHMENT_MAX_ATTEMPTS (see _requeue_stale_enrichment).
+    """
+    lease_seconds = getattr(settings, 'CAD_ANALYSIS_LEASE_SECONDS', 30 * 60)
+    cutoff = timezone.now() - timedelta(seconds=lease_seconds)
+    stale_ids = list(
+        Design.objects.filter(status=DesignStatus.ANALYZING, analysis_leased_at__lte=cutoff).values_list('id', flat=True)
+    )
+    for design_id in stale_ids:
+        logger.warning(f"Design ID {design_id}: analysis lease expired. Re-queuing analysis.")
+        analyze_cad_file.delay(design_id)
+
+    enrichment_cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'CAD_ANALYSIS_ENRICHMENT_STALE_SECONDS', 60 * 60))
+    max_attempts = getattr(settings, 'CAD_ANALYSIS_ENRICHMENT_MAX_ATTEMPTS', 3)
+    pending_ids = list(Design.objects.filter(geometric_data__enrichment__status="pending").values_list('id', flat=True))
+    outcomes = [_requeue_stale_enrichment(design_id, enrichment_cutoff, max_attempts) for design_id in pending_ids]
+    return (
+        f"Re-queued {len(stale_ids)} design(s) with stale analysis leases and {outcomes.count('pending')} stale "
+        f"enrichment(s); marked {outcomes.count('failed')} enrichment(s) failed."
+    )
@@ -9,6 +9,7 @@ from django.conf import settings
 # It's better to import User and UserRole from where they are defined, e.g., settings.AUTH_USER_MODEL or accounts.models
 from accounts.models import User, UserRole
 from .models import Design, DesignStatus
+from .s3_io import reset_s3_client # The S3 client is cached per process; tests that mock boto3 reset it
 # Serializers are not strictly needed for API tests if you test request/response data,
 # but can be useful for understanding expected structures or for direct serializer tests.
 # from .serializers import DesignSerializer, DesignCreateSerializer # Can be useful for direct serializer tests
@@ -22,6 +23,8 @@ from quotes.models import Quote # For checking if quotes are created
 class DesignAPITests(APITestCase):
 
     def setUp(self):
+        reset_s3_client()
+        self.addCleanup(reset_s3_client)
         # Customer User 1
         self.customer_user1_data = {
             "email": "customer1@example.com", "password": "Password123!",
@@ -316,9 +319,10 @@ class DesignAPITests(APITestCase):
 # Celery Task Tests
 import shutil # For copying sample file in tests
 from pathlib import Path # For path manipulation
-from .tasks import analyze_cad_file, STEPUTILS_AVAILABLE, NUMPY_STL_AVAILABLE # Import the task and availability flags
+from .tasks import analyze_cad_file, STEP_READER_AVAILABLE, IGES_READER_AVAILABLE, NUMPY_STL_AVAILABLE # Import the task and availability flags
 from botocore.exceptions import ClientError
 from unittest import skipIf # To skip tests if libraries are not available
+from django.test import override_settings
 # from stl import mesh as stl_mesh_module # To mock its from_file method - numpy-stl is imported in tasks
 
 # Path to the sample STL file
@@ -329,6 +333,8 @@ SAMPLE_BAD_STEP_FILE_PATH = SAMPLE_STL_DIR / "bad_cube.step"
 SAMPLE_IGES_FILE_PATH = SAMPLE_STL_DIR / "dummy.iges"
 
 
+# These tests exercise the download-to-temp-file path; streaming is covered by S3StreamingAnalysisTests.
+@override_settings(CAD_ANALYSIS_STREAM_FROM_S3=False)
 class DesignAnalysisTaskTests(APITestCase):
 
     @classmethod
@@ -380,6 +386,10 @@ class DesignAnalysisTaskTests(APITestCase):
             material="PLA", quantity=1, status=DesignStatus.ANALYSIS_COMPLETE
         )
 
+    def setUp(self):
+        reset_s3_client()
+        self.addCleanup(reset_s3_client)
+
     def _mock_s3_download_file(self, s3_client_mock, source_file_path=SAMPLE_STL_FILE_PATH):
         """Helper to mock the S3 download_file to copy a local sample file."""
         def copier(Bucket, Key, TargetFilePath):
@@ -387,13 +397,14 @@ class DesignAnalysisTaskTests(APITestCase):
         s3_client_mock.download_file.side_effect = copier
         return s3_client_mock
 
-    @patch('designs.tasks.boto3.client')
+    @patch('designs.s3_io.boto3.client')
     def test_analyze_cad_file_task_success_stl(self, mock_boto_client_constructor):
         mock_s3_instance = MagicMock()
         self._mock_s3_download_file(mock_s3_instance, SAMPLE_STL_FILE_PATH)
         mock_boto_client_constructor.return_value = mock_s3_instance
 
-        result_message = analyze_cad_file(self.design_pending_stl.id)
+        with self.captureOnCommitCallbacks(execute=True): # The enrichment is dispatched on commit
+            result_message = analyze_cad_file(self.design_pending_stl.id)
 
         self.design_pending_stl.refresh_from_db()
         self.assertEqual(self.design_pending_stl.status, DesignStatus.ANALYSIS_COMPLETE)
@@ -407,12 +418,22 @@ class DesignAnalysisTaskTests(APITestCase):
         for dim in bbox: self.assertAlmostEqual(dim, 10.0, places=1)
         self.assertAlmostEqual(geom_data.get("surface_area_cm2"), 6.0, places=2) # 600 mm^2 = 6 cm^2
         self.assertEqual(geom_data.get("num_triangles"), 12)
-        self.assertAlmostEqual(geom_data.get("complexity_score"), 0.0012, places=4)
-        self.assertTrue(geom_data.get("analysis_engine", "").startswith("numpy-stl"))
+        self.assertEqual(geom_data.get("complexity_score"), 0.09) # 12 sharp edges, cube surface/volume
+        self.assertEqual(geom_data.get("complexity_version"), "features-v1")
+        # The sample cube is closed but wound inside out.
+        topology = geom_data.get("topology")
+        self.assertEqual((topology["num_bodies"], topology["watertight"], topology["inverted_bodies"]), (1, True, 1))
+        self.assertTrue(geom_data.get("volume_reliable"))
+        self.assertEqual(geom_data.get("wall_thickness")["min_mm"], 10.0) # Rays still go inward
+        self.assertEqual(geom_data.get("support")["best"]["support_volume_cm3"], 0.0) # Standing on a face
+        self.assertEqual((geom_data.get("cnc_access")["setups"], geom_data.get("cnc_access")["needs_5_axis"]), (2, False))
+        layer_profile = geom_data.get("layer_profile")
+        self.assertEqual((layer_profile["num_layers"], layer_profile["runs"]), (100, [[0, 100.0, 40.0]]))
+        self.assertTrue(geom_data.get("analysis_engine", "").startswith("gmqp-stl-ascii")) # Sample file is ASCII STL
         self.assertIn("Successfully processed", result_message)
-        mock_s3_instance.download_file.assert_called_once()
+        self.assertEqual(mock_s3_instance.download_file.call_count, 2) # Fast phase, then the (eager) enrichment
 
-    @patch('designs.tasks.boto3.client')
+    @patch('designs.s3_io.boto3.client')
     def test_analyze_cad_file_task_s3_download_404(self, mock_boto_client_constructor):
         mock_s3_instance = MagicMock()
         mock_s3_instance.download_file.side_effect = ClientError(
@@ -429,8 +450,8 @@ class DesignAnalysisTaskTests(APITestCase):
         self.assertIn("S3 file not found", self.design_pending_stl.geometric_data["error"])
         self.assertIn("S3 file not found", result_message)
 
-    @patch('designs.tasks.boto3.client')
-    @patch('designs.tasks.stl_mesh.Mesh.from_file') # Patch the from_file method of numpy-stl
+    @patch('designs.s3_io.boto3.client')
+    @patch('designs.tasks.stl_reader.stream_ascii_stl_metrics') # Patch the ASCII STL parser
     def test_analyze_cad_file_task_stl_parsing_error(self, mock_stl_from_file, mock_boto_client_constructor):
         mock_s3_instance = MagicMock()
         self._mock_s3_download_file(mock_s3_instance, SAMPLE_STL_FILE_PATH) # Download will "succeed"
@@ -445,7 +466,7 @@ class DesignAnalysisTaskTests(APITestCase):
         self.assertIn("error", self.design_pending_stl.geometric_data)
         self.assertIn("Analysis failed: Invalid or corrupt STL file", self.design_pending_stl.geometric_data["error"])
 
-    @patch('designs.tasks.boto3.client')
+    @patch('designs.s3_io.boto3.client')
     def test_analyze_cad_file_task_unsupported_file_type(self, mock_boto_client_constructor):
         mock_s3_instance = MagicMock()
         # Create a dummy .txt file for download simulation
@@ -472,100 +493,6 @@ class DesignAnalysisTaskTests(APITestCase):
         self.assertIn(f"Skipped: Design {self.design_processed.id} not in PENDING_ANALYSIS status", result_message)
         self.design_processed.refresh_from_db()
         self.assertEqual(self.design_processed.status, DesignStatus.ANALYSIS_COMPLETE)
-            email="taskuser@example.com", password="Password123!",
-            company_name="Task Test Corp", role=UserRole.CUSTOMER
-        )
-        self.design_pending = Design.objects.create(
-            customer=self.customer_user,
-            design_name="Design for Task Test",
-            s3_file_key=f"uploads/designs/{self.customer_user.id}/task_test.stl",
-            material="ABS", quantity=1, status=DesignStatus.PENDING_ANALYSIS
-        )
-        self.design_processed = Design.objects.create(
-            customer=self.customer_user,
-            design_name="Already Processed Design",
-            s3_file_key=f"uploads/designs/{self.customer_user.id}/processed.stl",
-            material="PLA", quantity=1, status=DesignStatus.ANALYSIS_COMPLETE
-        )
-
-    @patch('designs.tasks.boto3.client') # Patch where boto3.client is used in tasks.py
-    @patch('designs.tasks.mock_cad_analysis') # Patch our mock CAD analysis function
-    def test_analyze_cad_file_task_success(self, mock_analysis_func, mock_boto_client_constructor):
-        # Configure mock S3 client
-        mock_s3_instance = MagicMock()
-        mock_boto_client_constructor.return_value = mock_s3_instance
-
-        # Configure mock CAD analysis results
-        mock_analysis_results = {
-            "volume_cm3": 100.0, "bbox_mm": [10,20,30],
-            "surface_area_cm2": 600.0, "complexity_score": 0.5,
-            "analysis_engine": "mock_engine_v1.0_test"
-        }
-        mock_analysis_func.return_value = mock_analysis_results
-
-        # Run the task directly for testing (synchronously)
-        result_message = analyze_cad_file(self.design_pending.id)
-
-        self.design_pending.refresh_from_db()
-        self.assertEqual(self.design_pending.status, DesignStatus.ANALYSIS_COMPLETE)
-        self.assertEqual(self.design_pending.geometric_data, mock_analysis_results)
-        self.assertIn("Successfully processed", result_message)
-
-        mock_s3_instance.download_file.assert_called_once()
-        # args, kwargs = mock_s3_instance.download_file.call_args
-        # self.assertEqual(args[0], settings.AWS_STORAGE_BUCKET_NAME)
-        # self.assertEqual(args[1], self.design_pending.s3_file_key)
-
-        mock_analysis_func.assert_called_once()
-
-
-    @patch('designs.tasks.boto3.client')
-    @patch('designs.tasks.mock_cad_analysis') # Still need to patch it even if not called due to S3 error
-    def test_analyze_cad_file_task_s3_download_404(self, mock_analysis_func, mock_boto_client_constructor):
-        mock_s3_instance = MagicMock()
-        # Simulate S3 404 error
-        mock_s3_instance.download_file.side_effect = ClientError(
-            {'Error': {'Code': '404', 'Message': 'Not Found'}},
-            'download_file'
-        )
-        mock_boto_client_constructor.return_value = mock_s3_instance
-
-        result_message = analyze_cad_file(self.design_pending.id)
-
-        self.design_pending.refresh_from_db()
-        self.assertEqual(self.design_pending.status, DesignStatus.ANALYSIS_FAILED)
-        self.assertIn("error", self.design_pending.geometric_data)
-        self.assertIn("S3 file not found", self.design_pending.geometric_data["error"])
-        self.assertIn("S3 file not found", result_message)
-        mock_analysis_func.assert_not_called() # Analysis should not run if download fails
-
-    @patch('designs.tasks.boto3.client')
-    @patch('designs.tasks.mock_cad_analysis')
-    def test_analyze_cad_file_task_analysis_failure(self, mock_analysis_func, mock_boto_client_constructor):
-        mock_s3_instance = MagicMock() # S3 download is successful
-        mock_boto_client_constructor.return_value = mock_s3_instance
-
-        # Simulate failure in the (mocked) CAD analysis step
-        mock_analysis_func.side_effect = ValueError("Simulated CAD processing error")
-
-        analyze_cad_file(self.design_pending.id)
-
-        self.design_pending.refresh_from_db()
-        self.assertEqual(self.design_pending.status, DesignStatus.ANALYSIS_FAILED)
-        self.assertIn("error", self.design_pending.geometric_data)
-        self.assertIn("Analysis failed: Simulated CAD processing error", self.design_pending.geometric_data["error"])
-
-    def test_analyze_cad_file_task_design_not_found(self):
-        non_existent_uuid = uuid.uuid4()
-        result_message = analyze_cad_file(non_existent_uuid)
-        self.assertIn(f"Failed: Design {non_existent_uuid} not found", result_message)
-
-    def test_analyze_cad_file_task_already_processed(self):
-        result_message = analyze_cad_file(self.design_processed.id)
-        self.assertIn(f"Skipped: Design {self.design_processed.id} not in PENDING_ANALYSIS status", result_message)
-        self.design_processed.refresh_from_db()
-        # Ensure status and data haven't changed
-        self.assertEqual(self.design_processed.status, DesignStatus.ANALYSIS_COMPLETE)
 
 
 # --- Test GenerateQuotesView API Endpoint ---
@@ -706,6 +633,38 @@ class GenerateQuotesViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("Design geometric data is missing", response.data['error'])
 
+    def test_generate_quotes_while_enrichment_is_pending(self):
+        # Quotable on the fast-phase metrics, but 3-axis shops wait until the 5-axis check has run.
+        self._login(self.customer)
+        url = reverse('design_generate_quotes', kwargs={'id': self.design_analyzed.id})
+        self.manufacturer1_profile.capabilities["cnc_axes"] = 3
+        self.manufacturer1_profile.save()
+        geometric_data = self.design_analyzed.geometric_data
+        self.design_analyzed.geometric_data = {**geometric_data, "enrichment": {"status": "pending", "token": str(uuid.uuid4())}}
+        self.design_analyzed.save()
+        response = self.client.post(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data["generated_quotes"], [])
+
+        # Once enrichment has finished (or failed) without finding undercuts, the 3-axis shop quotes.
+        for enrichment in ({"status": "complete"}, {"status": "failed", "error": "Enrichment failed"}):
+            Quote.objects.all().delete()
+            self.design_analyzed.geometric_data = {**geometric_data, "enrichment": enrichment}
+            self.design_analyzed.save()
+            response = self.client.post(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+            self.assertEqual([q['manufacturer'] for q in response.data["generated_quotes"]], [self.manufacturer1_user.id])
+
+    def test_generate_quotes_refuses_unreliable_bbox(self):
+        self._login(self.customer)
+        self.design_analyzed.geometric_data = {**self.design_analyzed.geometric_data, "bbox_reliable": False}
+        self.design_analyzed.save()
+        url = reverse('design_generate_quotes', kwargs={'id': self.design_analyzed.id})
+        response = self.client.post(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("overall size could not be determined", response.data['error'])
+        self.assertEqual(Quote.objects.filter(design=self.design_analyzed).count(), 0)
+
     def test_generate_quotes_unauthorized_user(self):
         other_customer = User.objects.create_user(email="other@example.com", password="pw", role=UserRole.CUSTOMER)
         self._login(other_customer)
@@ -871,6 +830,24 @@ class GenerateQuotesViewTests(APITestCase):
         self.assertEqual(len(response.data["generated_quotes"]), 1)
         self.assertEqual(response.data["generated_quotes"][0]['manufacturer'], self.manufacturer1_user.id)
 
+    def test_generate_quotes_filter_by_cnc_axes(self):
+        # Analysis found undercuts no 3-axis setup reaches: MF1 (3 axes) is skipped, MF4 has cnc: false.
+        self.design_analyzed.geometric_data["cnc_access"] = {"setups": 2, "needs_5_axis": True}
+        self.design_analyzed.save()
+        self.manufacturer1_profile.capabilities["cnc_axes"] = 3
+        self.manufacturer1_profile.save()
+        self._login(self.customer)
+        url = reverse('design_generate_quotes', kwargs={'id': self.design_analyzed.id})
+        response = self.client.post(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data["generated_quotes"], [])
+
+        self.manufacturer1_profile.capabilities["cnc_axes"] = 5
+        self.manufacturer1_profile.save()
+        response = self.client.post(url, format='json')
+        self.assertEqual(len(response.data["generated_quotes"]), 1)
+        self.assertEqual(response.data["generated_quotes"][0]['manufacturer'], self.manufacturer1_user.id)
+
     def test_generate_quotes_filter_size_permutation_fits(self):
         # Design bbox: 10x100x10 (sorted: 10,10,100)
         # MF_A max_size_mm: 100x100x20 (sorted: 20,100,100)
@@ -919,3 +896,1801 @@ class GenerateQuotesViewTests(APITestCase):
         # MF3 (PLA, size [200,200,200]) - should quote.
         self.assertEqual(len(response.data["generated_quotes"]), 1)
         self.assertEqual(response.data["generated_quotes"][0]['manufacturer'], self.manufacturer3_user.id)
+
+    def test_generate_quotes_filter_size_either_box_fits(self):
+        # A 141.4 mm rod at 45 degrees: its OBB (141.4 x 2 x 2) is too long for a 120 mm machine,
+        # but it fits as oriented in the file (bbox 101.4 x 101.4 x 2).
+        design_diagonal = Design.objects.create(
+            customer=self.customer, design_name="Diagonal Rod", material="PLA", quantity=1,
+            status=DesignStatus.ANALYSIS_COMPLETE,
+            geometric_data={"volume_cm3": 0.57, "complexity_score": 0.1, "bbox_mm": [101.4, 101.4, 2.0], "obb_mm": [141.4, 2.0, 2.0]}
+        )
+        self.manufacturer2_profile.capabilities["max_size_mm"] = [120, 120, 120]
+        self.manufacturer2_profile.save()
+        self._login(self.customer)
+        url = reverse('design_generate_quotes', kwargs={'id': design_diagonal.id})
+        response = self.client.post(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        quoted_mf_ids = {q['manufacturer'] for q in response.data["generated_quotes"]}
+        self.assertEqual(quoted_mf_ids, {self.manufacturer2_user.id, self.manufacturer3_user.id})
+
+        # The same holds for a multi-body design's two envelopes; a body too large either way is refused.
+        Quote.objects.all().delete()
+        design_diagonal.geometric_data["bodies"] = {"fit_envelope_mm": [141.4, 2.0, 2.0], "bbox_envelope_mm": [101.4, 101.4, 2.0]}
+        design_diagonal.save()
+        response = self.client.post(url, format='json')
+        self.assertEqual(len(response.data["generated_quotes"]), 2)
+        Quote.objects.all().delete()
+        design_diagonal.geometric_data["bodies"] = {"fit_envelope_mm": [141.4, 2.0, 2.0], "bbox_envelope_mm": [130.0, 130.0, 2.0]}
+        design_diagonal.save()
+        response = self.client.post(url, format='json')
+        self.assertEqual([q['manufacturer'] for q in response.data["generated_quotes"]], [self.manufacturer3_user.id])
+
+
+# --- Streaming binary STL reader ---
+import tempfile
+from django.test import SimpleTestCase
+
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class BinaryStlStreamingTests(SimpleTestCase):
+    def setUp(self):
+        from stl import mesh as stl_mesh_module, Mode
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        # The committed sample is ASCII; re-save it as binary for the streaming path.
+        self.reference_mesh = stl_mesh_module.Mesh.from_file(str(SAMPLE_STL_FILE_PATH))
+        self.binary_path = Path(self.tmp_dir.name) / "cube_10mm_binary.stl"
+        self.reference_mesh.save(str(self.binary_path), mode=Mode.BINARY)
+
+    def test_detect_stl_format(self):
+        from .stl_reader import detect_stl_format
+        self.assertEqual(detect_stl_format(str(self.binary_path)), 'binary')
+        self.assertEqual(detect_stl_format(str(SAMPLE_STL_FILE_PATH)), 'ascii')
+        self.assertIsNone(detect_stl_format(str(SAMPLE_IGES_FILE_PATH)))
+
+    def test_stream_metrics_match_numpy_stl(self):
+        from .stl_reader import stream_binary_stl_metrics
+        metrics = stream_binary_stl_metrics(str(self.binary_path), chunk_triangles=5) # Forces 3 chunks
+        self.assertEqual(metrics["num_triangles"], 12)
+        self.assertAlmostEqual(abs(metrics["volume_mm3"]), 1000.0, places=3)
+        self.assertAlmostEqual(metrics["surface_area_mm2"], float(self.reference_mesh.areas.sum()), places=3)
+        self.assertEqual(metrics["min_mm"], [0.0, 0.0, 0.0])
+        self.assertEqual(metrics["max_mm"], [10.0, 10.0, 10.0])
+
+    def test_perform_stl_analysis_uses_streaming_path_for_binary(self):
+        from .tasks import perform_stl_analysis
+        results = perform_stl_analysis(str(self.binary_path))
+        self.assertLessEqual(
+            {"volume_cm3", "bbox_mm", "surface_area_cm2", "complexity_score", "num_triangles", "analysis_engine"},
+            set(results)
+        )
+        self.assertEqual(results["bbox_mm"], [10.0, 10.0, 10.0])
+        self.assertAlmostEqual(results["surface_area_cm2"], 6.0, places=2)
+        self.assertTrue(results["analysis_engine"].startswith("gmqp-stl-stream"))
+
+    def test_truncated_binary_stl_is_rejected(self):
+        from .tasks import perform_stl_analysis
+        from .stl_reader import stream_binary_stl_metrics
+        truncated_path = Path(self.tmp_dir.name) / "truncated.stl"
+        truncated_path.write_bytes(self.binary_path.read_bytes()[:-20])
+        with self.assertRaises(ValueError):
+            stream_binary_stl_metrics(str(truncated_path))
+        with self.assertRaises(ValueError):
+            perform_stl_analysis(str(truncated_path))
+
+
+# --- Analysis lease (claim / process / commit) ---
+from datetime import timedelta
+from django.utils import timezone
+from .tasks import claim_design_for_analysis, commit_analysis_result, release_design_claim
+
+class DesignAnalysisLeaseTests(APITestCase):
+    def setUp(self):
+        self.customer_user = User.objects.create_user(
+            email="leaseuser@example.com", password="Password123!",
+            company_name="Lease Test Corp", role=UserRole.CUSTOMER
+        )
+        self.design = Design.objects.create(
+            customer=self.customer_user, design_name="Lease Design",
+            s3_file_key=f"uploads/designs/{self.customer_user.id}/lease.stl",
+            material="PLA", quantity=1, status=DesignStatus.PENDING_ANALYSIS
+        )
+
+    def test_claim_moves_design_to_analyzing(self):
+        design, token = claim_design_for_analysis(self.design.id)
+        self.assertIsNotNone(token)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYZING)
+        self.assertEqual(self.design.analysis_lease_token, token)
+        self.assertIsNotNone(self.design.analysis_leased_at)
+
+    def test_active_lease_cannot_be_claimed_twice(self):
+        claim_design_for_analysis(self.design.id)
+        _, second_token = claim_design_for_analysis(self.design.id)
+        self.assertIsNone(second_token)
+
+    def test_stale_lease_is_reclaimable_and_old_commit_is_discarded(self):
+        _, first_token = claim_design_for_analysis(self.design.id)
+        Design.objects.filter(id=self.design.id).update(
+            analysis_leased_at=timezone.now() - timedelta(seconds=settings.CAD_ANALYSIS_LEASE_SECONDS + 1)
+        )
+        _, second_token = claim_design_for_analysis(self.design.id)
+        self.assertIsNotNone(second_token)
+        self.assertNotEqual(first_token, second_token)
+
+        # The original worker finishing late must not overwrite the new claim.
+        self.assertFalse(commit_analysis_result(self.design.id, first_token, DesignStatus.ANALYSIS_COMPLETE, {"volume_cm3": 1.0}))
+        self.assertTrue(commit_analysis_result(self.design.id, second_token, DesignStatus.ANALYSIS_COMPLETE, {"volume_cm3": 2.0}))
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+        self.assertEqual(self.design.geometric_data, {"volume_cm3": 2.0})
+        self.assertIsNone(self.design.analysis_lease_token)
+
+    def test_release_returns_design_to_pending(self):
+        _, token = claim_design_for_analysis(self.design.id)
+        release_design_claim(self.design.id, token)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.PENDING_ANALYSIS)
+        self.assertIsNone(self.design.analysis_lease_token)
+
+    def test_beat_requeues_expired_leases(self):
+        from gmqp_project.celery import app
+        from .tasks import requeue_stale_analyses
+        entry = app.conf.beat_schedule['requeue-stale-analyses']
+        self.assertEqual(entry['task'], requeue_stale_analyses.name)
+        self.assertLess(entry['schedule'], settings.CAD_ANALYSIS_LEASE_SECONDS)
+
+        claim_design_for_analysis(self.design.id)
+        Design.objects.filter(id=self.design.id).update(
+            analysis_leased_at=timezone.now() - timedelta(seconds=settings.CAD_ANALYSIS_LEASE_SECONDS + 1)
+        )
+        with patch('designs.tasks.analyze_cad_file.delay') as mock_delay:
+            app.tasks[entry['task']].apply()
+        mock_delay.assert_called_once_with(self.design.id)
+
+
+# --- Content-addressed analysis cache ---
+from django.core.cache import cache as django_cache
+from . import analysis_cache
+from .models import AnalysisCacheEntry
+from .tasks import ANALYSIS_ENGINE_VERSION
+
+class AnalysisCacheTests(APITestCase):
+    def setUp(self):
+        django_cache.clear()
+        reset_s3_client()
+        self.addCleanup(reset_s3_client)
+        self.customer_user = User.objects.create_user(
+            email="cacheuser@example.com", password="Password123!",
+            company_name="Cache Test Corp", role=UserRole.CUSTOMER
+        )
+        self.design = Design.objects.create(
+            customer=self.customer_user, design_name="Re-uploaded Part",
+            s3_file_key=f"uploads/designs/{self.customer_user.id}/{uuid.uuid4()}.stl",
+            material="PLA", quantity=1, status=DesignStatus.PENDING_ANALYSIS
+        )
+        self.cached_data = {"volume_cm3": 1.0, "bbox_mm": [10.0, 10.0, 10.0], "complexity_score": 0.01}
+
+    def test_digest_from_s3_head_prefers_sha256_checksum(self):
+        self.assertEqual(
+            analysis_cache.digest_from_s3_head({"ETag": '"abc"', "ChecksumSHA256": "c2hh"}), "sha256-b64:c2hh"
+        )
+        self.assertEqual(analysis_cache.digest_from_s3_head({"ETag": '"abc-2"'}), "s3-etag:abc-2")
+        self.assertIsNone(analysis_cache.digest_from_s3_head(MagicMock()))
+
+    @patch('designs.s3_io.boto3.client')
+    def test_cache_hit_skips_download_and_parse(self, mock_boto_client_constructor):
+        from .tasks import analysis_cache_version, kernels_for_material
+        # STL results are keyed by the kernels run for the design's material too.
+        AnalysisCacheEntry.objects.create(
+            content_digest="s3-etag:abc", engine_version=analysis_cache_version(kernels_for_material("PLA")),
+            geometric_data=self.cached_data
+        )
+        mock_s3_instance = MagicMock()
+        mock_s3_instance.head_object.return_value = {"ETag": '"abc"', "ContentLength": 1477}
+        mock_boto_client_constructor.return_value = mock_s3_instance
+
+        result_message = analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+        self.assertEqual(self.design.geometric_data, self.cached_data)
+        self.assertIn("from analysis cache", result_message)
+        mock_s3_instance.download_file.assert_not_called()
+        self.assertEqual(analysis_cache.get_cache_stats(), {"hits": 1, "misses": 0})
+        self.assertEqual(AnalysisCacheEntry.objects.get().hit_count, 1)
+
+    def test_other_engine_version_is_a_miss(self):
+        AnalysisCacheEntry.objects.create(content_digest="s3-etag:abc", engine_version="0", geometric_data=self.cached_data)
+        self.assertIsNone(analysis_cache.get_cached_analysis("s3-etag:abc", ANALYSIS_ENGINE_VERSION))
+        self.assertEqual(analysis_cache.get_cache_stats(), {"hits": 0, "misses": 1})
+
+    @override_settings(CAD_ANALYSIS_CACHE_MAX_ENTRIES=2)
+    def test_retention_evicts_least_recently_used(self):
+        analysis_cache.store_analysis("s3-etag:0", ANALYSIS_ENGINE_VERSION, self.cached_data)
+        analysis_cache.store_analysis("s3-etag:1", ANALYSIS_ENGINE_VERSION, self.cached_data)
+        # Touch entry 0 so entry 1 becomes the least recently used.
+        analysis_cache.get_cached_analysis("s3-etag:0", ANALYSIS_ENGINE_VERSION)
+        analysis_cache.store_analysis("s3-etag:2", ANALYSIS_ENGINE_VERSION, self.cached_data)
+        self.assertEqual(
+            set(AnalysisCacheEntry.objects.values_list('content_digest', flat=True)), {"s3-etag:0", "s3-etag:2"}
+        )
+
+
+# --- Isolated analysis job execution ---
+import os
+import time
+from .analysis_executor import (
+    run_analysis_job, AnalysisJobTimeout, AnalysisJobMemoryExceeded, AnalysisJobCrashed
+)
+
+def _job_returns_sum(a, b):
+    return {"sum": a + b}
+
+def _job_sleeps(seconds):
+    time.sleep(seconds)
+
+def _job_allocates(num_bytes):
+    return len(bytearray(num_bytes))
+
+def _job_raises_value_error():
+    raise ValueError("Invalid or corrupt STL file: broken.stl")
+
+def _job_exits_hard():
+    os._exit(9)
+
+def _job_s3_client_id():
+    from .s3_io import get_s3_client
+    return id(get_s3_client())
+
+class AnalysisExecutorTests(SimpleTestCase):
+    def test_result_is_returned_from_child_process(self):
+        self.assertEqual(run_analysis_job(_job_returns_sum, 2, 3), {"sum": 5})
+
+    def test_job_exceeding_timeout_is_killed(self):
+        started = time.monotonic()
+        with self.assertRaises(AnalysisJobTimeout):
+            run_analysis_job(_job_sleeps, 30, timeout=0.5)
+        self.assertLess(time.monotonic() - started, 10)
+
+    def test_job_exceeding_memory_limit_fails(self):
+        with self.assertRaises(AnalysisJobMemoryExceeded):
+            run_analysis_job(_job_allocates, 64 * 1024 ** 3, memory_limit_mb=4096)
+
+    def test_job_exceptions_are_reraised(self):
+        with self.assertRaisesMessage(ValueError, "Invalid or corrupt STL file"):
+            run_analysis_job(_job_raises_value_error)
+
+    def test_dead_job_process_is_reported(self):
+        with self.assertRaises(AnalysisJobCrashed):
+            run_analysis_job(_job_exits_hard)
+
+    def test_jobs_run_from_inside_a_celery_pool_worker(self):
+        # Celery's prefork pool runs each task in a daemonic billiard process.
+        from billiard.pool import Pool
+        with Pool(1) as pool:
+            self.assertEqual(pool.apply(run_analysis_job, (_job_returns_sum, 2, 3)), {"sum": 5})
+            with self.assertRaises(AnalysisJobTimeout):
+                pool.apply(run_analysis_job, (_job_sleeps, 30), {"timeout": 0.5})
+
+
+# --- Streaming S3 analysis (no temp file) ---
+import io
+
+def _apply_range(payload, range_header):
+    """Slices payload like S3 would for a 'bytes=start-end' Range header."""
+    if not range_header:
+        return payload
+    start, end = (int(x) for x in range_header[len("bytes="):].split("-"))
+    return payload[start:end + 1]
+
+
+class S3StreamingAnalysisTests(APITestCase):
+    def setUp(self):
+        reset_s3_client()
+        self.addCleanup(reset_s3_client)
+        from stl import mesh as stl_mesh_module, Mode
+        self.customer_user = User.objects.create_user(
+            email="streamuser@example.com", password="Password123!",
+            company_name="Stream Test Corp", role=UserRole.CUSTOMER
+        )
+        self.design = Design.objects.create(
+            customer=self.customer_user, design_name="Streamed Part",
+            s3_file_key=f"uploads/designs/{self.customer_user.id}/{uuid.uuid4()}.stl",
+            material="PLA", quantity=1, status=DesignStatus.PENDING_ANALYSIS
+        )
+        binary_buffer = io.BytesIO()
+        stl_mesh_module.Mesh.from_file(str(SAMPLE_STL_FILE_PATH)).save("cube.stl", fh=binary_buffer, mode=Mode.BINARY)
+        self.binary_bytes = binary_buffer.getvalue()
+
+    def _mock_s3_get_object(self, payload):
+        mock_s3_instance = MagicMock()
+        mock_s3_instance.head_object.return_value = {"ContentLength": len(payload)} # No ETag: hashed while streaming
+        mock_s3_instance.get_object.side_effect = lambda **kwargs: {
+            "Body": io.BytesIO(_apply_range(payload, kwargs.get("Range"))), "ContentLength": len(payload)
+        }
+        return mock_s3_instance
+
+    @patch('designs.s3_io.boto3.client')
+    def test_binary_stl_is_streamed_without_download(self, mock_boto_client_constructor):
+        mock_s3_instance = self._mock_s3_get_object(self.binary_bytes)
+        mock_boto_client_constructor.return_value = mock_s3_instance
+
+        with self.captureOnCommitCallbacks(execute=True):
+            analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+        self.assertEqual(self.design.geometric_data["bbox_mm"], [10.0, 10.0, 10.0])
+        self.assertEqual(self.design.geometric_data["num_triangles"], 12)
+        mock_s3_instance.download_file.assert_not_called()
+        # The SHA-256 computed while streaming keys the analysis cache.
+        self.assertTrue(AnalysisCacheEntry.objects.filter(content_digest__startswith="sha256:").exists())
+
+    @patch('designs.s3_io.boto3.client')
+    def test_stream_analysis_reports_transfer_metrics(self, mock_boto_client_constructor):
+        from .tasks import perform_s3_stl_stream_analysis
+        mock_boto_client_constructor.return_value = self._mock_s3_get_object(self.binary_bytes)
+
+        results, transfer_info = perform_s3_stl_stream_analysis("bucket", "cube.stl", compute_sha256=True)
+
+        self.assertEqual(results["num_triangles"], 12)
+        self.assertEqual(transfer_info["bytes_read"], len(self.binary_bytes))
+        self.assertIsNotNone(transfer_info["time_to_first_byte_ms"])
+        self.assertFalse(transfer_info["used_temp_file"])
+        self.assertTrue(transfer_info["content_digest"].startswith("sha256:"))
+
+    @patch('designs.s3_io.boto3.client')
+    def test_truncated_stream_fails_analysis(self, mock_boto_client_constructor):
+        mock_boto_client_constructor.return_value = self._mock_s3_get_object(self.binary_bytes[:-20])
+
+        analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_FAILED)
+        self.assertIn("Invalid or corrupt STL file", self.design.geometric_data["error"])
+
+    @patch('designs.s3_io.boto3.client')
+    def test_missing_object_marks_design_failed(self, mock_boto_client_constructor):
+        mock_s3_instance = MagicMock()
+        mock_s3_instance.get_object.side_effect = ClientError(
+            {'Error': {'Code': 'NoSuchKey', 'Message': 'Not Found'}}, 'GetObject'
+        )
+        mock_boto_client_constructor.return_value = mock_s3_instance
+
+        result_message = analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_FAILED)
+        self.assertIn("S3 file not found", result_message)
+
+
+# --- Shared S3 client ---
+from . import s3_io
+
+class SharedS3ClientTests(SimpleTestCase):
+    def setUp(self):
+        reset_s3_client()
+        self.addCleanup(s3_io.set_s3_client_factory, None)
+
+    @patch('designs.s3_io.boto3.client')
+    def test_client_is_built_once_per_process(self, mock_boto_client_constructor):
+        first = s3_io.get_s3_client()
+        second = s3_io.get_s3_client()
+        self.assertIs(first, second)
+        self.assertEqual(mock_boto_client_constructor.call_count, 1)
+        config = mock_boto_client_constructor.call_args.kwargs['config']
+        self.assertEqual(config.max_pool_connections, settings.AWS_S3_MAX_POOL_CONNECTIONS)
+        self.assertEqual(config.signature_version, settings.AWS_S3_SIGNATURE_VERSION)
+
+    def test_factory_can_be_swapped_for_a_local_stand_in(self):
+        stand_in = MagicMock(name="moto_or_minio_client")
+        s3_io.set_s3_client_factory(lambda: stand_in)
+        self.assertIs(s3_io.get_s3_client(), stand_in)
+
+    def test_forked_child_builds_its_own_client(self):
+        s3_io.set_s3_client_factory(lambda: MagicMock())
+        parent_client = s3_io.get_s3_client()
+        child_client_id = run_analysis_job(_job_s3_client_id)
+        self.assertNotEqual(child_client_id, id(parent_client))
+
+
+# --- Ranged parallel download ---
+import io
+import tempfile
+
+class RangedDownloadTests(SimpleTestCase):
+    def setUp(self):
+        self.payload = bytes(range(256)) * 40 # 10240 bytes
+        handle, self.local_path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, self.local_path)
+
+    def _ranged_client(self):
+        def get_object(Bucket, Key, Range):
+            start, end = (int(x) for x in Range[len("bytes="):].split("-"))
+            return {'Body': io.BytesIO(self.payload[start:end + 1])}
+        client = MagicMock()
+        client.get_object.side_effect = get_object
+        return client
+
+    def test_large_object_is_fetched_in_concurrent_ranges(self):
+        client = self._ranged_client()
+        stats = s3_io.download_s3_object(
+            client, "bucket", "key", self.local_path, object_size=len(self.payload),
+            part_size=3000, concurrency=3, threshold=4096
+        )
+        self.assertEqual(stats["strategy"], "ranged")
+        self.assertEqual(stats["parts"], 4)
+        self.assertEqual(client.get_object.call_count, 4)
+        client.download_file.assert_not_called()
+        with open(self.local_path, 'rb') as f:
+            self.assertEqual(f.read(), self.payload)
+
+    def test_small_or_unsized_object_uses_a_single_request(self):
+        client = self._ranged_client()
+        stats = s3_io.download_s3_object(
+            client, "bucket", "key", self.local_path, object_size=None,
+            part_size=3000, concurrency=3, threshold=4096
+        )
+        self.assertEqual(stats["strategy"], "single")
+        client.download_file.assert_called_once_with("bucket", "key", self.local_path)
+        client.get_object.assert_not_called()
+
+    def test_short_part_raises(self):
+        client = self._ranged_client()
+        self.payload, full = self.payload[:-10], self.payload
+        with self.assertRaises(IOError):
+            s3_io.download_s3_object(
+                client, "bucket", "key", self.local_path, object_size=len(full),
+                part_size=3000, concurrency=2, threshold=4096
+            )
+
+
+# --- STL header triage ---
+class StlObjectFixtureMixin:
+    """A design whose S3 object is the binary sample cube, served by a Range-aware mock client."""
+
+    def setUp(self):
+        reset_s3_client()
+        self.addCleanup(reset_s3_client)
+        from stl import mesh as stl_mesh_module, Mode
+        self.customer_user = User.objects.create_user(
+            email="triageuser@example.com", password="Password123!",
+            company_name="Triage Test Corp", role=UserRole.CUSTOMER
+        )
+        self.design = Design.objects.create(
+            customer=self.customer_user, design_name="Triaged Part",
+            s3_file_key=f"uploads/designs/{self.customer_user.id}/{uuid.uuid4()}.stl",
+            material="PLA", quantity=1, status=DesignStatus.PENDING_ANALYSIS
+        )
+        binary_buffer = io.BytesIO()
+        stl_mesh_module.Mesh.from_file(str(SAMPLE_STL_FILE_PATH)).save("cube.stl", fh=binary_buffer, mode=Mode.BINARY)
+        self.binary_bytes = binary_buffer.getvalue()
+
+    def _mock_s3_get_object(self, payload):
+        mock_s3_instance = MagicMock()
+        mock_s3_instance.head_object.return_value = {"ContentLength": len(payload), "ETag": '"triage-etag"'}
+        mock_s3_instance.get_object.side_effect = lambda **kwargs: {
+            "Body": io.BytesIO(_apply_range(payload, kwargs.get("Range"))), "ContentLength": len(payload)
+        }
+        return mock_s3_instance
+
+
+class StlHeaderTriageTests(StlObjectFixtureMixin, APITestCase):
+    @patch('designs.s3_io.boto3.client')
+    def test_size_mismatch_fails_without_full_read(self, mock_boto_client_constructor):
+        mock_s3_instance = self._mock_s3_get_object(self.binary_bytes[:-20])
+        mock_boto_client_constructor.return_value = mock_s3_instance
+
+        result_message = analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_FAILED)
+        self.assertIn("Invalid or corrupt STL file", result_message)
+        # Only the 84-byte header peek was issued.
+        mock_s3_instance.get_object.assert_called_once()
+        self.assertEqual(mock_s3_instance.get_object.call_args.kwargs["Range"], "bytes=0-83")
+
+    @override_settings(CAD_ANALYSIS_STL_MAX_TRIANGLES=10)
+    @patch('designs.s3_io.boto3.client')
+    def test_oversized_mesh_fails_immediately(self, mock_boto_client_constructor):
+        mock_boto_client_constructor.return_value = self._mock_s3_get_object(self.binary_bytes)
+
+        analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_FAILED)
+        self.assertIn("12 triangles", self.design.geometric_data["error"])
+
+    @override_settings(CAD_ANALYSIS_STL_INLINE_MAX_TRIANGLES=10, CAD_ANALYSIS_HEAVY_QUEUE="heavy-test")
+    @patch('designs.tasks.analyze_cad_file.apply_async')
+    @patch('designs.s3_io.boto3.client')
+    def test_large_mesh_is_routed_to_heavy_queue(self, mock_boto_client_constructor, mock_apply_async):
+        mock_boto_client_constructor.return_value = self._mock_s3_get_object(self.binary_bytes)
+
+        result_message = analyze_cad_file(self.design.id)
+
+        self.assertIn("heavy-test", result_message)
+        mock_apply_async.assert_called_once_with(args=[self.design.id], kwargs={"heavy": True}, queue="heavy-test")
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.PENDING_ANALYSIS) # Released for the heavy worker
+
+        # On the heavy queue the same file is analyzed rather than routed again.
+        analyze_cad_file(self.design.id, heavy=True)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+
+
+# --- Vectorized ASCII STL reader ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class AsciiStlReaderTests(SimpleTestCase):
+    def setUp(self):
+        from stl import mesh as stl_mesh_module
+        self.reference_mesh = stl_mesh_module.Mesh.from_file(str(SAMPLE_STL_FILE_PATH))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_metrics_match_numpy_stl(self):
+        from .stl_reader import stream_ascii_stl_metrics
+        metrics = stream_ascii_stl_metrics(str(SAMPLE_STL_FILE_PATH))
+        volume, _, _ = self.reference_mesh.get_mass_properties()
+        self.assertAlmostEqual(metrics["volume_mm3"], float(volume), places=3)
+        self.assertAlmostEqual(metrics["surface_area_mm2"], float(self.reference_mesh.areas.sum()), places=3)
+        self.assertEqual(metrics["min_mm"], self.reference_mesh.min_.tolist())
+        self.assertEqual(metrics["max_mm"], self.reference_mesh.max_.tolist())
+        self.assertEqual(metrics["num_triangles"], 12)
+
+    def test_small_blocks_do_not_split_facets(self):
+        # Blocks far smaller than one facet must still reassemble every triangle.
+        import numpy
+        from .stl_reader import iter_ascii_stl_chunks
+        chunks = list(iter_ascii_stl_chunks(str(SAMPLE_STL_FILE_PATH), block_bytes=37))
+        vectors = numpy.concatenate(chunks)
+        numpy.testing.assert_allclose(vectors, self.reference_mesh.vectors.astype(numpy.float64))
+
+    def test_scientific_notation_and_crlf(self):
+        from .stl_reader import stream_ascii_stl_metrics
+        content = (
+            b"solid tri\r\n facet normal 0 0 1\r\n  outer loop\r\n"
+            b"   vertex 0 0 0\r\n   vertex 1.0e+01 0 0\r\n   vertex 0 1E1 0\r\n"
+            b"  endloop\r\n endfacet\r\nendsolid tri\r\n"
+        )
+        metrics = stream_ascii_stl_metrics(self._write("tri.stl", content))
+        self.assertEqual(metrics["max_mm"], [10.0, 10.0, 0.0])
+        self.assertAlmostEqual(metrics["surface_area_mm2"], 50.0)
+
+    def test_upper_case_keywords(self):
+        import numpy
+        from .stl_reader import iter_ascii_stl_chunks, stream_ascii_stl_metrics
+        path = self._write("CUBE.STL", SAMPLE_STL_FILE_PATH.read_bytes().upper())
+        self.assertEqual(stream_ascii_stl_metrics(path)["num_triangles"], 12)
+        # Small blocks are cut after 'ENDFACET' too.
+        vectors = numpy.concatenate(list(iter_ascii_stl_chunks(path, block_bytes=37)))
+        numpy.testing.assert_allclose(vectors, self.reference_mesh.vectors.astype(numpy.float64))
+
+    def test_malformed_vertex_raises(self):
+        from .stl_reader import stream_ascii_stl_metrics
+        path = self._write("bad.stl", SAMPLE_STL_FILE_PATH.read_bytes().replace(b"vertex 10 0 0", b"vertex 10 abc 0", 1))
+        with self.assertRaises(ValueError):
+            stream_ascii_stl_metrics(path)
+
+
+# --- Fused mesh metric kernel ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class MeshMetricsTests(SimpleTestCase):
+    def _cube_vectors(self):
+        from stl import mesh as stl_mesh_module
+        return stl_mesh_module.Mesh.from_file(str(SAMPLE_STL_FILE_PATH)).vectors.astype("float64")
+
+    def test_chunked_reduction_matches_single_pass(self):
+        from .mesh_metrics import MeshMetricsAccumulator
+        vectors = self._cube_vectors()
+        whole, chunked = MeshMetricsAccumulator(), MeshMetricsAccumulator()
+        whole.add(vectors)
+        for start in range(0, len(vectors), 5):
+            chunked.add(vectors[start:start + 5])
+        self.assertEqual(whole.result("cube"), chunked.result("cube"))
+
+    def test_normal_statistics(self):
+        import numpy
+        from .mesh_metrics import MeshMetricsAccumulator
+        vectors = self._cube_vectors()
+        closed = MeshMetricsAccumulator()
+        closed.add(vectors)
+        self.assertAlmostEqual(closed.result("cube")["normal_closure_error"], 0.0)
+
+        # Dropping the two top facets opens the surface; adding a zero-area facet is degenerate.
+        top = vectors[:, :, 2].min(axis=1) == 10.0
+        sliver = [[[0.0, 0.0, 0.0], [1.0, 1.0, 1.0], [2.0, 2.0, 2.0]]]
+        open_mesh = MeshMetricsAccumulator()
+        open_mesh.add(vectors[~top])
+        open_mesh.add(numpy.array(sliver))
+        metrics = open_mesh.result("open cube")
+        self.assertAlmostEqual(metrics["normal_closure_error"], 200.0 / 1000.0)
+        self.assertEqual(metrics["degenerate_triangles"], 1)
+
+    def test_format_rounds_only_at_output(self):
+        from .mesh_metrics import format_geometric_data
+        data = format_geometric_data({
+            "volume_mm3": 1234.5678, "surface_area_mm2": 987.654, "min_mm": [0.0, -1.25, 2.0],
+            "max_mm": [10.04, 3.0, 2.06], "obb_extents_mm": [10.04, 4.25, 0.06], "num_triangles": 20000,
+            "degenerate_triangles": 0, "normal_closure_error": 0.0,
+            "convex_hull_volume_mm3": 2345.678, "stock_volume_mm3": 2560.206,
+            "edge_features": {
+                "sharp_edge_length_mm": 0.0, "smooth_turning_mm": 0.0, "dihedral_histogram_mm": {"0-1": 12.34},
+            },
+        }, "test-engine")
+        self.assertEqual(data["volume_cm3"], 1.23)
+        self.assertEqual(data["surface_area_cm2"], 9.88)
+        self.assertEqual(data["bbox_mm"], [10.0, 4.2, 0.1])
+        self.assertEqual(data["obb_mm"], [10.0, 4.2, 0.1])
+        self.assertEqual((data["convex_hull_volume_cm3"], data["stock_volume_cm3"]), (2.35, 2.56))
+        self.assertEqual(data["removed_volume_cm3"], 1.33)
+        # 20000 triangles no longer means maximal complexity; only surface / volume^(2/3) counts here.
+        self.assertEqual(data["complexity_score"], 0.06)
+        self.assertEqual(data["complexity_features"]["dihedral_histogram_mm"], {"0-1": 12.3})
+
+
+# --- Oriented bounding box ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class OrientedBoundingBoxTests(SimpleTestCase):
+    def _rotated_box_triangles(self, size, angles):
+        import numpy
+        corners = numpy.array([[x, y, z] for x in (0, size[0]) for y in (0, size[1]) for z in (0, size[2])], dtype=float)
+        rotation = numpy.eye(3)
+        for axis, angle in enumerate(angles):
+            cos, sin = numpy.cos(angle), numpy.sin(angle)
+            i, j = [k for k in range(3) if k != axis]
+            step = numpy.eye(3)
+            step[i, i], step[i, j], step[j, i], step[j, j] = cos, -sin, sin, cos
+            rotation = step @ rotation
+        corners = corners @ rotation.T
+        # Winding does not matter for the box; every corner appears in some facet.
+        faces = [(0, 1, 3), (0, 3, 2), (4, 6, 7), (4, 7, 5), (0, 4, 5), (0, 5, 1),
+                 (2, 3, 7), (2, 7, 6), (0, 2, 6), (0, 6, 4), (1, 5, 7), (1, 7, 3)]
+        return corners[numpy.array(faces)]
+
+    def test_diagonal_part_gets_tight_box(self):
+        import numpy
+        from .mesh_metrics import MeshMetricsAccumulator
+        accumulator = MeshMetricsAccumulator()
+        accumulator.add(self._rotated_box_triangles((100.0, 40.0, 10.0), (0.3, 0.0, 0.6)))
+        metrics = accumulator.result("rotated box")
+        numpy.testing.assert_allclose(metrics["obb_extents_mm"], [100.0, 40.0, 10.0], atol=1e-6)
+        self.assertTrue(all(
+            aabb > obb for aabb, obb in zip(sorted(numpy.subtract(metrics["max_mm"], metrics["min_mm"]), reverse=True),
+                                            metrics["obb_extents_mm"])
+        ))
+
+    def test_support_points_are_bounded_and_survive_partials(self):
+        import numpy
+        from .mesh_metrics import MeshMetricsAccumulator
+        from .oriented_bbox import SUPPORT_DIRECTIONS, reduce_to_support_points
+        points = numpy.random.default_rng(7).normal(size=(6000, 3))
+        self.assertLessEqual(len(reduce_to_support_points(points)), 2 * len(SUPPORT_DIRECTIONS))
+
+        first, second = MeshMetricsAccumulator(), MeshMetricsAccumulator()
+        first.add(points[:3600].reshape(-1, 3, 3))
+        second.add(points[3600:].reshape(-1, 3, 3))
+        whole = MeshMetricsAccumulator()
+        whole.add(points.reshape(-1, 3, 3))
+        merged = MeshMetricsAccumulator.from_partial(first.to_partial())
+        merged.merge(MeshMetricsAccumulator.from_partial(second.to_partial()))
+        self.assertEqual(merged.result("merged")["obb_extents_mm"], whole.result("whole")["obb_extents_mm"])
+
+    def test_flat_and_axis_aligned_inputs(self):
+        from .oriented_bbox import fit_oriented_bbox
+        square = [[0, 0, 0], [10, 0, 0], [0, 10, 0], [10, 10, 0]]
+        self.assertEqual([round(extent, 6) for extent in fit_oriented_bbox(square)["extents"]], [10.0, 10.0, 0.0])
+        block = [[x, y, z] for x in (0, 20) for y in (0, 10) for z in (0, 5)]
+        self.assertEqual([round(extent, 6) for extent in fit_oriented_bbox(block)["extents"]], [20.0, 10.0, 5.0])
+
+
+# --- Convex hull and machining volumes ---
+def grid_box_triangles(size, cells):
+    # Each face of an axis-aligned box split into cells x cells squares (2 outward-wound triangles each).
+    import numpy
+    grid = numpy.linspace(0.0, 1.0, cells + 1)
+    u, v = numpy.meshgrid(grid, grid)
+    faces = []
+    for axis in range(3):
+        for side in (0.0, 1.0):
+            coords = [None, None, None]
+            coords[axis] = numpy.full_like(u, side)
+            coords[(axis + 1) % 3], coords[(axis + 2) % 3] = u, v
+            corners = numpy.stack(coords, axis=-1) * size
+            a, b, c, d = corners[:-1, :-1], corners[1:, :-1], corners[1:, 1:], corners[:-1, 1:]
+            if side: # Keep the winding counter-clockwise seen from outside
+                b, d = d, b
+            faces.append(numpy.stack([a, b, c], axis=-2).reshape(-1, 3, 3))
+            faces.append(numpy.stack([a, c, d], axis=-2).reshape(-1, 3, 3))
+    return numpy.concatenate(faces)
+
+
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class ConvexHullTests(SimpleTestCase):
+    def test_hull_of_cube_grid_and_flat_input(self):
+        import numpy
+        from .convex_hull import convex_hull
+        grid = numpy.linspace(0.0, 10.0, 11)
+        hull = convex_hull(numpy.array(numpy.meshgrid(grid, grid, grid)).reshape(3, -1).T)
+        self.assertEqual((len(hull.vertices), len(hull.faces)), (8, 12))
+        self.assertAlmostEqual(hull.volume, 1000.0)
+        self.assertEqual(convex_hull([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]]).volume, 0.0)
+
+    def test_streamed_box_keeps_only_corners(self):
+        # Every face vertex is coplanar with the support-point hull, so none survive the prefilter.
+        import numpy
+        from .mesh_metrics import MeshMetricsAccumulator
+        accumulator = MeshMetricsAccumulator()
+        triangles = grid_box_triangles(numpy.array([100.0, 40.0, 10.0]), 40)
+        for start in range(0, len(triangles), 5000):
+            accumulator.add(triangles[start:start + 5000])
+        metrics = accumulator.result("grid box")
+        self.assertAlmostEqual(metrics["convex_hull_volume_mm3"], 40000.0, places=6)
+        self.assertAlmostEqual(metrics["stock_volume_mm3"], 40000.0, places=6)
+        self.assertLess(len(accumulator.hull_candidates), 1000)
+
+    def test_concave_part_removes_more_than_its_hull(self):
+        # An L-shaped pair of boxes: part < hull < stock.
+        import numpy
+        from .mesh_metrics import MeshMetricsAccumulator, format_geometric_data
+        accumulator = MeshMetricsAccumulator()
+        accumulator.add(grid_box_triangles(numpy.array([30.0, 10.0, 10.0]), 3))
+        upright = grid_box_triangles(numpy.array([10.0, 10.0, 20.0]), 3)
+        accumulator.add(upright + numpy.array([0.0, 0.0, 10.0]))
+        data = format_geometric_data(accumulator.result("L"), "test-engine")
+        self.assertEqual(data["volume_cm3"], 5.0)
+        self.assertEqual(data["stock_volume_cm3"], 9.0)
+        self.assertEqual(data["convex_hull_volume_cm3"], 7.0) # 700 mm^2 hull profile x 10 mm
+        self.assertEqual(data["removed_volume_cm3"], 4.0)
+
+    def test_decimation_caps_points_and_stays_inside(self):
+        import numpy
+        from .convex_hull import HULL_MAX_POINTS, convex_hull, decimate_hull_points
+        points = numpy.random.default_rng(3).normal(size=(100000, 3))
+        points /= numpy.linalg.norm(points, axis=1)[:, None]
+        decimated = decimate_hull_points(points)
+        self.assertLessEqual(len(decimated), HULL_MAX_POINTS)
+        volume = convex_hull(decimated).volume
+        self.assertLess(volume, 4.0 / 3.0 * numpy.pi)
+        self.assertGreater(volume, 0.99 * 4.0 / 3.0 * numpy.pi)
+
+
+# --- Feature-based complexity ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class MeshFeatureComplexityTests(SimpleTestCase):
+    def _features(self, *chunks):
+        from .mesh_metrics import MeshMetricsAccumulator, format_geometric_data
+        accumulator = MeshMetricsAccumulator()
+        for chunk in chunks:
+            accumulator.add(chunk)
+        return accumulator.result("part"), format_geometric_data(accumulator.result("part"), "test-engine")
+
+    def test_score_ignores_tessellation(self):
+        import numpy
+        from .mesh_features import COMPLEXITY_VERSION
+        size = numpy.array([40.0, 30.0, 20.0])
+        coarse_metrics, coarse = self._features(grid_box_triangles(size, 1))
+        fine_triangles = grid_box_triangles(size, 60)
+        fine_metrics, fine = self._features(*(fine_triangles[i:i + 7000] for i in range(0, len(fine_triangles), 7000)))
+        self.assertEqual(fine["complexity_score"], coarse["complexity_score"])
+        self.assertLess(fine["complexity_score"], 0.2)
+        self.assertEqual(fine["complexity_version"], COMPLEXITY_VERSION)
+        # The 12 box edges are the only sharp ones, whichever chunk their two facets are in.
+        self.assertAlmostEqual(fine_metrics["edge_features"]["sharp_edge_length_mm"], 360.0)
+        self.assertEqual(fine["complexity_features"]["dihedral_histogram_mm"]["90-135"], 360.0)
+        self.assertEqual((fine_metrics["edge_features"]["open_edges"], fine_metrics["edge_features"]["non_manifold_edges"]), (0, 0))
+
+    def test_feature_rich_part_scores_higher(self):
+        # A 6x6 grid of separate blocks on the plane has many sharp edges and a lot of surface per volume.
+        import numpy
+        _, box = self._features(grid_box_triangles(numpy.array([60.0, 60.0, 5.0]), 4))
+        blocks = [
+            grid_box_triangles(numpy.array([5.0, 5.0, 5.0]), 2) + numpy.array([10.0 * i, 10.0 * j, 0.0])
+            for i in range(6) for j in range(6)
+        ]
+        _, features = self._features(numpy.concatenate(blocks))
+        self.assertGreater(features["complexity_score"], box["complexity_score"] + 0.1)
+
+    def test_open_edges_survive_partials(self):
+        from .mesh_features import EdgeAdjacencyAccumulator
+        from .mesh_metrics import MeshMetricsAccumulator
+        from stl import mesh as stl_mesh_module
+        vectors = stl_mesh_module.Mesh.from_file(str(SAMPLE_STL_FILE_PATH)).vectors.astype("float64")
+        top = vectors[:, :, 2].min(axis=1) == 10.0
+        whole, first, second = MeshMetricsAccumulator(), MeshMetricsAccumulator(), MeshMetricsAccumulator()
+        whole.add(vectors[~top])
+        first.add(vectors[~top][:5])
+        second.add(vectors[~top][5:])
+        merged = MeshMetricsAccumulator.from_partial(first.to_partial())
+        merged.merge(MeshMetricsAccumulator.from_partial(second.to_partial()))
+        self.assertEqual(whole.result("open cube")["edge_features"]["open_edges"], 4) # The rim of the missing top
+        self.assertEqual(merged.result("open cube")["edge_features"], whole.result("open cube")["edge_features"])
+        self.assertIsInstance(merged.edges, EdgeAdjacencyAccumulator)
+        self.assertIsInstance(first.to_partial()["edges"]["open_edges"], str) # One base64 blob, not lists
+
+    def test_open_edges_spill_to_disk(self):
+        import numpy
+        from .mesh_features import EdgeAdjacencyAccumulator
+        triangles = grid_box_triangles(numpy.array([40.0, 30.0, 20.0]), 30)
+        triangles = triangles[numpy.random.default_rng(5).permutation(len(triangles))] # No locality between chunks
+        in_memory, spilled = EdgeAdjacencyAccumulator(), EdgeAdjacencyAccumulator(spill_edges=500)
+        held = []
+        for start in range(0, len(triangles), 1000):
+            chunk = triangles[start:start + 1000]
+            cross = numpy.cross(chunk[:, 1] - chunk[:, 0], chunk[:, 2] - chunk[:, 0])
+            in_memory.add(chunk, cross)
+            spilled.add(chunk, cross)
+            held.append(spilled.pending_edges)
+        self.assertIsNotNone(spilled.spill_file)
+        self.assertLessEqual(max(held), 500)
+        features = spilled.result()
+        self.assertEqual((features["open_edges"], features["non_manifold_edges"]), (0, 0))
+        self.assertEqual(features["interior_edges"], 3 * len(triangles) // 2)
+        for name, value in in_memory.result().items():
+            if isinstance(value, dict):
+                for bin_name, length in value.items():
+                    self.assertAlmostEqual(features[name][bin_name], length, places=6)
+            else:
+                self.assertAlmostEqual(features[name], value, places=6)
+        self.assertIsNone(spilled.spill_file)
+
+
+# --- Mesh topology ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class MeshTopologyTests(SimpleTestCase):
+    def test_closed_box_welds_to_one_watertight_body(self):
+        import numpy
+        from .mesh_topology import build_topology
+        report = build_topology(grid_box_triangles(numpy.array([3.0, 2.0, 1.0]), 3)).summary()
+        self.assertEqual((report["num_vertices"], report["num_edges"]), (56, 162)) # V - E + F = 2
+        self.assertTrue(report["watertight"] and report["consistently_oriented"])
+        self.assertEqual((report["num_bodies"], report["inverted_bodies"]), (1, 0))
+
+    def test_defects_are_counted(self):
+        import numpy
+        from .mesh_topology import build_topology
+        box = grid_box_triangles(numpy.array([1.0, 1.0, 1.0]), 1)
+        open_box = build_topology(box[2:]).summary()
+        self.assertEqual((open_box["boundary_edges"], open_box["watertight"]), (4, False))
+        flipped = box.copy()
+        flipped[0] = flipped[0][[0, 2, 1]]
+        self.assertEqual(build_topology(flipped).summary()["inconsistent_edges"], 3)
+        self.assertEqual(build_topology(box[:, [0, 2, 1]]).summary()["inverted_bodies"], 1)
+        # A third facet on an existing edge makes it non-manifold.
+        fin = numpy.array([[box[0][0], box[0][1], [0.5, 0.5, 2.0]]])
+        report = build_topology(numpy.concatenate([box, fin])).summary()
+        self.assertEqual((report["non_manifold_edges"], report["num_bodies"]), (1, 1))
+
+    def test_separate_bodies_and_collapsed_faces(self):
+        import numpy
+        from .mesh_topology import build_topology
+        box = grid_box_triangles(numpy.array([1.0, 1.0, 1.0]), 2)
+        sliver = numpy.array([[[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [1.0, 0.0, 0.0]]])
+        blocks = [box + numpy.array([2.0 * i, 0.0, 0.0]) for i in range(5)] + [sliver]
+        topology = build_topology(numpy.concatenate(blocks))
+        report = topology.summary()
+        self.assertEqual((report["num_bodies"], report["collapsed_faces"]), (5, 1))
+        self.assertEqual(topology.face_bodies[-1], -1)
+        numpy.testing.assert_allclose(topology.body_signed_volumes(), numpy.ones(5))
+
+    def test_inverted_bodies_do_not_cancel_out_in_the_volume(self):
+        import numpy
+        from .mesh_topology import TriangleCollector
+        from .tasks import analyze_mesh_topology
+        box = grid_box_triangles(numpy.array([10.0, 10.0, 10.0]), 1)
+        collector = TriangleCollector(max_triangles=100)
+        collector.add(numpy.concatenate([box, box[:, [0, 2, 1]] + numpy.array([20.0, 0.0, 0.0])]))
+        results = {"volume_cm3": 0.0} # What the metric pass sums the two signed volumes to
+        analyze_mesh_topology(collector, results, "two boxes")
+        self.assertTrue(results["volume_reliable"])
+        self.assertEqual(results["volume_cm3"], 2.0)
+
+    def test_cavities_are_nested_not_inverted(self):
+        import numpy
+        from .mesh_topology import build_topology
+        # A 20 mm box around a 16 mm void, both correctly wound (the void's facets face into it),
+        # with a 2 mm cube floating in the void and a loose 1 mm cube outside the box.
+        outer = grid_box_triangles(numpy.array([20.0, 20.0, 20.0]), 4)
+        cavity = (grid_box_triangles(numpy.array([16.0, 16.0, 16.0]), 4) + 2.0)[:, [0, 2, 1]]
+        island = grid_box_triangles(numpy.array([2.0, 2.0, 2.0]), 1) + 9.0
+        loose = grid_box_triangles(numpy.array([1.0, 1.0, 1.0]), 1) + numpy.array([30.0, 0.0, 0.0])
+        topology = build_topology(numpy.concatenate([outer, cavity, island, loose]))
+        numpy.testing.assert_array_equal(topology.body_parents(), [-1, 0, 1, -1])
+        numpy.testing.assert_array_equal(topology.body_depths(), [0, 1, 2, 0])
+        numpy.testing.assert_array_equal(topology.body_outward_signs(), numpy.ones(4))
+        report = topology.summary()
+        self.assertEqual((report["num_bodies"], report["cavities"], report["inverted_bodies"]), (4, 1, 0))
+        # The same shells all wound the other way round are all inverted, the cavity included.
+        inverted = build_topology(numpy.concatenate([outer, cavity, island, loose])[:, [0, 2, 1]])
+        self.assertEqual((inverted.summary()["cavities"], inverted.summary()["inverted_bodies"]), (1, 4))
+
+    def test_collector_gives_up_above_its_limit(self):
+        import numpy
+        from .mesh_topology import TriangleCollector
+        collector = TriangleCollector(max_triangles=20)
+        collector.add(numpy.zeros((12, 3, 3)))
+        self.assertEqual(collector.triangles().shape, (12, 3, 3))
+        collector.add(numpy.zeros((12, 3, 3)))
+        self.assertIsNone(collector.triangles())
+        self.assertEqual(collector.num_triangles, 24)
+
+    @override_settings(CAD_ANALYSIS_TOPOLOGY_MAX_TRIANGLES=5)
+    def test_large_meshes_skip_the_topology_stage(self):
+        from .tasks import perform_stl_analysis
+        results = perform_stl_analysis(str(SAMPLE_STL_FILE_PATH))
+        self.assertNotIn("topology", results)
+        self.assertNotIn("volume_reliable", results)
+
+
+# --- Multi-body STL ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class MultiBodyStlTests(SimpleTestCase):
+    def _bodies(self):
+        # Two congruent 30 x 20 x 10 blocks (one turned 90 degrees about z) and a 5 mm cube, 100 mm apart.
+        import numpy
+        block = grid_box_triangles(numpy.array([30.0, 20.0, 10.0]), 2)
+        turned = block[:, :, [1, 0, 2]][:, [0, 2, 1]] # Swapping x and y mirrors, so the winding is swapped back
+        return [block, turned + numpy.array([100.0, 0.0, 0.0]), grid_box_triangles(numpy.array([5.0, 5.0, 5.0]), 2) + 200.0]
+
+    def test_congruent_bodies_share_a_signature(self):
+        import numpy
+        from .mesh_topology import build_topology
+        properties = build_topology(numpy.concatenate(self._bodies())).body_properties()
+        numpy.testing.assert_array_equal(properties["signature"][0], properties["signature"][1])
+        self.assertFalse(numpy.array_equal(properties["signature"][0], properties["signature"][2]))
+        numpy.testing.assert_allclose(properties["volume"], [6000.0, 6000.0, 125.0])
+        numpy.testing.assert_allclose(properties["max"][1] - properties["min"][1], [20.0, 30.0, 10.0])
+
+    def test_analysis_splits_bodies_and_counts_copies(self):
+        import numpy
+        from stl import mesh as stl_mesh_module, Mode
+        from .tasks import perform_stl_analysis
+        triangles = numpy.concatenate(self._bodies())
+        part = stl_mesh_module.Mesh(numpy.zeros(len(triangles), dtype=stl_mesh_module.Mesh.dtype))
+        part.vectors[:] = triangles
+        with tempfile.NamedTemporaryFile(suffix=".stl") as tmp_file:
+            part.save(tmp_file.name, mode=Mode.BINARY)
+            results = perform_stl_analysis(tmp_file.name)
+
+        self.assertEqual(results["bbox_mm"], [205.0, 205.0, 205.0]) # All bodies together
+        bodies = results["bodies"]
+        self.assertEqual((bodies["num_bodies"], bodies["num_unique_bodies"]), (3, 2))
+        self.assertEqual(bodies["fit_envelope_mm"], [30.0, 20.0, 10.0]) # What each body needs on its own
+        first, second = bodies["parts"]
+        self.assertEqual((first["instances"], first["volume_cm3"], first["obb_mm"]), (2, 6.0, [30.0, 20.0, 10.0]))
+        self.assertEqual((second["instances"], second["volume_cm3"], second["surface_area_cm2"]), (1, 0.12, 1.5)) # 0.125 rounds half-even
+        self.assertFalse(bodies["parts_truncated"])
+
+    def test_voids_belong_to_the_body_around_them(self):
+        import numpy
+        from .mesh_topology import TriangleCollector
+        from .tasks import analyze_mesh_topology
+        # Two copies of a 20 mm box with a 16 mm void (wound either way round) and a solid 20 mm box.
+        outer = grid_box_triangles(numpy.array([20.0, 20.0, 20.0]), 2)
+        cavity = (grid_box_triangles(numpy.array([16.0, 16.0, 16.0]), 2) + 2.0)[:, [0, 2, 1]]
+        hollow = numpy.concatenate([outer, cavity])
+        collector = TriangleCollector(max_triangles=1000)
+        collector.add(numpy.concatenate([hollow, hollow[:, [0, 2, 1]] + 50.0, outer + 100.0]))
+        results = {}
+        analyze_mesh_topology(collector, results, "boxes.stl")
+        self.assertEqual((results["topology"]["num_bodies"], results["topology"]["cavities"]), (5, 2))
+        self.assertEqual(results["volume_cm3"], 15.81) # 2 x 3.904 + 8 cm^3
+        bodies = results["bodies"]
+        self.assertEqual((bodies["num_bodies"], bodies["num_unique_bodies"]), (3, 2))
+        self.assertEqual(bodies["fit_envelope_mm"], [20.0, 20.0, 20.0])
+        solid, hollow_part = bodies["parts"]
+        self.assertEqual((solid["instances"], solid["volume_cm3"], solid["surface_area_cm2"]), (1, 8.0, 24.0))
+        self.assertEqual((hollow_part["instances"], hollow_part["volume_cm3"], hollow_part["surface_area_cm2"]), (2, 3.9, 39.36))
+        # A single hollow box is one body: no parts list.
+        collector = TriangleCollector(max_triangles=1000)
+        collector.add(hollow)
+        results = {}
+        analyze_mesh_topology(collector, results, "hollow.stl")
+        self.assertNotIn("bodies", results)
+
+    def test_fit_envelope_holds_diagonal_rods(self):
+        import numpy
+        from .mesh_topology import TriangleCollector
+        from .tasks import analyze_mesh_topology
+        # Two 141.4 x 2 x 2 mm rods lying at 45 degrees: each needs 141.4 mm along its length
+        # (its axis-aligned box is 101.4 x 101.4 x 2 mm, so no per-axis mix of the two boxes is safe).
+        angle = numpy.radians(45.0)
+        rotation = numpy.array([[numpy.cos(angle), -numpy.sin(angle), 0.0], [numpy.sin(angle), numpy.cos(angle), 0.0], [0.0, 0.0, 1.0]])
+        rod = grid_box_triangles(numpy.array([100.0 * numpy.sqrt(2.0), 2.0, 2.0]), 2) @ rotation.T
+        collector = TriangleCollector(max_triangles=1000)
+        collector.add(numpy.concatenate([rod, rod + numpy.array([0.0, 0.0, 50.0])]))
+        results = {}
+        analyze_mesh_topology(collector, results, "rods.stl")
+        bodies = results["bodies"]
+        self.assertEqual((bodies["num_bodies"], bodies["parts"][0]["obb_mm"]), (2, [141.4, 2.0, 2.0]))
+        self.assertEqual(bodies["fit_envelope_mm"], [141.4, 2.0, 2.0])
+        self.assertEqual(bodies["bbox_envelope_mm"], [101.4, 101.4, 2.0])
+
+
+# --- Wall thickness ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class WallThicknessTests(SimpleTestCase):
+    def test_bvh_hits_match_brute_force(self):
+        import numpy
+        from .wall_thickness import TriangleBVH
+        triangles = numpy.concatenate([
+            grid_box_triangles(numpy.array([3.0, 2.0, 1.0]), 4),
+            grid_box_triangles(numpy.array([1.0, 1.0, 1.0]), 3) + 5.0,
+        ])
+        rng = numpy.random.default_rng(1)
+        origins = rng.uniform(-1.0, 7.0, (300, 3))
+        directions = rng.normal(size=(300, 3))
+        bvh = TriangleBVH(triangles)
+        t, hit_ids = bvh.first_hits(origins, directions, 0.0)
+        # Every ray against every facet.
+        repeated = numpy.repeat(numpy.arange(len(origins)), len(triangles))
+        brute = bvh._intersect(origins[repeated], directions[repeated], numpy.tile(numpy.arange(len(triangles)), len(origins)))
+        brute = numpy.where(brute > 0.0, brute, numpy.inf).reshape(len(origins), len(triangles)).min(axis=1)
+        numpy.testing.assert_allclose(t, brute)
+        self.assertTrue(numpy.all((hit_ids >= 0) == numpy.isfinite(t)))
+
+    def test_plate_and_hollow_box(self):
+        import numpy
+        from .wall_thickness import measure_wall_thickness
+        plate = grid_box_triangles(numpy.array([50.0, 30.0, 2.0]), 4)
+        thicknesses = measure_wall_thickness(plate, numpy.ones(len(plate)), 500)
+        self.assertAlmostEqual(thicknesses.min(), 2.0)
+        self.assertAlmostEqual(numpy.percentile(thicknesses, 5), 2.0)
+        # A 20 mm box with 1 mm walls: the cavity's facets face inward (outward_sign -1 flips them back).
+        cavity = grid_box_triangles(numpy.array([18.0, 18.0, 18.0]), 4) + 1.0
+        hollow = numpy.concatenate([grid_box_triangles(numpy.array([20.0, 20.0, 20.0]), 4), cavity])
+        signs = numpy.concatenate([numpy.ones(len(hollow) - len(cavity)), -numpy.ones(len(cavity))])
+        thicknesses = measure_wall_thickness(hollow, signs, 1000)
+        self.assertEqual(len(thicknesses), 1000)
+        # Rays starting within 1 mm of an outer edge miss the cavity and cross the whole box.
+        self.assertAlmostEqual(thicknesses.min(), 1.0)
+        self.assertAlmostEqual(numpy.median(thicknesses), 1.0)
+        self.assertAlmostEqual(thicknesses.max(), 20.0)
+
+    def test_stage_needs_a_closed_mesh_and_a_sample_budget(self):
+        import numpy
+        from .mesh_topology import TriangleCollector
+        from .tasks import analyze_mesh_stages
+
+        def stages(triangles):
+            collector = TriangleCollector(max_triangles=1000)
+            collector.add(triangles)
+            results = {}
+            analyze_mesh_stages(collector, results, "part.stl")
+            return results
+
+        box = grid_box_triangles(numpy.array([4.0, 3.0, 2.0]), 2)
+        results = stages(box[:, [0, 2, 1]]) # Inside out: rays must still go into the material
+        self.assertEqual((results["wall_thickness"]["min_mm"], results["wall_thickness"]["samples"]), (2.0, 4096))
+        self.assertNotIn("wall_thickness", stages(box[2:])) # Open
+        with override_settings(CAD_ANALYSIS_THICKNESS_SAMPLES=0):
+            self.assertNotIn("wall_thickness", stages(box))
+
+
+    @override_settings(CAD_ANALYSIS_SUPPORT_SAMPLES=0) # Layers along +z
+    def test_hollow_box_stages(self):
+        import numpy
+        from .mesh_topology import TriangleCollector
+        from .tasks import analyze_mesh_stages
+        # A 20 mm box with a 16 mm internal void: 2 mm walls all round.
+        outer = grid_box_triangles(numpy.array([20.0, 20.0, 20.0]), 4)
+        cavity = (grid_box_triangles(numpy.array([16.0, 16.0, 16.0]), 4) + 2.0)[:, [0, 2, 1]]
+        collector = TriangleCollector(max_triangles=1000)
+        collector.add(numpy.concatenate([outer, cavity]))
+        results = {}
+        analyze_mesh_stages(collector, results, "hollow.stl")
+        self.assertEqual((results["topology"]["cavities"], results["topology"]["inverted_bodies"]), (1, 0))
+        self.assertEqual(results["volume_cm3"], 3.9) # 8000 - 4096 mm^3
+        self.assertEqual((results["wall_thickness"]["min_mm"], results["wall_thickness"]["median_mm"]), (2.0, 2.0))
+        # Solid floor and roof, a 2 mm frame in between.
+        self.assertEqual(results["layer_profile"]["runs"], [[0, 400.0, 80.0], [20, 144.0, 144.0], [180, 400.0, 80.0]])
+
+
+# --- Overhangs and support volume ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class SupportVolumeTests(SimpleTestCase):
+    def test_table_needs_support_under_its_top_only(self):
+        import numpy
+        from .overhang import support_by_orientation
+        # A 30 x 30 x 2 top 1 mm above a 10 x 10 x 10 post: built upright, the top's 800 mm^2 of
+        # overhang needs 11 mm columns to the plate and the 100 mm^2 over the post 1 mm ones.
+        post = grid_box_triangles(numpy.array([10.0, 10.0, 10.0]), 4) + numpy.array([10.0, 10.0, 0.0])
+        top = grid_box_triangles(numpy.array([30.0, 30.0, 2.0]), 6) + numpy.array([0.0, 0.0, 11.0])
+        table = numpy.concatenate([post, top])
+        estimates = support_by_orientation(table, numpy.ones(len(table)), 20000)
+        upright, upside_down = 0, 1 # CANDIDATE_DIRECTIONS starts with +z, -z
+        numpy.testing.assert_allclose(estimates["overhang_area"][[upright, upside_down]], [900.0, 100.0])
+        self.assertAlmostEqual(estimates["support_volume"][upright] / 8900.0, 1.0, delta=0.05)
+        self.assertAlmostEqual(estimates["support_volume"][upside_down] / 100.0, 1.0, delta=0.1)
+        self.assertEqual(estimates["build_height"][upright], 13.0)
+
+    def test_tilted_cube_needs_a_wedge_of_support(self):
+        import numpy
+        from .overhang import support_by_orientation
+        angle = 0.3
+        rotation = numpy.array([[1.0, 0.0, 0.0], [0.0, numpy.cos(angle), -numpy.sin(angle)], [0.0, numpy.sin(angle), numpy.cos(angle)]])
+        cube = grid_box_triangles(numpy.array([10.0, 10.0, 10.0]), 4) @ rotation.T
+        estimates = support_by_orientation(cube, numpy.ones(len(cube)), 20000)
+        self.assertAlmostEqual(estimates["overhang_area"][0], 100.0) # The bottom face, resting on one edge
+        wedge = 10.0 * 0.5 * (10.0 * numpy.cos(angle)) * (10.0 * numpy.sin(angle))
+        self.assertAlmostEqual(estimates["support_volume"][0] / wedge, 1.0, delta=0.05)
+
+    def test_stage_picks_the_orientation_with_least_support(self):
+        import numpy
+        from .mesh_topology import build_topology
+        from .tasks import analyze_support
+        from .wall_thickness import TriangleBVH
+        # An L-shaped bracket, extruded 10 mm along y: lying on its long leg (+z up) or standing on its
+        # end (+y up) it needs no support, and on its end the build is lowest.
+        leg = grid_box_triangles(numpy.array([30.0, 10.0, 2.0]), 3)
+        wall = grid_box_triangles(numpy.array([2.0, 10.0, 20.0]), 3) + numpy.array([0.0, 0.0, 2.0])
+        triangles = build_topology(numpy.concatenate([leg, wall]))
+        triangles = triangles.vertices[triangles.faces]
+        results = {}
+        analyze_support(triangles, numpy.ones(len(triangles)), TriangleBVH(triangles), results, "bracket.stl")
+        support = results["support"]
+        self.assertEqual(len(support["candidates"]), 26)
+        self.assertEqual(support["best"]["up"], [0.0, 1.0, 0.0])
+        self.assertEqual((support["best"]["support_volume_cm3"], support["best"]["build_height_mm"]), (0.0, 10.0))
+        upright, upside_down = support["candidates"][:2]
+        self.assertEqual((upright["support_volume_cm3"], upright["build_height_mm"]), (0.0, 22.0))
+        self.assertGreater(upside_down["support_volume_cm3"], 0.0)
+
+
+# --- Layer profile ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class LayerProfileTests(SimpleTestCase):
+    def test_octahedron_matches_closed_form(self):
+        import numpy
+        from .layer_profile import layer_areas_and_perimeters
+        # |x| + |y| + |z| <= 10: the slice at height z is a square of area 2 (10 - |z|)^2.
+        facets = []
+        for x in (10.0, -10.0):
+            for y in (10.0, -10.0):
+                for z in (10.0, -10.0):
+                    corners = numpy.array([[x, 0.0, 0.0], [0.0, y, 0.0], [0.0, 0.0, z]])
+                    if numpy.cross(corners[1] - corners[0], corners[2] - corners[0]) @ corners.sum(axis=0) < 0:
+                        corners = corners[[0, 2, 1]]
+                    facets.append(corners)
+        areas, perimeters, layer_height = layer_areas_and_perimeters(numpy.array(facets), numpy.ones(8), [0.0, 0.0, 1.0], 0.5)
+        distances = 10.0 - numpy.abs((numpy.arange(40) + 0.5) * layer_height - 10.0)
+        numpy.testing.assert_allclose(areas, 2.0 * distances ** 2)
+        numpy.testing.assert_allclose(perimeters, 4.0 * numpy.sqrt(2.0) * distances)
+
+    def test_profile_compresses_and_expands(self):
+        import numpy
+        from .layer_profile import compress_profile, expand_layer_profile, layer_areas_and_perimeters
+        post = grid_box_triangles(numpy.array([10.0, 10.0, 10.0]), 4) + numpy.array([10.0, 10.0, 0.0])
+        top = grid_box_triangles(numpy.array([30.0, 30.0, 2.0]), 6) + numpy.array([0.0, 0.0, 11.0])
+        table = numpy.concatenate([post, top])
+        areas, perimeters, _ = layer_areas_and_perimeters(table, numpy.ones(len(table)), [0.0, 0.0, 1.0], 0.5)
+        runs = compress_profile(areas, perimeters)
+        self.assertEqual(runs, [[0, 100.0, 40.0], [20, 0.0, 0.0], [22, 900.0, 120.0]])
+        expanded_areas, _ = expand_layer_profile({"runs": runs, "num_layers": len(areas)})
+        self.assertAlmostEqual(expanded_areas.sum() * 0.5, 1000.0 + 1800.0) # Post and top volumes
+
+    def test_tall_parts_get_thicker_layers(self):
+        import numpy
+        from . import layer_profile
+        rod = grid_box_triangles(numpy.array([1.0, 1.0, 100.0]), 1)
+        with patch.object(layer_profile, "MAX_LAYERS", 300):
+            areas, _, layer_height = layer_profile.layer_areas_and_perimeters(rod, numpy.ones(len(rod)), [0.0, 0.0, 1.0], 0.1)
+        self.assertEqual((layer_height, len(areas)), (0.4, 250))
+        numpy.testing.assert_allclose(areas, 1.0)
+
+
+# --- CNC tool access ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class ToolAccessTests(SimpleTestCase):
+    def test_block_needs_two_setups_and_has_no_undercuts(self):
+        import numpy
+        from .tool_access import SETUP_LABELS, minimum_setups, setup_visibility
+        block = grid_box_triangles(numpy.array([10.0, 20.0, 5.0]), 3)
+        visible, total_area, facing, sealed = setup_visibility(block, numpy.ones(len(block)), 2000, 1.5)
+        self.assertFalse(sealed.any())
+        self.assertTrue(visible.any(axis=1).all())
+        self.assertAlmostEqual(total_area, 700.0)
+        numpy.testing.assert_allclose(facing, [200.0, 200.0, 100.0, 100.0, 50.0, 50.0]) # +z, -z, +x, -x, +y, -y
+        # Walls are cut with the side of the tool, so top and bottom setups reach everything.
+        self.assertEqual([SETUP_LABELS[setup] for setup in minimum_setups(visible)], ["+z", "-z"])
+
+    def test_slot_narrower_than_the_tool_is_an_undercut(self):
+        import numpy
+        from .tool_access import setup_visibility
+        # A 30 x 30 x 2 top 1 mm above a 10 x 10 x 10 post: the post's top and the top's underside
+        # over it face each other across a slot no tool fits into.
+        post = grid_box_triangles(numpy.array([10.0, 10.0, 10.0]), 4) + numpy.array([10.0, 10.0, 0.0])
+        top = grid_box_triangles(numpy.array([30.0, 30.0, 2.0]), 6) + numpy.array([0.0, 0.0, 11.0])
+        table = numpy.concatenate([post, top])
+        visible, total_area, _, _ = setup_visibility(table, numpy.ones(len(table)), 20000, 1.5)
+        undercut_area = (~visible.any(axis=1)).mean() * total_area
+        self.assertAlmostEqual(undercut_area / 200.0, 1.0, delta=0.1)
+
+    def test_stage_flags_parts_that_need_five_axes(self):
+        import numpy
+        from .tasks import analyze_tool_access
+        from .wall_thickness import TriangleBVH
+        block = grid_box_triangles(numpy.array([10.0, 20.0, 5.0]), 3)
+        results = {}
+        analyze_tool_access(block, numpy.ones(len(block)), TriangleBVH(block), results, "block.stl")
+        access = results["cnc_access"]
+        self.assertEqual((access["setups"], access["setup_directions"], access["needs_5_axis"]), (2, ["+z", "-z"], False))
+        self.assertEqual((access["undercut_area_cm2"], access["directions"]["+z"]["facing_area_cm2"]), (0.0, 2.0))
+        self.assertEqual(access["tool_radius_mm"], 1.5)
+        # A cavity not flagged as sealed is out of reach of every setup.
+        cavity = grid_box_triangles(numpy.array([6.0, 6.0, 6.0]), 2) + 2.0
+        hollow = numpy.concatenate([grid_box_triangles(numpy.array([10.0, 10.0, 10.0]), 2), cavity])
+        signs = numpy.concatenate([numpy.ones(len(hollow) - len(cavity)), -numpy.ones(len(cavity))])
+        analyze_tool_access(hollow, signs, TriangleBVH(hollow), results, "hollow.stl")
+        self.assertTrue(results["cnc_access"]["needs_5_axis"])
+
+    @override_settings(CAD_ANALYSIS_THICKNESS_SAMPLES=256, CAD_ANALYSIS_SUPPORT_SAMPLES=256, CAD_ANALYSIS_ACCESS_SAMPLES=4096)
+    def test_sealed_void_is_not_an_undercut(self):
+        import numpy
+        from .mesh_topology import TriangleCollector
+        from .tasks import analyze_mesh_stages
+        # A 20 mm box with a sealed 10 mm void: the void's walls (a fifth of the surface) face every
+        # setup from inside the material, but no tool gets in, so the part is still a 2-setup block.
+        outer = grid_box_triangles(numpy.array([20.0, 20.0, 20.0]), 2)
+        cavity = (grid_box_triangles(numpy.array([10.0, 10.0, 10.0]), 2) + 5.0)[:, [0, 2, 1]]
+        collector = TriangleCollector(max_triangles=1000)
+        collector.add(numpy.concatenate([outer, cavity]))
+        results = {}
+        analyze_mesh_stages(collector, results, "sealed.stl")
+        self.assertEqual(results["topology"]["cavities"], 1)
+        access = results["cnc_access"]
+        self.assertEqual((access["setups"], access["undercut_area_cm2"], access["needs_5_axis"]), (2, 0.0, False))
+        self.assertAlmostEqual(access["sealed_cavity_area_cm2"], 6.0, delta=0.6) # 600 of 3000 mm^2
+        self.assertEqual(access["directions"]["+z"]["facing_area_cm2"], 4.0) # Outer top only
+
+    @override_settings(CAD_ANALYSIS_TOOL_RADIUS_MM=0.25)
+    def test_tool_radius_comes_from_settings(self):
+        import numpy
+        from .tasks import analyze_tool_access
+        from .wall_thickness import TriangleBVH
+        # The 1 mm slot of test_slot_narrower_than_the_tool_is_an_undercut takes a 0.5 mm tool.
+        post = grid_box_triangles(numpy.array([10.0, 10.0, 10.0]), 4) + numpy.array([10.0, 10.0, 0.0])
+        top = grid_box_triangles(numpy.array([30.0, 30.0, 2.0]), 6) + numpy.array([0.0, 0.0, 11.0])
+        table = numpy.concatenate([post, top])
+        results = {}
+        analyze_tool_access(table, numpy.ones(len(table)), TriangleBVH(table), results, "table.stl")
+        self.assertEqual(results["cnc_access"]["tool_radius_mm"], 0.25)
+        self.assertLess(results["cnc_access"]["undercut_area_cm2"], 0.5) # Under a quarter of the 2 cm^2 slot
+
+
+# --- Analysis kernels ---
+@skipIf(not NUMPY_STL_AVAILABLE, "numpy-stl not installed")
+class MeshKernelTests(SimpleTestCase):
+    def test_scheduler_computes_only_the_declared_intermediates(self):
+        from .mesh_kernels import KernelScheduler
+        self.assertEqual(KernelScheduler(["tessellation"]).intermediates, ["vertices", "edges", "edge_lengths"])
+        self.assertEqual(
+            KernelScheduler(["axis_aligned_area"]).intermediates, ["vertices", "edges", "cross", "areas", "normals"]
+        )
+        with self.assertRaisesRegex(ValueError, "Unknown analysis kernels: lathe"):
+            KernelScheduler(["lathe"])
+
+    def test_register_kernel_validates_declarations(self):
+        from .mesh_kernels import MeshKernel, register_kernel
+        with self.assertRaisesRegex(ValueError, "unknown inputs: curvature"):
+            register_kernel("curvature", inputs=("curvature",))
+        with self.assertRaisesRegex(ValueError, "unknown processes: casting"):
+            register_kernel("draft", inputs=("normals",), processes=("casting",))
+        with self.assertRaisesRegex(ValueError, "already registered"):
+            register_kernel("tessellation", inputs=("edge_lengths",))(type("Duplicate", (MeshKernel,), {}))
+
+    def test_kernels_are_selected_by_material(self):
+        from .tasks import analysis_cache_version, kernels_for_material
+        self.assertEqual(kernels_for_material("PLA"), ["slope_histogram", "tessellation"])
+        self.assertEqual(kernels_for_material(" al-6061 "), ["axis_aligned_area", "tessellation"])
+        self.assertEqual(kernels_for_material("Unobtainium"), ["axis_aligned_area", "slope_histogram", "tessellation"])
+        with override_settings(CAD_ANALYSIS_MATERIAL_PROCESSES={"unobtainium": ["sla"]}):
+            self.assertEqual(kernels_for_material("Unobtainium"), ["slope_histogram", "tessellation"])
+        self.assertNotEqual(analysis_cache_version(kernels_for_material("PLA")), analysis_cache_version(None))
+        self.assertEqual(analysis_cache_version(None), analysis_cache_version(kernels_for_material("Unobtainium")))
+
+    def test_box_results_and_chunked_merge(self):
+        import json
+        import numpy
+        from .mesh_kernels import KernelScheduler
+        box = grid_box_triangles(numpy.array([10.0, 20.0, 30.0]), 4)
+        whole = KernelScheduler()
+        whole.add(box)
+        results = whole.results()
+        self.assertEqual(results["axis_aligned_area"], {"axis_area_cm2": [12.0, 6.0, 4.0], "aligned_fraction": 1.0})
+        self.assertEqual(results["slope_histogram"]["band_area_cm2"], [4.0, 0.0, 0.0, 0.0, 0.0, 18.0])
+        self.assertEqual((results["tessellation"]["min_mm"], results["tessellation"]["max_mm"]), (2.5, 9.0139))
+        self.assertTrue(all(seconds >= 0.0 for seconds in whole.kernel_seconds.values()))
+        # Shards round-trip through JSON (as Celery passes them) and merge to the same result.
+        first, second = KernelScheduler(), KernelScheduler()
+        first.add(box[:50])
+        second.add(box[50:])
+        merged = KernelScheduler.from_partial(json.loads(json.dumps(first.to_partial())))
+        merged.merge(KernelScheduler.from_partial(json.loads(json.dumps(second.to_partial()))))
+        self.assertEqual(merged.results(), results)
+
+    def test_accumulator_feeds_its_cross_products_to_the_kernels(self):
+        import numpy
+        from .mesh_kernels import KernelScheduler, MeshKernel
+        from .mesh_metrics import MeshMetricsAccumulator
+        box = grid_box_triangles(numpy.array([10.0, 20.0, 30.0]), 4)
+        direct = KernelScheduler()
+        direct.add(box)
+        fed = KernelScheduler(["axis_aligned_area"])
+        accumulator = MeshMetricsAccumulator(kernels=fed)
+        accumulator.add(box[:50])
+        accumulator.add(box[50:])
+        self.assertEqual(fed.results()["axis_aligned_area"], direct.results()["axis_aligned_area"])
+        # cross and areas come from the accumulator, so the scheduler never builds them (or the edges).
+        self.assertEqual((fed.intermediate_seconds["edges"], fed.intermediate_seconds["cross"]), (0.0, 0.0))
+        with self.assertRaises(TypeError):
+            type("Incomplete", (MeshKernel,), {"add": lambda self, **inputs: None})()
+
+    def test_stl_analysis_runs_the_selected_kernels(self):
+        from .tasks import perform_stl_analysis
+        results = perform_stl_analysis(str(SAMPLE_STL_FILE_PATH), kernels=["tessellation"])
+        self.assertEqual(list(results["kernels"]), ["tessellation"])
+        # Per-kernel timings are stored with the results, for the kernel and the intermediates it read.
+        timings = results["kernel_timings_ms"]
+        self.assertEqual((list(timings["kernels"]), list(timings["intermediates"])), (["tessellation"], ["vertices", "edges", "edge_lengths"]))
+        self.assertTrue(all(milliseconds >= 0.0 for group in timings.values() for milliseconds in group.values()))
+        no_kernels = perform_stl_analysis(str(SAMPLE_STL_FILE_PATH), kernels=[])
+        self.assertNotIn("kernels", no_kernels)
+        self.assertNotIn("kernel_timings_ms", no_kernels)
+
+
+# --- Two-phase analysis ---
+class TwoPhaseAnalysisTests(StlObjectFixtureMixin, APITestCase):
+    def _analyze_fast_phase(self, mock_s3_instance):
+        # Runs analyze_cad_file with the enrichment dispatch captured instead of run (eager Celery would run it inline).
+        with patch('designs.s3_io.boto3.client', return_value=mock_s3_instance), \
+                patch('designs.tasks.enrich_stl_analysis.apply_async') as mock_apply_async, \
+                self.captureOnCommitCallbacks(execute=True):
+            analyze_cad_file(self.design.id)
+        mock_apply_async.assert_called_once()
+        return mock_apply_async.call_args.kwargs["args"]
+
+    def test_design_is_quotable_before_enrichment(self):
+        self._analyze_fast_phase(self._mock_s3_get_object(self.binary_bytes))
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+        self.assertEqual((self.design.geometric_data["bbox_mm"], self.design.geometric_data["volume_cm3"]), ([10.0, 10.0, 10.0], 1.0))
+        self.assertEqual(self.design.geometric_data["enrichment"]["status"], "pending")
+        self.assertNotIn("topology", self.design.geometric_data)
+        self.assertFalse(AnalysisCacheEntry.objects.exists()) # Only complete results are cached
+
+    def test_enrichment_merges_without_clobbering_concurrent_writes(self):
+        from .tasks import enrich_stl_analysis
+        mock_s3_instance = self._mock_s3_get_object(self.binary_bytes)
+        enrichment_args = self._analyze_fast_phase(mock_s3_instance)
+        # Written by someone else between the two phases.
+        self.design.refresh_from_db()
+        Design.objects.filter(id=self.design.id).update(
+            status=DesignStatus.QUOTED, geometric_data={**self.design.geometric_data, "reviewer_note": "checked"}
+        )
+
+        with patch('designs.s3_io.boto3.client', return_value=mock_s3_instance):
+            result_message = enrich_stl_analysis(*enrichment_args)
+
+        self.assertIn("Enrichment status: complete", result_message)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.QUOTED)
+        geometric_data = self.design.geometric_data
+        self.assertEqual((geometric_data["reviewer_note"], geometric_data["enrichment"]), ("checked", {"status": "complete"}))
+        self.assertEqual((geometric_data["topology"]["watertight"], geometric_data["wall_thickness"]["min_mm"]), (True, 10.0))
+        self.assertEqual(AnalysisCacheEntry.objects.get().geometric_data["layer_profile"]["num_layers"], 100)
+
+    def test_stale_enrichment_is_discarded(self):
+        from .tasks import enrich_stl_analysis
+        mock_s3_instance = self._mock_s3_get_object(self.binary_bytes)
+        design_id, s3_file_key, _, content_digest, cache_version = self._analyze_fast_phase(mock_s3_instance)
+        with patch('designs.s3_io.boto3.client', return_value=mock_s3_instance):
+            result_message = enrich_stl_analysis(design_id, s3_file_key, str(uuid.uuid4()), content_digest, cache_version)
+        self.assertIn("no longer pending", result_message)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.geometric_data["enrichment"]["status"], "pending")
+
+    def test_failed_enrichment_keeps_the_design_quotable(self):
+        from .tasks import enrich_stl_analysis
+        enrichment_args = self._analyze_fast_phase(self._mock_s3_get_object(self.binary_bytes))
+        with patch('designs.s3_io.boto3.client', return_value=self._mock_s3_get_object(self.binary_bytes[:-20])):
+            enrich_stl_analysis(*enrichment_args)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+        self.assertEqual(self.design.geometric_data["enrichment"]["status"], "failed")
+        self.assertEqual(self.design.geometric_data["bbox_mm"], [10.0, 10.0, 10.0])
+
+    def test_unexpected_errors_mark_enrichment_failed(self):
+        from .tasks import enrich_stl_analysis
+        enrichment_args = self._analyze_fast_phase(self._mock_s3_get_object(self.binary_bytes))
+        with patch('designs.tasks.perform_s3_stl_enrichment', side_effect=KeyError("normals")):
+            enrich_stl_analysis(*enrichment_args)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.geometric_data["enrichment"]["status"], "failed")
+        self.assertIn("Unexpected enrichment error", self.design.geometric_data["enrichment"]["error"])
+
+    def test_s3_errors_mark_enrichment_failed_once_retries_run_out(self):
+        from .tasks import enrich_stl_analysis
+        enrichment_args = self._analyze_fast_phase(self._mock_s3_get_object(self.binary_bytes))
+        mock_s3_instance = MagicMock()
+        mock_s3_instance.get_object.side_effect = ClientError({'Error': {'Code': '503', 'Message': 'Slow Down'}}, 'GetObject')
+        with patch('designs.s3_io.boto3.client', return_value=mock_s3_instance):
+            enrich_stl_analysis.apply(args=enrichment_args, retries=enrich_stl_analysis.max_retries)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.geometric_data["enrichment"]["status"], "failed")
+        self.assertIn("S3 error", self.design.geometric_data["enrichment"]["error"])
+
+    def test_enrichment_is_dispatched_on_commit_and_requeued_when_stale(self):
+        from .tasks import requeue_stale_analyses
+        with patch('designs.s3_io.boto3.client', return_value=self._mock_s3_get_object(self.binary_bytes)), \
+                patch('designs.tasks.enrich_stl_analysis.apply_async', side_effect=OSError("broker down")) as mock_apply_async, \
+                self.captureOnCommitCallbacks() as callbacks:
+            analyze_cad_file(self.design.id)
+            mock_apply_async.assert_not_called() # Not before the result is committed
+        self.assertEqual(len(callbacks), 1)
+        with patch('designs.tasks.enrich_stl_analysis.apply_async', side_effect=OSError("broker down")):
+            callbacks[0]() # The failed send is logged; the design stays quotable with a pending marker
+        self.design.refresh_from_db()
+        marker = self.design.geometric_data["enrichment"]
+        self.assertEqual((self.design.status, marker["status"], marker["attempts"]), (DesignStatus.ANALYSIS_COMPLETE, "pending", 1))
+
+        def make_stale():
+            geometric_data = Design.objects.get(id=self.design.id).geometric_data
+            geometric_data["enrichment"]["dispatched_at"] = (
+                timezone.now() - timedelta(seconds=settings.CAD_ANALYSIS_ENRICHMENT_STALE_SECONDS + 1)
+            ).isoformat()
+            Design.objects.filter(id=self.design.id).update(geometric_data=geometric_data)
+
+        with patch('designs.tasks.enrich_stl_analysis.apply_async') as mock_apply_async, self.captureOnCommitCallbacks(execute=True):
+            requeue_stale_analyses() # Not stale yet
+            make_stale()
+            requeue_stale_analyses()
+        mock_apply_async.assert_called_once()
+        self.assertEqual(mock_apply_async.call_args.kwargs["args"][:3], [str(self.design.id), self.design.s3_file_key, marker["token"]])
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.geometric_data["enrichment"]["attempts"], 2)
+
+        with override_settings(CAD_ANALYSIS_ENRICHMENT_MAX_ATTEMPTS=2), \
+                patch('designs.tasks.enrich_stl_analysis.apply_async') as mock_apply_async, self.captureOnCommitCallbacks(execute=True):
+            make_stale()
+            requeue_stale_analyses()
+        mock_apply_async.assert_not_called()
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.geometric_data["enrichment"]["status"], "failed")
+        self.assertEqual(self.design.geometric_data["bbox_mm"], [10.0, 10.0, 10.0])
+
+    def test_eager_run_and_single_phase_setting_give_full_results(self):
+        with patch('designs.s3_io.boto3.client', return_value=self._mock_s3_get_object(self.binary_bytes)), \
+                self.captureOnCommitCallbacks(execute=True):
+            analyze_cad_file(self.design.id)
+        self.design.refresh_from_db()
+        two_phase = self.design.geometric_data
+        self.assertEqual(two_phase.pop("enrichment"), {"status": "complete"})
+        two_phase.pop("kernel_timings_ms") # Wall-clock times differ between runs
+
+        Design.objects.filter(id=self.design.id).update(status=DesignStatus.PENDING_ANALYSIS, geometric_data=None)
+        AnalysisCacheEntry.objects.all().delete()
+        with override_settings(CAD_ANALYSIS_DEFER_ENRICHMENT=False), \
+                patch('designs.s3_io.boto3.client', return_value=self._mock_s3_get_object(self.binary_bytes)):
+            analyze_cad_file(self.design.id)
+        self.design.refresh_from_db()
+        self.design.geometric_data.pop("kernel_timings_ms")
+        self.assertEqual(self.design.geometric_data, two_phase)
+
+
+# --- Sharded STL analysis (chord) ---
+@override_settings(CAD_ANALYSIS_SHARD_MIN_TRIANGLES=1, CAD_ANALYSIS_SHARD_TRIANGLES=5)
+class ShardedStlAnalysisTests(StlObjectFixtureMixin, APITestCase):
+    def test_shards_merge_to_single_pass_result(self):
+        from .tasks import kernels_for_material, perform_stl_analysis
+        with tempfile.NamedTemporaryFile(suffix=".stl") as tmp_file:
+            tmp_file.write(self.binary_bytes)
+            tmp_file.flush()
+            single_pass = perform_stl_analysis(tmp_file.name, kernels=kernels_for_material(self.design.material))
+
+        from .tasks import perform_stl_shard_analysis
+        mock_s3_instance = self._mock_s3_get_object(self.binary_bytes)
+        # Shards are parsed through the job executor; run in-process here so the mock sees their ranged GETs.
+        with patch('designs.s3_io.boto3.client', return_value=mock_s3_instance), \
+                patch('designs.tasks.run_analysis_job', side_effect=lambda function, *args: function(*args)) as mock_run_job:
+            result_message = analyze_cad_file(self.design.id)
+
+        self.assertIn("split into 3 shards", result_message)
+        self.assertEqual([c.args[0] for c in mock_run_job.call_args_list], [perform_stl_shard_analysis] * 3)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+        # Timings are summed over the shards, so only their keys match.
+        self.assertEqual(
+            {group: list(timings) for group, timings in self.design.geometric_data.pop("kernel_timings_ms").items()},
+            {group: list(timings) for group, timings in single_pass.pop("kernel_timings_ms").items()},
+        )
+        # The whole-mesh stages (topology, wall thickness) need one worker, so only the single pass has them.
+        single_pass.pop("topology")
+        single_pass.pop("volume_reliable")
+        single_pass.pop("wall_thickness")
+        single_pass.pop("support")
+        single_pass.pop("cnc_access")
+        single_pass.pop("layer_profile")
+        self.assertEqual(self.design.geometric_data, single_pass)
+        self.assertIsNone(self.design.analysis_lease_token)
+        shard_ranges = [c.kwargs["Range"] for c in mock_s3_instance.get_object.call_args_list][1:] # After the header peek
+        self.assertEqual(shard_ranges, ["bytes=84-333", "bytes=334-583", "bytes=584-683"])
+
+    def test_corrupt_shard_fails_design(self):
+        mock_s3_instance = self._mock_s3_get_object(self.binary_bytes)
+        whole_object = mock_s3_instance.get_object.side_effect
+        def short_last_shard(**kwargs):
+            response = whole_object(**kwargs)
+            if kwargs.get("Range") == "bytes=584-683":
+                response["Body"] = io.BytesIO(response["Body"].read()[:-10])
+            return response
+        mock_s3_instance.get_object.side_effect = short_last_shard
+
+        with patch('designs.s3_io.boto3.client', return_value=mock_s3_instance):
+            analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_FAILED)
+        self.assertIn("Invalid or corrupt STL file", self.design.geometric_data["error"])
+
+    def test_killed_shard_job_fails_design(self):
+        from .analysis_executor import AnalysisJobTimeout
+        with patch('designs.s3_io.boto3.client', return_value=self._mock_s3_get_object(self.binary_bytes)), \
+                patch('designs.tasks.run_analysis_job', side_effect=AnalysisJobTimeout("Analysis exceeded the 600s time limit and was terminated.")):
+            analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_FAILED)
+        self.assertIn("Analysis aborted: Analysis exceeded the 600s time limit", self.design.geometric_data["error"])
+
+
+# --- Streaming STEP reader ---
+SAMPLE_STEP_BLOCK_FILE_PATH = SAMPLE_STL_DIR / "block_20x10x5mm.step"
+SAMPLE_STEP_ASSEMBLY_FILE_PATH = SAMPLE_STL_DIR / "frame_assembly_mm.step"
+
+@skipIf(not STEP_READER_AVAILABLE, "numpy not installed")
+class StepReaderTests(SimpleTestCase):
+    def test_bbox_units_and_counts(self):
+        from .step_reader import summarize_step_file
+        metrics, throughput = summarize_step_file(str(SAMPLE_STEP_BLOCK_FILE_PATH))
+        self.assertEqual(metrics["min_mm"], [0.0, 0.0, 0.0])
+        self.assertEqual(metrics["max_mm"], [20.0, 10.0, 5.0]) # The 2D point is ignored
+        self.assertEqual(metrics["length_unit"], "millimetre")
+        self.assertEqual(metrics["entity_counts"]["CARTESIAN_POINT"], 9)
+        self.assertEqual(metrics["entity_counts"]["ADVANCED_FACE"], 2)
+        self.assertEqual(metrics["placements"], 0)
+        self.assertEqual(throughput["bytes"], SAMPLE_STEP_BLOCK_FILE_PATH.stat().st_size)
+
+    def test_tiny_blocks_split_strings_and_comments(self):
+        # Statements, quoted ';' and comments straddling block boundaries parse the same.
+        from .step_reader import iter_p21_entities
+        with open(SAMPLE_STEP_BLOCK_FILE_PATH, 'rb') as f:
+            whole = list(iter_p21_entities(f))
+        with open(SAMPLE_STEP_BLOCK_FILE_PATH, 'rb') as f:
+            chunked = list(iter_p21_entities(f, block_bytes=7))
+        self.assertEqual(whole, chunked)
+        self.assertIn((2, [("PRODUCT", "'block','Block; 20x10x5','',(#3)")]), whole)
+
+    def test_inch_units_are_converted(self):
+        from .step_reader import summarize_step_file
+        content = SAMPLE_STEP_BLOCK_FILE_PATH.read_text().replace(
+            "( LENGTH_UNIT() NAMED_UNIT(*) SI_UNIT(.MILLI.,.METRE.) )",
+            "( CONVERSION_BASED_UNIT('INCH',#13) LENGTH_UNIT() NAMED_UNIT(#14) )"
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.step') as tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            metrics, _ = summarize_step_file(tmp_file.name)
+        self.assertEqual(metrics["length_unit"], "inch")
+        self.assertAlmostEqual(metrics["max_mm"][0], 20.0 * 25.4)
+
+    def test_assembly_instances_multiply_down_the_tree(self):
+        # Frame: 2 x bracket and 1 x bolt kit; bolt kit: 4 x M6 bolt.
+        from .step_reader import StepAssemblyStructure, summarize_step_file
+        structure = StepAssemblyStructure()
+        metrics, _ = summarize_step_file(str(SAMPLE_STEP_ASSEMBLY_FILE_PATH), consumers=[structure])
+        self.assertEqual(metrics["placements"], 2) # One transformed relationship and its transformation
+        result = structure.result()
+        parts = {part["product_id"]: part for part in result["parts"]}
+        self.assertEqual(result["num_occurrences"], 7)
+        self.assertEqual({key: part["instances"] for key, part in parts.items()},
+                         {"ASM-001": 1, "BRK-100": 2, "SUB-200": 1, "BLT-M6": 4})
+        # Faces come from each part's own B-rep, not from the transformed placement link.
+        self.assertEqual({key: part["num_faces"] for key, part in parts.items()},
+                         {"ASM-001": 0, "BRK-100": 6, "SUB-200": 0, "BLT-M6": 3})
+        self.assertEqual(parts["BRK-100"]["name"], "Bracket, 3mm 'L'")
+        self.assertTrue(parts["SUB-200"]["is_assembly"])
+
+    def test_placements_are_composed_into_a_conservative_bbox(self):
+        # The left bracket is placed at (40, 25, 10); every local point placed there is added to the bbox.
+        import numpy
+        from .step_reader import summarize_step_file
+        metrics, _ = summarize_step_file(str(SAMPLE_STEP_ASSEMBLY_FILE_PATH))
+        self.assertEqual(metrics["max_mm"], [40.0, 25.0, 10.0])
+        self.assertEqual(metrics["placed_min_mm"], [0.0, 0.0, 0.0])
+        self.assertEqual(metrics["placed_max_mm"], [80.0, 50.0, 20.0])
+
+        # Turned a quarter turn about z: x is taken along (0, 1, 0), so local x runs along y.
+        content = SAMPLE_STEP_ASSEMBLY_FILE_PATH.read_text().replace(
+            "#91 = AXIS2_PLACEMENT_3D('',#98,#96,#97);",
+            "#91 = AXIS2_PLACEMENT_3D('',#98,#96,#99);\n#99 = DIRECTION('',(0.,1.,0.));"
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.step') as tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            metrics, _ = summarize_step_file(tmp_file.name)
+        numpy.testing.assert_allclose(metrics["placed_min_mm"], [0.0, 0.0, 0.0], atol=1e-9)
+        numpy.testing.assert_allclose(metrics["placed_max_mm"], [40.0, 65.0, 20.0], atol=1e-9)
+
+    def test_unresolvable_placements_leave_no_placed_bbox(self):
+        from .step_reader import summarize_step_file
+        content = SAMPLE_STEP_ASSEMBLY_FILE_PATH.read_text().replace(
+            "ITEM_DEFINED_TRANSFORMATION('','',#90,#91)", "ITEM_DEFINED_TRANSFORMATION('','',#90,#97)"
+        ) # Points at a DIRECTION instead of an axis placement
+        with tempfile.NamedTemporaryFile('w', suffix='.step') as tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            metrics, _ = summarize_step_file(tmp_file.name)
+        self.assertEqual(metrics["placements"], 2)
+        self.assertIsNone(metrics["placed_min_mm"])
+        self.assertIsNone(metrics["placed_max_mm"])
+
+    def test_cyclic_assembly_is_rejected(self):
+        from .step_reader import StepAssemblyStructure, iter_p21_entities
+        content = SAMPLE_STEP_ASSEMBLY_FILE_PATH.read_text().replace(
+            "NEXT_ASSEMBLY_USAGE_OCCURRENCE('7','Bolt 4','',#32,#42,$)",
+            "NEXT_ASSEMBLY_USAGE_OCCURRENCE('7','Loop','',#42,#12,$)"
+        )
+        structure = StepAssemblyStructure()
+        for entity_id, parts in iter_p21_entities(io.BytesIO(content.encode('latin-1'))):
+            structure.add(entity_id, parts)
+        with self.assertRaises(ValueError):
+            structure.result()
+
+    def test_files_without_geometry_are_rejected(self):
+        from .step_reader import summarize_step_file
+        for path in (SAMPLE_BAD_STEP_FILE_PATH, SAMPLE_STEP_FILE_PATH):
+            with self.assertRaises(ValueError):
+                summarize_step_file(str(path))
+
+
+@skipIf(not STEP_READER_AVAILABLE, "numpy not installed")
+@override_settings(CAD_ANALYSIS_STREAM_FROM_S3=False)
+class StepAnalysisTaskTests(APITestCase):
+    def setUp(self):
+        reset_s3_client()
+        self.addCleanup(reset_s3_client)
+        self.customer_user = User.objects.create_user(
+            email="stepuser@example.com", password="Password123!",
+            company_name="STEP Test Corp", role=UserRole.CUSTOMER
+        )
+        self.design = Design.objects.create(
+            customer=self.customer_user, design_name="STEP Block",
+            s3_file_key=f"uploads/designs/{self.customer_user.id}/block.step",
+            material="Aluminum", quantity=1, status=DesignStatus.PENDING_ANALYSIS
+        )
+
+    @patch('designs.s3_io.boto3.client')
+    def test_step_design_reaches_analysis_complete(self, mock_boto_client_constructor):
+        mock_s3_instance = MagicMock()
+        mock_s3_instance.download_file.side_effect = lambda Bucket, Key, TargetFilePath: shutil.copy(
+            SAMPLE_STEP_BLOCK_FILE_PATH, TargetFilePath
+        )
+        mock_boto_client_constructor.return_value = mock_s3_instance
+
+        analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+        self.assertEqual(self.design.geometric_data["bbox_mm"], [20.0, 10.0, 5.0])
+        self.assertEqual(self.design.geometric_data["num_faces"], 2)
+        self.assertTrue(self.design.geometric_data["analysis_engine"].startswith("gmqp-step-p21"))
+        self.assertTrue(self.design.geometric_data["bbox_reliable"])
+        self.assertNotIn("assembly", self.design.geometric_data)
+
+    @patch('designs.s3_io.boto3.client')
+    def test_step_assembly_stores_part_list(self, mock_boto_client_constructor):
+        mock_s3_instance = MagicMock()
+        mock_s3_instance.download_file.side_effect = lambda Bucket, Key, TargetFilePath: shutil.copy(
+            SAMPLE_STEP_ASSEMBLY_FILE_PATH, TargetFilePath
+        )
+        mock_boto_client_constructor.return_value = mock_s3_instance
+
+        analyze_cad_file(self.design.id)
+
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, DesignStatus.ANALYSIS_COMPLETE)
+        # The bracket's placement is composed into a conservative bbox of the assembled frame.
+        self.assertTrue(self.design.geometric_data["bbox_reliable"])
+        self.assertTrue(self.design.geometric_data["bbox_conservative"])
+        self.assertEqual(self.design.geometric_data["bbox_mm"], [80.0, 50.0, 20.0])
+        assembly = self.design.geometric_data["assembly"]
+        self.assertEqual(assembly["num_unique_parts"], 2)
+        self.assertEqual(assembly["num_part_instances"], 6)
+        self.assertEqual(assembly["num_subassemblies"], 2)
+        self.assertEqual(assembly["total_faces"], 2 * 6 + 4 * 3)
+        self.assertEqual(
+            [(part["product_id"], part["instances"]) for part in assembly["parts"]], [("BLT-M6", 4), ("BRK-100", 2)]
+        )
+
+
+# --- Fixed-format IGES reader ---
+SAMPLE_IGES_PATCH_FILE_PATH = SAMPLE_STL_DIR / "patch_assembly_mm.igs"
+
+@skipIf(not IGES_READER_AVAILABLE, "numpy not installed")
+class IgesReaderTests(SimpleTestCase):
+    def test_bbox_applies_transforms_and_skips_parameter_space_curves(self):
+        # A 10 mm patch translated +100 mm in X, a point, a line, and a parameter-space (use flag 05) curve at 900+.
+        from .iges_reader import summarize_iges_file
+        metrics, throughput = summarize_iges_file(str(SAMPLE_IGES_PATCH_FILE_PATH))
+        self.assertEqual(metrics["min_mm"], [0.0, 0.0, -5.0])
+        self.assertEqual(metrics["max_mm"], [110.0, 20.0, 1.0])
+        self.assertEqual(metrics["length_unit"], "mm")
+        self.assertEqual(metrics["num_entities"], 6)
+        self.assertEqual(metrics["num_surfaces"], 1)
+        self.assertEqual(metrics["entity_counts"]["128"], 1)
+        self.assertEqual(throughput["bytes"], SAMPLE_IGES_PATCH_FILE_PATH.stat().st_size)
+
+    def test_global_section_units_and_model_scale(self):
+        from .iges_reader import IgesGeometrySummary, parse_global_parameters
+        params = parse_global_parameters("1H,,1H;,4Hpart,8Hpart.igs,1H1,1H1,32,38,6,308,15,4Hpart,2.0,1,4HINCH,1,0.1;")
+        self.assertEqual(params[14], "INCH")
+        summary = IgesGeometrySummary()
+        summary.set_global(params)
+        self.assertEqual((summary.unit_scale_mm, summary.unit_name, summary.model_scale), (25.4, "inch", 2.0))
+
+    def test_non_iges_files_are_rejected(self):
+        from .iges_reader import summarize_iges_file
+        for path in (SAMPLE_IGES_FILE_PATH, SAMPLE_STEP_BLOCK_FILE_PATH):
+            with self.assertRaises(ValueError):
+                summarize_iges_file(str(path))
+
+
+@skipIf(not IGES_READER_AVAILABLE, "numpy not installed")
+@override_settings(CAD_ANALYSIS_STREAM_FROM_S3=False)
+class IgesAnalysisTaskTests(APITestCase):
+    def setUp(self):
+        reset_s3_client()
+        self.addCleanup(reset_s3_client)
+        self.customer_user = User.objects.create_user(
+            email="igesuser@example.com", password="Password123!",
+            company_name="IGES Test Corp", role=UserRole.CUSTOMER
+        )
+
+    def _analyze(self, file_name, fixture_path, mock_boto_client_constructor):
+        design = Design.objects.create(
+            customer=self.customer_user, design_name="IGES Patch",
+            s3_file_key=f"uploads/designs/{self.customer_user.id}/{file_name}",
+            material="Aluminum", quantity=1, status=DesignStatus.PENDING_ANALYSIS
+        )
+        mock_s3_instance = MagicMock()
+        mock_s3_instance.download_file.side_effect = lambda Bucket, Key, TargetFilePath: shutil.copy(
+            fixture_path, TargetFilePath
+        )
+        mock_boto_client_constructor.return_value = mock_s3_instance
+        analyze_cad_file(design.id)
+        design.refresh_from_db()
+        return design
+
+    @patch('designs.s3_io.boto3.client')
+    def test_iges_design_reaches_analysis_complete(self, mock_boto_client_constructor):
+        design = self._analyze("patch.igs", SAMPLE_IGES_PATCH_FILE_PATH, mock_boto_client_constructor)
+        self.assertEqual(design.status, DesignStatus.ANALYSIS_COMPLETE)
+        self.assertEqual(design.geometric_data["bbox_mm"], [110.0, 20.0, 6.0])
+        self.assertEqual(design.geometric_data["num_surfaces"], 1)
+        self.assertTrue(design.geometric_data["analysis_engine"].startswith("gmqp-iges"))
+
+    @patch('designs.s3_io.boto3.client')
+    def test_corrupt_iges_fails_analysis(self, mock_boto_client_constructor):
+        design = self._analyze("dummy.iges", SAMPLE_IGES_FILE_PATH, mock_boto_client_constructor)
+        self.assertEqual(design.status, DesignStatus.ANALYSIS_FAILED)
+        self.assertIn("Invalid or corrupt IGES file", design.geometric_data["error"])
@@ -0,0 +1,74 @@
+"""
+CNC tool access for the six principal 3-axis setups: which parts of the surface a tool coming
+straight down each axis reaches, how many setups (re-fixturings) a part needs and how much of
+its surface no setup reaches (undercuts, which need a 5-axis machine or special tooling).
+
+Facet normals are clustered by the setup direction they face most (the "facing" area per
+setup). Visibility is sampled: points are drawn on the surface by area, and each (point, setup)
+pair whose facet faces the setup's direction, or stands parallel to it (walls cut with the side
+of the tool), casts one ray out along that direction. The ray starts the tool radius off the
+surface along the normal, where the centre of a ball-end tool touching the point sits, so it
+runs along the tool's axis: the pair is visible when the ray escapes, and slots narrower than
+the tool stay out of reach. All pairs go through the part's BVH (see wall_thickness) as one
+batch. Points on the walls of sealed cavities cast no rays: no tool gets inside, and such a
+void is made by joining parts or printing, not 3-axis undercut work, so it is left out of
+the undercuts. The fewest setups that together reach every reachable sample are then found by testing
+all 63 subsets of the six setups at once, as a (samples, subsets) product.
+"""
+import numpy
+
+from .wall_thickness import TriangleBVH, outward_normals, sample_surface
+
+SETUP_DIRECTIONS = numpy.array(
+    [[0.0, 0.0, 1.0], [0.0, 0.0, -1.0], [1.0, 0.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, -1.0, 0.0]]
+)
+SETUP_LABELS = ("+z", "-z", "+x", "-x", "+y", "-y")
+# Facets with normal . direction above -FACING_TOLERANCE face a setup (0 is a wall parallel to the tool).
+FACING_TOLERANCE = 1e-6
+# Every subset of the six setups as a (subsets, setups) 0/1 matrix, fewest setups first.
+_SETUP_SUBSETS = numpy.array(
+    sorted(([(mask >> bit) & 1 for bit in range(len(SETUP_LABELS))] for mask in range(1, 1 << len(SETUP_LABELS))), key=sum),
+    dtype=numpy.int64,
+)
+
+
+def facing_areas(normals, areas):
+    """Area of the facets whose normal is closest to each setup direction, shape (6,)."""
+    clusters = (normals @ SETUP_DIRECTIONS.T).argmax(axis=1)
+    return numpy.bincount(clusters, weights=areas, minlength=len(SETUP_DIRECTIONS))
+
+
+def setup_visibility(triangles, outward_sign, num_samples, tool_radius, bvh=None, enclosed=None):
+    """
+    Samples num_samples surface points of a closed mesh (see wall_thickness.outward_normals for
+    outward_sign) and returns (visible, total_area, facing, sealed): visible is a (samples, 6)
+    boolean array of which setups reach each point with a ball-end tool of radius tool_radius,
+    facing the per-setup area from facing_areas and sealed which samples lie on facets flagged
+    in enclosed (the walls of sealed cavities, one boolean per facet). Sealed samples cast no
+    rays and their facets are left out of facing.
+    """
+    triangles = numpy.asarray(triangles, dtype=numpy.float64)
+    normals, areas = outward_normals(triangles, outward_sign)
+    enclosed = numpy.zeros(len(triangles), dtype=bool) if enclosed is None else numpy.asarray(enclosed, dtype=bool)
+    points, facets = sample_surface(triangles, num_samples)
+    sealed = enclosed[facets]
+    facing_setups = (normals[facets] @ SETUP_DIRECTIONS.T > -FACING_TOLERANCE) & ~sealed[:, None]
+    samples, setups = numpy.nonzero(facing_setups)
+    visible = numpy.zeros((num_samples, len(SETUP_DIRECTIONS)), dtype=bool)
+    if len(samples):
+        origins = points[samples] + tool_radius * normals[facets[samples]] # On the tool's axis
+        bvh = bvh or TriangleBVH(triangles)
+        t, _ = bvh.first_hits(origins, SETUP_DIRECTIONS[setups], 0.0, ignore=facets[samples])
+        escaped = numpy.isinf(t)
+        visible[samples[escaped], setups[escaped]] = True
+    return visible, float(areas.sum()), facing_areas(normals[~enclosed], areas[~enclosed]), sealed
+
+
+def minimum_setups(visible):
+    """Indices of the fewest setups that together reach every sample any setup reaches."""
+    reachable = visible.any(axis=1)
+    if not reachable.any():
+        return []
+    covered = (visible[reachable].astype(numpy.int64) @ _SETUP_SUBSETS.T) > 0 # (samples, subsets)
+    best = int(numpy.argmax(covered.all(axis=0))) # First full cover: subsets are sorted by size
+    return [int(setup) for setup in numpy.flatnonzero(_SETUP_SUBSETS[best])]
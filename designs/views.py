@@ -1,12 +1,12 @@
 import logging
 import uuid
-import boto3 # Ensure boto3 is installed
 from botocore.exceptions import ClientError
 from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from .s3_io import get_s3_client
 # from accounts.models import UserRole # If needed for role checks, though IsAuthenticated is primary here
 
 logger = logging.getLogger(__name__)
@@ -65,14 +65,7 @@ class DesignUploadURLView(APIView):
 
 
         try:
-            s3_client = boto3.client(
-                's3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME,
-                endpoint_url=settings.AWS_S3_ENDPOINT_URL, # Important for LocalStack/MinIO
-                config=boto3.session.Config(signature_version=settings.AWS_S3_SIGNATURE_VERSION)
-            )
+            s3_client = get_s3_client() # Shared per-process client; see designs.s3_io
 
             presigned_url = s3_client.generate_presigned_url(
                 ClientMethod='put_object',
@@ -228,6 +221,14 @@ class GenerateQuotesView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # A STEP assembly whose placements could not be composed is measured part by part in local
+        # frames, so its bbox_mm says nothing about the assembled size; size matching cannot be trusted.
+        if design.geometric_data.get('bbox_reliable') is False:
+            return Response(
+                {"error": "The design's overall size could not be determined from its file (a STEP assembly whose part placements could not be resolved). Automated quotes are not available for it."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         # TODO: Implement manufacturer filtering based on capabilities matching design requirements
         # For now, iterate over ALL manufacturers.
         # In a real system, you'd filter manufacturers who can handle the design.material, design.size (from bbox), etc.
@@ -237,7 +238,24 @@ class GenerateQuotesView(APIView):
         eligible_manufacturers = []
         all_manufacturers = Manufacturer.objects.select_related('user').all()
 
-        design_bbox_sorted = sorted(design.geometric_data.get('bbox_mm', [0,0,0]))
+        # The design fits if either of its boxes does: the oriented bounding box (a part lying
+        # diagonally in its file's axes fits envelopes its axis-aligned bbox does not) or the
+        # axis-aligned bbox (which can fit where a long diagonal OBB does not). Older analyses
+        # only have bbox_mm. A multi-body STL is made body by body, so it has the same two
+        # envelopes over its bodies instead.
+        design_bodies = design.geometric_data.get('bodies') or {}
+        if design_bodies.get('fit_envelope_mm'):
+            design_boxes = [design_bodies['fit_envelope_mm'], design_bodies.get('bbox_envelope_mm')]
+        else:
+            design_boxes = [design.geometric_data.get('obb_mm'), design.geometric_data.get('bbox_mm', [0,0,0])]
+        design_boxes_sorted = [sorted(box) for box in design_boxes if box]
+
+        # Two-phase STL analysis marks a design complete before its enrichment phase has added the
+        # per-body envelopes ('bodies') and the 5-axis flag ('cnc_access'). Until then the filters
+        # stay conservative: the whole-design boxes above bound every body, and the part is assumed
+        # to need 5 axes. Quoting again once enrichment is complete adds the manufacturers skipped now.
+        enrichment_pending = (design.geometric_data.get('enrichment') or {}).get('status') == 'pending'
+        design_needs_5_axis = enrichment_pending or bool((design.geometric_data.get('cnc_access') or {}).get('needs_5_axis'))
 
         for mf_profile in all_manufacturers:
             capabilities = mf_profile.capabilities or {}
@@ -267,11 +285,11 @@ class GenerateQuotesView(APIView):
             #     logger.info(f"Mf {mf_profile.user.email} skipped: design bbox {design_bbox_sorted} does not fit max_size {mf_max_size_sorted} (sorted comparison).")
             #     continue
 
-            # Advanced Size Check: Check all 6 permutations of design bbox
+            # Advanced Size Check: Check all 6 permutations of each design box
             from itertools import permutations
             design_fits_size = False
-            if len(design_bbox_sorted) == 3: # Ensure bbox has 3 dimensions
-                for p_design_bbox in permutations(design_bbox_sorted):
+            if design_boxes_sorted and all(len(box) == 3 for box in design_boxes_sorted): # Ensure boxes have 3 dimensions
+                for p_design_bbox in (p for box in design_boxes_sorted for p in permutations(box)):
                     if (p_design_bbox[0] <= mf_max_size_sorted[0] and
                         p_design_bbox[1] <= mf_max_size_sorted[1] and
                         p_design_bbox[2] <= mf_max_size_sorted[2]):
@@ -307,6 +325,13 @@ class GenerateQuotesView(APIView):
                  continue
             # If "cnc" is true or missing, they pass this filter. (This is just an example filter behavior)
 
+            # 4. Machine Axes: parts with undercuts no 3-axis setup reaches (cnc_access from analysis)
+            # need a 5-axis machine. Manufacturers that do not state cnc_axes are not filtered.
+            cnc_axes = capabilities.get("cnc_axes")
+            if design_needs_5_axis and isinstance(cnc_axes, int) and cnc_axes < 5:
+                logger.info(f"Mf {mf_profile.user.email} skipped: design needs 5-axis machining, manufacturer has {cnc_axes} axes.")
+                continue
+
 
             eligible_manufacturers.append(mf_profile)
 
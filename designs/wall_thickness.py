@@ -0,0 +1,183 @@
+"""
+Wall-thickness estimation by ray casting against a bounding-volume hierarchy (BVH).
+
+Points are sampled on the surface (area-weighted, with a fixed seed so the same file always
+gives the same result) and a ray is cast from each one straight into the material, against
+the facet normal. The distance to the first facet it hits is the wall thickness there; thin
+walls show up as the minimum and the low percentiles.
+
+The BVH lives in flat NumPy arrays: an implicit complete binary tree (the children of node i
+are 2i and 2i + 1 on the next level) whose leaves hold LEAF_TRIANGLES consecutive facets. It is
+built top-down, all nodes of a level at once: each node's facets are split at the median
+centroid along the node's longest axis with one argpartition over the reshaped level, so a
+level costs O(n). (A Morton-order build is cheaper still, but on thin shells its leaves often
+straddle two faces and a ray crosses thousands of them.) Queries walk the
+tree level by level for a whole batch of rays at once: every (ray, node) pair is slab-tested
+together, survivors are expanded into their two children, and at the leaves the remaining
+pairs are tested against their facets with a vectorized Moller-Trumbore.
+"""
+import numpy
+
+LEAF_TRIANGLES = 8
+# Rays traversed together; bounds the (ray, node) pair arrays of one batch.
+RAY_BATCH = 2048
+# Ray origins are nudged this far (relative to the mesh's bbox diagonal) into the material.
+RELATIVE_RAY_OFFSET = 1e-7
+SAMPLING_SEED = 0
+
+
+class TriangleBVH:
+    """
+    BVH over an (n, 3, 3) triangle array. levels[k] is the (mins, maxs) pair of the 2^k boxes
+    on level k, root first; the last level holds the leaves.
+    """
+
+    def __init__(self, triangles):
+        triangles = numpy.asarray(triangles, dtype=numpy.float64)
+        if not len(triangles):
+            raise ValueError("Cannot build a BVH over an empty triangle set.")
+        num_leaves = -(-len(triangles) // LEAF_TRIANGLES)
+        depth = int(num_leaves - 1).bit_length()
+        padded = (1 << depth) * LEAF_TRIANGLES
+        # Padding slots repeat the last facet: the same hit twice changes nothing.
+        order = numpy.minimum(numpy.arange(padded), len(triangles) - 1)
+        # One contiguous row per axis, so the per-node reductions run over contiguous memory.
+        centroids = triangles.mean(axis=1)[order].T.copy()
+        for level in range(depth):
+            segments, size = 1 << level, padded >> level
+            node_centroids = centroids.reshape(3, segments, size)
+            axes = (node_centroids.max(axis=2) - node_centroids.min(axis=2)).argmax(axis=0)
+            keys = node_centroids[axes, numpy.arange(segments)]
+            halves = numpy.argpartition(keys, size // 2, axis=1) # Lower half first
+            moved = (halves + (numpy.arange(segments) * size)[:, None]).ravel()
+            order, centroids = order[moved], centroids.take(moved, axis=1)
+
+        self.triangle_ids = order # Position in the BVH -> index in the input
+        triangles = triangles[order]
+        self.v0 = triangles[:, 0]
+        self.edge1 = triangles[:, 1] - self.v0
+        self.edge2 = triangles[:, 2] - self.v0
+
+        leaf_corners = triangles.reshape(-1, LEAF_TRIANGLES * 3, 3)
+        mins, maxs = leaf_corners.min(axis=1), leaf_corners.max(axis=1)
+        self.levels = [(mins, maxs)]
+        while len(mins) > 1:
+            mins = numpy.minimum(mins[0::2], mins[1::2])
+            maxs = numpy.maximum(maxs[0::2], maxs[1::2])
+            self.levels.append((mins, maxs))
+        self.levels.reverse() # Root first
+
+    def first_hits(self, origins, directions, t_min, ignore=None):
+        """
+        Casts rays (origins and directions, (r, 3)) and returns (t, triangle) for the nearest hit
+        with t > t_min of each ray; t is inf and triangle -1 for rays that hit nothing. ignore
+        optionally gives one input triangle index per ray that the ray may not hit (its own facet).
+        """
+        t_best = numpy.full(len(origins), numpy.inf)
+        hit_ids = numpy.full(len(origins), -1, dtype=numpy.int64)
+        for start in range(0, len(origins), RAY_BATCH):
+            batch = slice(start, start + RAY_BATCH)
+            t_best[batch], hit_ids[batch] = self._first_hits_batch(
+                origins[batch], directions[batch], t_min, None if ignore is None else ignore[batch]
+            )
+        return t_best, hit_ids
+
+    def _first_hits_batch(self, origins, directions, t_min, ignore):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1.0 / directions
+        rays = numpy.arange(len(origins))
+        nodes = numpy.zeros(len(origins), dtype=numpy.int64)
+        for level, (mins, maxs) in enumerate(self.levels):
+            if level:
+                rays = numpy.repeat(rays, 2)
+                nodes = (numpy.repeat(nodes, 2) * 2) + numpy.tile([0, 1], len(nodes))
+            # Slab test; nan (0 * inf for rays parallel to a slab on its plane) counts as a miss.
+            with numpy.errstate(invalid='ignore'):
+                near = (mins[nodes] - origins[rays]) * inverse[rays]
+                far = (maxs[nodes] - origins[rays]) * inverse[rays]
+                t_enter = numpy.minimum(near, far).max(axis=1)
+                t_exit = numpy.maximum(near, far).min(axis=1)
+                crossing = (t_exit >= numpy.maximum(t_enter, t_min))
+            rays, nodes = rays[crossing], nodes[crossing]
+
+        # Each surviving (ray, leaf) pair against the leaf's facets.
+        rays = numpy.repeat(rays, LEAF_TRIANGLES)
+        triangles = (numpy.repeat(nodes, LEAF_TRIANGLES) * LEAF_TRIANGLES) + numpy.tile(numpy.arange(LEAF_TRIANGLES), len(nodes))
+        t = self._intersect(origins[rays], directions[rays], triangles)
+        hit = t > t_min
+        if ignore is not None:
+            hit &= self.triangle_ids[triangles] != ignore[rays]
+        rays, triangles, t = rays[hit], triangles[hit], t[hit]
+
+        t_best = numpy.full(len(origins), numpy.inf)
+        hit_ids = numpy.full(len(origins), -1, dtype=numpy.int64)
+        nearest = numpy.lexsort((t, rays)) # By ray, nearest first
+        first = nearest[numpy.concatenate([[True], rays[nearest][1:] != rays[nearest][:-1]])] if len(nearest) else nearest
+        t_best[rays[first]] = t[first]
+        hit_ids[rays[first]] = self.triangle_ids[triangles[first]]
+        return t_best, hit_ids
+
+    def _intersect(self, origins, directions, triangles):
+        """Moller-Trumbore distances along each ray to its paired facet (nan/inf-free; -1 for a miss)."""
+        edge1, edge2 = self.edge1[triangles], self.edge2[triangles]
+        p = numpy.cross(directions, edge2)
+        determinant = numpy.einsum('ij,ij->i', edge1, p)
+        usable = numpy.abs(determinant) > 1e-300
+        inverse = numpy.divide(1.0, determinant, out=numpy.zeros_like(determinant), where=usable)
+        s = origins - self.v0[triangles]
+        u = numpy.einsum('ij,ij->i', s, p) * inverse
+        q = numpy.cross(s, edge1)
+        v = numpy.einsum('ij,ij->i', directions, q) * inverse
+        t = numpy.einsum('ij,ij->i', edge2, q) * inverse
+        inside = usable & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0)
+        return numpy.where(inside, t, -1.0)
+
+
+def sample_surface(triangles, count, seed=SAMPLING_SEED):
+    """Returns (points (count, 3), facet index per point), area-weighted and uniform within each facet."""
+    cross = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    areas = numpy.sqrt(numpy.einsum('ij,ij->i', cross, cross))
+    rng = numpy.random.default_rng(seed)
+    facets = numpy.searchsorted(numpy.cumsum(areas), rng.random(count) * areas.sum(), side='right')
+    facets = numpy.minimum(facets, len(triangles) - 1)
+    u, v = rng.random(count), rng.random(count)
+    flip = u + v > 1.0 # Fold the unit square onto the triangle
+    u[flip], v[flip] = 1.0 - u[flip], 1.0 - v[flip]
+    chosen = triangles[facets]
+    points = chosen[:, 0] + u[:, None] * (chosen[:, 1] - chosen[:, 0]) + v[:, None] * (chosen[:, 2] - chosen[:, 0])
+    return points, facets
+
+
+def outward_normals(triangles, outward_sign):
+    """
+    Returns (unit outward normals (n, 3), areas (n,)) of an (n, 3, 3) triangle array. outward_sign
+    is +1 per facet when its winding gives an outward normal, -1 when the facet's body is inside
+    out. Degenerate facets get a zero normal.
+    """
+    cross = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = numpy.sqrt(numpy.einsum('ij,ij->i', cross, cross))
+    normals = numpy.divide(cross, lengths[:, None], out=numpy.zeros_like(cross), where=lengths[:, None] > 0)
+    normals *= numpy.asarray(outward_sign, dtype=numpy.float64).reshape(-1, 1)
+    return normals, lengths / 2.0
+
+
+def mesh_diagonal(triangles):
+    """Bounding-box diagonal of an (n, 3, 3) triangle array (never 0, so it can scale tolerances)."""
+    corners = triangles.reshape(-1, 3)
+    return max(float(numpy.linalg.norm(corners.max(axis=0) - corners.min(axis=0))), 1e-12)
+
+
+def measure_wall_thickness(triangles, outward_sign, num_samples, bvh=None):
+    """
+    Estimates wall thickness of a closed mesh from num_samples inward rays (see outward_normals
+    for outward_sign; bvh may be passed in if the caller already built one for triangles).
+    Returns the array of thicknesses of rays that hit (rays escaping through holes are dropped).
+    """
+    triangles = numpy.asarray(triangles, dtype=numpy.float64)
+    normals, _ = outward_normals(triangles, outward_sign)
+    points, facets = sample_surface(triangles, num_samples)
+    offset = mesh_diagonal(triangles) * RELATIVE_RAY_OFFSET
+    directions = -normals[facets]
+    bvh = bvh or TriangleBVH(triangles)
+    t, _ = bvh.first_hits(points + offset * directions, directions, offset, ignore=facets)
+    return t[numpy.isfinite(t)] + offset
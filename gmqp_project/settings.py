@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -236,3 +237,81 @@ import sys
 if 'test' in sys.argv or 'pytest' in sys.argv:
     CELERY_TASK_ALWAYS_EAGER = True
     CELERY_TASK_EAGER_PROPAGATES = True # Makes task exceptions reraise
+
+# CAD analysis tuning
+# Binary STL files are streamed through a memory map in chunks of this many triangles
+# (50 bytes each), which bounds worker memory independently of the upload size.
+CAD_ANALYSIS_STL_CHUNK_TRIANGLES = int(os.environ.get('CAD_ANALYSIS_STL_CHUNK_TRIANGLES', 262144))
+# How long an analysis worker's claim on a design (status 'analyzing') is honoured before
+# another worker may reclaim it. Should exceed the longest expected download + analysis time.
+CAD_ANALYSIS_LEASE_SECONDS = int(os.environ.get('CAD_ANALYSIS_LEASE_SECONDS', 30 * 60))
+# How often celery beat runs designs.tasks.requeue_stale_analyses, which re-dispatches designs
+# whose lease expired (e.g. the worker was killed). Run beat alongside the workers: celery -A gmqp_project beat
+CAD_ANALYSIS_REQUEUE_INTERVAL_SECONDS = int(os.environ.get('CAD_ANALYSIS_REQUEUE_INTERVAL_SECONDS', 5 * 60))
+CELERY_BEAT_SCHEDULE = {
+    'requeue-stale-analyses': {
+        'task': 'designs.tasks.requeue_stale_analyses',
+        'schedule': CAD_ANALYSIS_REQUEUE_INTERVAL_SECONDS,
+    },
+}
+# Content-addressed analysis cache retention (see designs.analysis_cache).
+CAD_ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('CAD_ANALYSIS_CACHE_MAX_ENTRIES', 10000))
+CAD_ANALYSIS_CACHE_MAX_AGE_DAYS = int(os.environ.get('CAD_ANALYSIS_CACHE_MAX_AGE_DAYS', 90))
+# Each CAD parse runs in a child process with a wall-clock timeout and an address-space
+# limit (see designs.analysis_executor). POOL_SIZE bounds concurrent job processes per worker.
+CAD_ANALYSIS_ISOLATE_JOBS = os.environ.get('CAD_ANALYSIS_ISOLATE_JOBS', 'true').lower() == 'true'
+CAD_ANALYSIS_POOL_SIZE = int(os.environ.get('CAD_ANALYSIS_POOL_SIZE', 2))
+CAD_ANALYSIS_JOB_TIMEOUT_SECONDS = int(os.environ.get('CAD_ANALYSIS_JOB_TIMEOUT_SECONDS', 600))
+CAD_ANALYSIS_JOB_MEMORY_LIMIT_MB = int(os.environ.get('CAD_ANALYSIS_JOB_MEMORY_LIMIT_MB', 4096))
+# Read STL objects straight from the S3 get_object stream instead of downloading them to a
+# temp file first. Parsers that need random access (STEP, ASCII STL) still use a temp file.
+CAD_ANALYSIS_STREAM_FROM_S3 = os.environ.get('CAD_ANALYSIS_STREAM_FROM_S3', 'true').lower() == 'true'
+# Shared S3 client (designs.s3_io.get_s3_client): HTTP connection pool size and TCP keep-alive.
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_S3_MAX_POOL_CONNECTIONS', 50))
+AWS_S3_TCP_KEEPALIVE = os.environ.get('AWS_S3_TCP_KEEPALIVE', 'true').lower() == 'true'
+# Objects at least this large are downloaded with concurrent HTTP range requests into a
+# preallocated memory-mapped file (designs.s3_io.download_s3_object); smaller ones use one request.
+CAD_ANALYSIS_RANGED_DOWNLOAD_THRESHOLD_MB = int(os.environ.get('CAD_ANALYSIS_RANGED_DOWNLOAD_THRESHOLD_MB', 64))
+CAD_ANALYSIS_RANGED_DOWNLOAD_PART_MB = int(os.environ.get('CAD_ANALYSIS_RANGED_DOWNLOAD_PART_MB', 16))
+CAD_ANALYSIS_RANGED_DOWNLOAD_CONCURRENCY = int(os.environ.get('CAD_ANALYSIS_RANGED_DOWNLOAD_CONCURRENCY', 8))
+# Header-peek triage of STL uploads (designs.tasks.triage_stl_object): meshes above the inline
+# limit are re-dispatched to the heavy queue; above the hard limit they fail immediately.
+CAD_ANALYSIS_STL_INLINE_MAX_TRIANGLES = int(os.environ.get('CAD_ANALYSIS_STL_INLINE_MAX_TRIANGLES', 2_000_000))
+CAD_ANALYSIS_STL_MAX_TRIANGLES = int(os.environ.get('CAD_ANALYSIS_STL_MAX_TRIANGLES', 50_000_000))
+CAD_ANALYSIS_HEAVY_QUEUE = os.environ.get('CAD_ANALYSIS_HEAVY_QUEUE', 'cad_analysis_heavy')
+# Binary STL files with at least this many triangles are analyzed as a Celery chord of
+# range-reading shards of CAD_ANALYSIS_SHARD_TRIANGLES each (0 disables sharding).
+CAD_ANALYSIS_SHARD_MIN_TRIANGLES = int(os.environ.get('CAD_ANALYSIS_SHARD_MIN_TRIANGLES', 5_000_000))
+CAD_ANALYSIS_SHARD_TRIANGLES = int(os.environ.get('CAD_ANALYSIS_SHARD_TRIANGLES', 2_000_000))
+# Meshes up to this many triangles are kept in memory (36 bytes each) for the topology stage
+# (designs.mesh_topology: welding, watertightness, bodies); larger ones get no topology report.
+CAD_ANALYSIS_TOPOLOGY_MAX_TRIANGLES = int(os.environ.get('CAD_ANALYSIS_TOPOLOGY_MAX_TRIANGLES', 5_000_000))
+# Inward rays cast from sampled surface points to estimate wall thickness of closed meshes
+# (designs.wall_thickness); more samples find thin spots more reliably. 0 disables the stage.
+CAD_ANALYSIS_THICKNESS_SAMPLES = int(os.environ.get('CAD_ANALYSIS_THICKNESS_SAMPLES', 4096))
+# Surface points sampled (and shared by all candidate build directions) for the support-volume
+# estimate of closed meshes (designs.overhang); overhang areas are exact. 0 disables the stage.
+CAD_ANALYSIS_SUPPORT_SAMPLES = int(os.environ.get('CAD_ANALYSIS_SUPPORT_SAMPLES', 4096))
+# Surface points checked against the six 3-axis CNC setups for setup count and undercuts of
+# closed meshes (designs.tool_access). 0 disables the stage.
+CAD_ANALYSIS_ACCESS_SAMPLES = int(os.environ.get('CAD_ANALYSIS_ACCESS_SAMPLES', 4096))
+# Radius of the smallest ball-end tool assumed by the CNC access stage, in mm (1.5 = a 3 mm end mill).
+CAD_ANALYSIS_TOOL_RADIUS_MM = float(os.environ.get('CAD_ANALYSIS_TOOL_RADIUS_MM', 1.5))
+# Layer height of the per-layer area/perimeter profile of closed meshes (designs.layer_profile),
+# in mm; raised automatically for very tall parts. 0 disables the stage.
+CAD_ANALYSIS_LAYER_HEIGHT_MM = float(os.environ.get('CAD_ANALYSIS_LAYER_HEIGHT_MM', 0.1))
+# Material -> manufacturing processes (JSON object, lower-case material keys) selecting the
+# process-specific metric kernels run on STL meshes (designs.mesh_kernels). Empty uses
+# mesh_kernels.MATERIAL_PROCESSES; materials not listed run every kernel.
+CAD_ANALYSIS_MATERIAL_PROCESSES = json.loads(os.environ.get('CAD_ANALYSIS_MATERIAL_PROCESSES', '{}'))
+# Two-phase STL analysis: designs become ANALYSIS_COMPLETE (quotable) once the single-pass
+# metrics are in; the whole-mesh stages (topology, wall thickness, support, CNC access, layer
+# profile) then run as designs.tasks.enrich_stl_analysis on the enrichment queue and are merged in.
+# false runs everything before the design is published.
+CAD_ANALYSIS_DEFER_ENRICHMENT = os.environ.get('CAD_ANALYSIS_DEFER_ENRICHMENT', 'true').lower() == 'true'
+CAD_ANALYSIS_ENRICHMENT_QUEUE = os.environ.get('CAD_ANALYSIS_ENRICHMENT_QUEUE', CAD_ANALYSIS_HEAVY_QUEUE)
+# An enrichment still 'pending' this long after it was dispatched (the send failed, or the task was
+# lost or killed) is dispatched again by requeue_stale_analyses, up to CAD_ANALYSIS_ENRICHMENT_MAX_ATTEMPTS
+# dispatches in all; after that it is marked 'failed'. Should exceed queue wait + CAD_ANALYSIS_JOB_TIMEOUT_SECONDS.
+CAD_ANALYSIS_ENRICHMENT_STALE_SECONDS = int(os.environ.get('CAD_ANALYSIS_ENRICHMENT_STALE_SECONDS', 60 * 60))
+CAD_ANALYSIS_ENRICHMENT_MAX_ATTEMPTS = int(os.environ.get('CAD_ANALYSIS_ENRICHMENT_MAX_ATTEMPTS', 3))